@@ -1,22 +1,54 @@
 """
 Main Flask application for appointment booking system
 """
-from flask import Flask, render_template, request, jsonify
-from flask_cors import CORS
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context, url_for
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, date, time, timedelta
 import logging
+import click
 
 from config import Config
-from models import db, Appointment, Availability, Service, RecurrenceRule
+from models import (
+    db, Appointment, AppointmentArchive, Availability, Client, Service, RecurrenceRule,
+    WaitlistEntry, SERVICE_FIELDS, APPOINTMENT_FIELDS, ARCHIVED_APPOINTMENT_FIELDS, AVAILABILITY_FIELDS
+)
 from utils.validators import (
-    validate_phone, validate_appointment_slot, 
-    validate_recurrence, sanitize_string, validate_duration
+    validate_phone, validate_email, validate_appointment_slot, 
+    validate_recurrence, validate_recurrence_rule, sanitize_string, validate_duration,
+    validate_capacity, booking_window
 )
 from utils.email_service import (
-    init_mail, send_appointment_confirmation,
-    send_cancellation_confirmation
+    send_appointment_confirmation, send_cancellation_confirmation
+)
+from utils.recurrence import RecurrencePattern, generate_recurring_dates, calculate_occurrences_count
+from utils.idempotency import (
+    get_idempotency_key, request_fingerprint, find_stored_response,
+    replay_response, store_response, purge_expired_keys, is_key_conflict
+)
+from utils.batch import commit_changes, after_commit, run_batch, in_batch
+from utils.fields import parse_fields, project_query
+from utils.sync import parse_sync_timestamp, sync_appointments, latest_change
+from utils.search import parse_search_query, search_appointments
+from utils.clients import get_or_create_client, count_client_appointments, client_history
+from utils.slots import booked_slot_groups, build_slots, overlapping_groups
+from utils.ics import (
+    client_feed_token, verify_client_feed_token, feed_window, feed_validators, stream_calendar
+)
+from utils.waitlist import freed_slot, queue_freed_slots, expire_offers, expire_waitlist
+from utils.events import record_event, stream_events, purge_events, open_stream, close_stream
+from utils.health import DatabaseProbe, readiness_report
+from utils.rate_limit import init_rate_limiting, rate_limit
+from utils.profiling import init_profiling
+from utils.cache import init_cache, cached, snapshot, bump_generation
+from utils.replicas import init_replicas, read_only
+from utils.sqlite import init_sqlite
+from utils.completion import complete_past_appointments
+from utils.seeding import parse_service_mix, seed_appointments
+from utils.archive import archive_appointments, query_archived_appointments
+from utils.stats import (
+    new_stats_delta, record_booking, record_status_change,
+    apply_stats_delta, rebuild_daily_stats, get_stats_range
 )
-from utils.recurrence import generate_recurring_dates, calculate_occurrences_count
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,10 +60,20 @@ app = Flask(__name__,
             static_folder='frontend/static')
 app.config.from_object(Config)
 
-# Initialize extensions
+# Initialize extensions (Flask-Mail is set up on first use, see utils.email_service)
 db.init_app(app)
-CORS(app)
-init_mail(app)
+init_sqlite(app, db)
+init_replicas(app, db)
+init_rate_limiting(app)
+init_profiling(app)
+init_cache(app)
+
+db_probe = DatabaseProbe(app, lambda: db.engine, app.config['HEALTH_CHECK_INTERVAL'])
+
+if app.config['CORS_ORIGINS']:
+    from flask_cors import CORS
+    origins = app.config['CORS_ORIGINS']
+    CORS(app, origins=origins if origins == '*' else [o.strip() for o in origins.split(',')])
 
 
 # ============================================================================
@@ -54,20 +96,99 @@ def parse_time(time_string):
         return None
 
 
+def active_services(fields=None):
+    """Active services as dicts, from the per-process cache"""
+    return cached('services', ('active', fields and frozenset(fields)), lambda: [
+        s.to_dict(fields)
+        for s in project_query(Service.query.filter_by(active=True), Service, fields)
+    ])
+
+
+def availability_config(fields=None):
+    """Availability of all days as dicts, from the per-process cache"""
+    return cached('availability', ('all', fields and frozenset(fields)), lambda: [
+        a.to_dict(fields) for a in project_query(Availability.query, Availability, fields)
+    ])
+
+
+def slots_for_date(target_date, service=None):
+    """Time slots of a date with their remaining capacity ([] on closed days)"""
+    day_of_week = target_date.weekday()
+    availability = cached('availability', ('day', day_of_week), lambda: snapshot(
+        Availability.query.filter_by(day_of_week=day_of_week, enabled=True).first()
+    ))
+    if not availability:
+        return []
+    
+    # Active bookings of the date, counted per start time and service
+    booked_groups = booked_slot_groups([target_date]).get(target_date, [])
+    return build_slots(target_date, availability, booked_groups, service)
+
+
+def cached_page(page, names, render, day=None):
+    """
+    Rendered page from the per-process cache
+    
+    Entries depend on the generations of names and are re-rendered when
+    any appointment changed (latest_change) or, for pages showing one
+    day, when the day changes, so the data embedded for the first paint
+    is current.
+    """
+    return cached(names, ('page', page), render, version=(day, latest_change()))
+
+
 # ============================================================================
 # ROUTES - CLIENT PANEL
 # ============================================================================
 
 @app.route('/')
+@read_only
 def index():
-    """Client booking page"""
-    return render_template('index.html')
+    """Client booking page, with services and today's slots embedded"""
+    today = date.today()
+    return cached_page('index', ('services', 'availability'), lambda: render_template(
+        'index.html',
+        bootstrap={
+            'services': active_services(),
+            'date': today.isoformat(),
+            'slots': slots_for_date(today)
+        }
+    ), day=today)
 
 
 @app.route('/admin')
+@read_only
 def admin():
-    """Admin panel page"""
-    return render_template('admin.html')
+    """Admin panel page, with active appointments, services and availability embedded"""
+    return cached_page('admin', ('services', 'availability'), lambda: render_template(
+        'admin.html',
+        bootstrap={
+            'appointments': [
+                a.to_dict() for a in Appointment.query.filter_by(status='active')
+                .order_by(Appointment.date, Appointment.time)
+            ],
+            'services': active_services(),
+            'availability': availability_config()
+        }
+    ))
+
+
+# ============================================================================
+# HEALTH CHECKS
+# ============================================================================
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: cached DB ping, connection pool usage and queue depths"""
+    db_probe.ensure_running()
+    report = readiness_report(db_probe, db.engine)
+    return jsonify(report), 200 if report['ready'] else 503
 
 
 # ============================================================================
@@ -75,13 +196,17 @@ def admin():
 # ============================================================================
 
 @app.route('/api/services', methods=['GET'])
+@read_only
 def get_services():
     """Get all active services"""
     try:
-        services = Service.query.filter_by(active=True).all()
+        fields, error = parse_fields(request.args.get('fields'), SERVICE_FIELDS)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
         return jsonify({
             'success': True,
-            'services': [s.to_dict() for s in services]
+            'services': active_services(fields)
         })
     except Exception as e:
         logger.error(f"Error getting services: {str(e)}")
@@ -104,6 +229,7 @@ def create_service():
             description=sanitize_string(data.get('description', ''), 500),
             duration=data.get('duration', 60),
             price=data.get('price', 0.0),
+            capacity=data.get('capacity', 1),
             active=data.get('active', True)
         )
         
@@ -111,8 +237,12 @@ def create_service():
         if not validate_duration(service.duration):
             return jsonify({'success': False, 'error': 'Invalid duration'}), 400
         
+        if not validate_capacity(service.capacity):
+            return jsonify({'success': False, 'error': 'Invalid capacity'}), 400
+        
         db.session.add(service)
-        db.session.commit()
+        bump_generation('services')
+        commit_changes()
         
         return jsonify({
             'success': True,
@@ -142,10 +272,15 @@ def update_service(service_id):
             service.duration = data['duration']
         if 'price' in data:
             service.price = data['price']
+        if 'capacity' in data:
+            if not validate_capacity(data['capacity']):
+                return jsonify({'success': False, 'error': 'Invalid capacity'}), 400
+            service.capacity = data['capacity']
         if 'active' in data:
             service.active = data['active']
         
-        db.session.commit()
+        bump_generation('services')
+        commit_changes()
         
         return jsonify({
             'success': True,
@@ -163,7 +298,8 @@ def delete_service(service_id):
     try:
         service = Service.query.get_or_404(service_id)
         service.active = False
-        db.session.commit()
+        bump_generation('services')
+        commit_changes()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -177,13 +313,17 @@ def delete_service(service_id):
 # ============================================================================
 
 @app.route('/api/availability', methods=['GET'])
+@read_only
 def get_availability():
     """Get availability configuration for all days"""
     try:
-        availability = Availability.query.all()
+        fields, error = parse_fields(request.args.get('fields'), AVAILABILITY_FIELDS)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
         return jsonify({
             'success': True,
-            'availability': [a.to_dict() for a in availability]
+            'availability': availability_config(fields)
         })
     except Exception as e:
         logger.error(f"Error getting availability: {str(e)}")
@@ -216,7 +356,8 @@ def create_availability():
         )
         
         db.session.add(availability)
-        db.session.commit()
+        bump_generation('availability')
+        commit_changes()
         
         return jsonify({
             'success': True,
@@ -254,7 +395,8 @@ def update_availability(availability_id):
         if 'enabled' in data:
             availability.enabled = data['enabled']
         
-        db.session.commit()
+        bump_generation('availability')
+        commit_changes()
         
         return jsonify({
             'success': True,
@@ -272,7 +414,8 @@ def delete_availability(availability_id):
     try:
         availability = Availability.query.get_or_404(availability_id)
         db.session.delete(availability)
-        db.session.commit()
+        bump_generation('availability')
+        commit_changes()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -286,6 +429,8 @@ def delete_availability(availability_id):
 # ============================================================================
 
 @app.route('/api/available-slots/<date_string>', methods=['GET'])
+@rate_limit('RATE_LIMIT_SLOTS')
+@read_only
 def get_available_slots(date_string):
     """Get available time slots for a specific date"""
     try:
@@ -294,53 +439,17 @@ def get_available_slots(date_string):
         if not target_date:
             return jsonify({'success': False, 'error': 'Invalid date format'}), 400
         
-        # Get day of week (0 = Monday, 6 = Sunday)
-        day_of_week = target_date.weekday()
-        
-        # Get availability for this day
-        availability = Availability.query.filter_by(
-            day_of_week=day_of_week,
-            enabled=True
-        ).first()
-        
-        if not availability:
-            return jsonify({
-                'success': True,
-                'slots': []
-            })
-        
-        # Get existing appointments for this date
-        existing_appointments = Appointment.query.filter(
-            Appointment.date == target_date,
-            Appointment.status == 'active'
-        ).all()
-        
-        # Generate time slots
-        slots = []
-        current_time = availability.start_time
-        slot_duration = timedelta(minutes=availability.duration_minutes)
-        
-        while current_time < availability.end_time:
-            # Check if this slot is available
-            is_available = True
-            
-            for appointment in existing_appointments:
-                if appointment.time == current_time:
-                    is_available = False
-                    break
-            
-            slots.append({
-                'time': current_time.strftime('%H:%M'),
-                'available': is_available
-            })
-            
-            # Move to next slot
-            dt = datetime.combine(date.today(), current_time) + slot_duration
-            current_time = dt.time()
+        # Remaining capacity is computed for this service when given
+        service = None
+        service_id = request.args.get('service_id', type=int)
+        if service_id:
+            service = cached('services', ('service', service_id), lambda: snapshot(Service.query.get(service_id)))
+            if not service:
+                return jsonify({'success': False, 'error': 'Service not found'}), 404
         
         return jsonify({
             'success': True,
-            'slots': slots
+            'slots': slots_for_date(target_date, service)
         })
     except Exception as e:
         logger.error(f"Error getting available slots: {str(e)}")
@@ -352,15 +461,51 @@ def get_available_slots(date_string):
 # ============================================================================
 
 @app.route('/api/appointments', methods=['GET'])
+@read_only
 def get_appointments():
     """Get appointments with optional filtering"""
     try:
         # Get query parameters
         date_str = request.args.get('date')
         status = request.args.get('status', 'active')
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        
+        fields, error = parse_fields(
+            request.args.get('fields'),
+            ARCHIVED_APPOINTMENT_FIELDS if include_archived else APPOINTMENT_FIELDS
+        )
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        # Delta sync: only rows changed since the client's cursor, any status
+        # unless one is requested explicitly, plus tombstones for archived rows
+        if 'updated_since' in request.args:
+            updated_since = parse_sync_timestamp(request.args['updated_since'])
+            if not updated_since:
+                return jsonify({'success': False, 'error': 'Invalid updated_since timestamp'}), 400
+            
+            archived_since = None
+            if request.args.get('archived_since'):
+                archived_since = parse_sync_timestamp(request.args['archived_since'])
+                if not archived_since:
+                    return jsonify({'success': False, 'error': 'Invalid archived_since timestamp'}), 400
+            
+            result = sync_appointments(
+                updated_since,
+                after_id=request.args.get('after_id', 0, type=int),
+                target_date=parse_date(date_str) if date_str else None,
+                status=request.args.get('status'),
+                page_size=app.config['SYNC_PAGE_SIZE'],
+                fields=fields,
+                archived_since=archived_since,
+                archived_after_id=request.args.get('archived_after_id', 0, type=int)
+            )
+            result['appointments'] = [a.to_dict(fields) for a in result['appointments']]
+            return jsonify({'success': True, **result})
         
         # Build query
         query = Appointment.query
+        target_date = None
         
         if date_str:
             target_date = parse_date(date_str)
@@ -371,21 +516,75 @@ def get_appointments():
             query = query.filter_by(status=status)
         
         # Order by date and time
+        sort_columns = ('date', 'time') if include_archived else ()
+        query = project_query(query, Appointment, fields, extra_columns=sort_columns)
         appointments = query.order_by(Appointment.date, Appointment.time).all()
         
+        # Archived rows are only read when explicitly requested
+        if include_archived:
+            archived = project_query(
+                query_archived_appointments(target_date, status), AppointmentArchive, fields,
+                extra_columns=sort_columns
+            ).all()
+            appointments = sorted(appointments + archived, key=lambda a: (a.date, a.time))
+        
         return jsonify({
             'success': True,
-            'appointments': [a.to_dict() for a in appointments]
+            'appointments': [a.to_dict(fields) for a in appointments]
         })
     except Exception as e:
         logger.error(f"Error getting appointments: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/appointments/search', methods=['GET'])
+@read_only
+def search_appointments_endpoint():
+    """Find appointments by client name prefix or phone number prefix"""
+    try:
+        column, prefix, error = parse_search_query(request.args.get('q'))
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        fields, error = parse_fields(request.args.get('fields'), APPOINTMENT_FIELDS)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        max_results = app.config['SEARCH_MAX_RESULTS']
+        limit = min(max(request.args.get('limit', 20, type=int), 1), max_results)
+        
+        result = search_appointments(
+            column, prefix,
+            status=request.args.get('status') or None,
+            limit=limit,
+            fields=fields
+        )
+        return jsonify({
+            'success': True,
+            'appointments': [a.to_dict(fields) for a in result['appointments']],
+            'truncated': result['truncated']
+        })
+    except Exception as e:
+        logger.error(f"Error searching appointments: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+CREATE_APPOINTMENT_ROUTE = 'POST /api/appointments'
+
+
 @app.route('/api/appointments', methods=['POST'])
+@rate_limit('RATE_LIMIT_BOOKINGS')
 def create_appointment():
     """Create a new appointment"""
     try:
+        # Retries carrying a known Idempotency-Key get the original response back
+        idempotency_key = get_idempotency_key()
+        fingerprint = request_fingerprint() if idempotency_key else None
+        if idempotency_key:
+            stored = find_stored_response(CREATE_APPOINTMENT_ROUTE, idempotency_key)
+            if stored:
+                return replay_response(stored, fingerprint)
+        
         data = request.json
         
         # Validate required fields
@@ -425,28 +624,69 @@ def create_appointment():
             if not is_valid:
                 return jsonify({'success': False, 'error': error_msg}), 400
         
-        # Check for conflicts
-        existing_appointments = Appointment.query.filter(
-            Appointment.date == appointment_date,
-            Appointment.status == 'active'
-        ).all()
+        # RRULE-style rule (frequency, interval, count, until, by_day), stored
+        # as a RecurrenceRule of the first appointment
+        recurrence_rule = None
+        rule_data = data.get('recurrence_rule')
+        if rule_data is not None:
+            if recurrence_type != 'none':
+                return jsonify({'success': False, 'error': 'Use either recurrence or recurrence_rule'}), 400
+            if not isinstance(rule_data, dict):
+                return jsonify({'success': False, 'error': 'recurrence_rule must be an object'}), 400
+            
+            until = None
+            if rule_data.get('until'):
+                until = parse_date(rule_data['until'])
+                if not until:
+                    return jsonify({'success': False, 'error': 'Invalid recurrence until date'}), 400
+            
+            recurrence_rule = RecurrenceRule(
+                frequency=rule_data.get('frequency'),
+                interval=rule_data.get('interval', 1),
+                count=rule_data.get('count'),
+                until=until,
+                by_day=rule_data.get('by_day') or None
+            )
+            is_valid, error_msg = validate_recurrence_rule(
+                recurrence_rule.frequency, recurrence_rule.interval, recurrence_rule.count,
+                recurrence_rule.until, recurrence_rule.by_day, appointment_date
+            )
+            if not is_valid:
+                return jsonify({'success': False, 'error': error_msg}), 400
+            
+            rule_pattern = RecurrencePattern.from_rule(recurrence_rule, appointment_date)
+            recurrence_type = 'rule'
+            recurrence_end_date = rule_pattern.nth(rule_pattern.total() - 1)
+        
+        # Check for conflicts and remaining capacity
+        start_datetime, end_datetime = booking_window(appointment_date, appointment_time, service.duration)
+        booked_groups = overlapping_groups([(start_datetime, end_datetime)])
         
         is_valid, error_msg = validate_appointment_slot(
-            appointment_date, appointment_time, service.duration, existing_appointments
+            appointment_date, appointment_time, service.duration, booked_groups,
+            service.id, service.capacity or 1
         )
         
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
         
         # Create main appointment
+        client_name = sanitize_string(data['client'], 100)
+        phone = sanitize_string(data['phone'], 20)
+        client = get_or_create_client(client_name, phone)
+        
         appointment = Appointment(
             date=appointment_date,
             time=appointment_time,
-            client=sanitize_string(data['client'], 100),
-            phone=sanitize_string(data['phone'], 20),
+            client=client_name,
+            phone=phone,
+            client_id=client.id,
             service_id=data['service_id'],
             recurrence=recurrence_type,
             recurrence_end=recurrence_end_date,
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            price=service.price,
             notes=sanitize_string(data.get('notes', ''), 500),
             status='active'
         )
@@ -454,48 +694,95 @@ def create_appointment():
         db.session.add(appointment)
         db.session.flush()  # Get the ID before creating recurring appointments
         
+        stats_delta = new_stats_delta()
+        record_booking(stats_delta, appointment.date, service.id, appointment.price)
+        
         # Create recurring appointments if needed
+        recurring_appointments = []
         if recurrence_type != 'none' and recurrence_end_date:
-            recurring_dates = generate_recurring_dates(
-                appointment_date, recurrence_type, recurrence_end_date
-            )
+            if recurrence_rule:
+                recurrence_rule.appointment_id = appointment.id
+                db.session.add(recurrence_rule)
+                recurring_dates = list(rule_pattern.between(
+                    appointment_date + timedelta(days=1), recurrence_end_date
+                ))
+            else:
+                recurring_dates = generate_recurring_dates(
+                    appointment_date, recurrence_type, recurrence_end_date
+                )
+            recurring_windows = {
+                recurring_date: booking_window(recurring_date, appointment_time, service.duration)
+                for recurring_date in recurring_dates
+            }
+            recurring_groups = overlapping_groups(recurring_windows.values())
             
             for recurring_date in recurring_dates:
-                # Check for conflicts on each date
-                existing = Appointment.query.filter(
-                    Appointment.date == recurring_date,
-                    Appointment.time == appointment_time,
-                    Appointment.status == 'active'
-                ).first()
+                # Skip dates where the slot is taken or full
+                is_free, _ = validate_appointment_slot(
+                    recurring_date, appointment_time, service.duration,
+                    recurring_groups, service.id, service.capacity or 1
+                )
                 
-                if not existing:
+                if is_free:
+                    recurring_start, recurring_end = recurring_windows[recurring_date]
                     recurring_appointment = Appointment(
                         date=recurring_date,
                         time=appointment_time,
+                        start_datetime=recurring_start,
+                        end_datetime=recurring_end,
                         client=appointment.client,
                         phone=appointment.phone,
+                        client_id=appointment.client_id,
                         service_id=appointment.service_id,
                         recurrence='none',  # Child appointments don't recur
                         parent_appointment_id=appointment.id,
+                        price=appointment.price,
                         notes=appointment.notes,
                         status='active'
                     )
                     db.session.add(recurring_appointment)
+                    recurring_appointments.append(recurring_appointment)
+                    record_booking(stats_delta, recurring_date, service.id, appointment.price)
         
-        db.session.commit()
+        apply_stats_delta(stats_delta)
+        
+        db.session.flush()
+        for created in [appointment] + recurring_appointments:
+            record_event('created', created)
+        
+        response_body = {
+            'success': True,
+            'appointment': appointment.to_dict()
+        }
+        if recurrence_rule:
+            response_body['recurrence_rule'] = recurrence_rule.to_dict()
+        if idempotency_key:
+            store_response(CREATE_APPOINTMENT_ROUTE, idempotency_key, fingerprint, 201, response_body)
+        
+        try:
+            commit_changes()
+        except IntegrityError as e:
+            # A concurrent retry with the same key committed first; any
+            # other constraint violation is a real error. Inside a batch the
+            # rollback would also undo the earlier operations, so the whole
+            # batch fails instead and its retry replays the stored responses.
+            if in_batch() or not (idempotency_key and is_key_conflict(e)):
+                raise
+            db.session.rollback()
+            stored = find_stored_response(CREATE_APPOINTMENT_ROUTE, idempotency_key)
+            if not stored:
+                raise
+            return replay_response(stored, fingerprint)
         
         # Send confirmation email
-        send_appointment_confirmation({
+        after_commit(send_appointment_confirmation, {
             'client': appointment.client,
             'date': appointment.date.strftime('%Y-%m-%d'),
             'time': appointment.time.strftime('%H:%M'),
             'service_name': service.name
         })
         
-        return jsonify({
-            'success': True,
-            'appointment': appointment.to_dict()
-        }), 201
+        return jsonify(response_body), 201
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error creating appointment: {str(e)}")
@@ -507,6 +794,7 @@ def update_appointment(appointment_id):
     """Update an appointment"""
     try:
         appointment = Appointment.query.get_or_404(appointment_id)
+        previous_status = appointment.status
         data = request.json
         
         # Update allowed fields
@@ -516,12 +804,26 @@ def update_appointment(appointment_id):
             if not validate_phone(data['phone']):
                 return jsonify({'success': False, 'error': 'Invalid phone number'}), 400
             appointment.phone = sanitize_string(data['phone'], 20)
+        if 'client' in data or 'phone' in data:
+            appointment.client_id = get_or_create_client(appointment.client, appointment.phone).id
         if 'notes' in data:
             appointment.notes = sanitize_string(data['notes'], 500)
         if 'status' in data:
+            stats_delta = new_stats_delta()
+            record_status_change(
+                stats_delta, appointment.date, appointment.service_id,
+                appointment.price, appointment.status, data['status']
+            )
             appointment.status = data['status']
+            apply_stats_delta(stats_delta)
+        
+        db.session.flush()
+        cancelled_now = appointment.status == 'cancelled' and previous_status != 'cancelled'
+        record_event('cancelled' if cancelled_now else 'updated', appointment)
+        commit_changes()
         
-        db.session.commit()
+        if cancelled_now and previous_status == 'active':
+            after_commit(queue_freed_slots, [freed_slot(appointment)])
         
         return jsonify({
             'success': True,
@@ -538,23 +840,46 @@ def cancel_appointment(appointment_id):
     """Cancel an appointment"""
     try:
         appointment = Appointment.query.get_or_404(appointment_id)
+        freed = [freed_slot(appointment)] if appointment.status == 'active' else []
+        
+        stats_delta = new_stats_delta()
+        record_status_change(
+            stats_delta, appointment.date, appointment.service_id,
+            appointment.price, appointment.status, 'cancelled'
+        )
         appointment.status = 'cancelled'
         
         # If this is a parent appointment, optionally cancel all children
         cancel_all = request.args.get('cancel_all', 'false').lower() == 'true'
+        cancelled = [appointment]
         if cancel_all and appointment.children:
             for child in appointment.children:
+                if child.status == 'active':
+                    freed.append(freed_slot(child))
+                record_status_change(
+                    stats_delta, child.date, child.service_id,
+                    child.price, child.status, 'cancelled'
+                )
                 child.status = 'cancelled'
+                cancelled.append(child)
         
-        db.session.commit()
+        apply_stats_delta(stats_delta)
+        db.session.flush()
+        for changed in cancelled:
+            record_event('cancelled', changed)
+        commit_changes()
         
         # Send cancellation email
-        send_cancellation_confirmation({
+        after_commit(send_cancellation_confirmation, {
             'client': appointment.client,
             'date': appointment.date.strftime('%Y-%m-%d'),
             'time': appointment.time.strftime('%H:%M')
         })
         
+        # Offer the freed places to the waitlist
+        if freed:
+            after_commit(queue_freed_slots, freed)
+        
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -562,6 +887,348 @@ def cancel_appointment(appointment_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/appointments/events', methods=['GET'])
+def appointment_events():
+    """Server-sent event stream of appointment changes for the admin panel"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid Last-Event-ID'}), 400
+    
+    # Each open stream holds a worker thread; refuse beyond the cap
+    if not open_stream(app.config['EVENT_STREAM_MAX_OPEN']):
+        response = jsonify({'success': False, 'error': 'Too many open event streams'})
+        response.headers['Retry-After'] = str(int(app.config['EVENT_STREAM_MAX_SECONDS']))
+        return response, 503
+    
+    response = Response(
+        stream_with_context(stream_events(
+            last_event_id,
+            max_seconds=app.config['EVENT_STREAM_MAX_SECONDS'],
+            poll_interval=app.config['EVENT_STREAM_POLL_SECONDS'],
+            gap_timeout=app.config['EVENT_GAP_TIMEOUT_SECONDS']
+        )),
+        mimetype='text/event-stream'
+    )
+    response.call_on_close(close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # disable nginx buffering
+    return response
+
+
+# ============================================================================
+# API ENDPOINTS - WAITLIST
+# ============================================================================
+
+@app.route('/api/waitlist', methods=['GET'])
+@read_only
+def get_waitlist():
+    """Get waitlist entries for a date"""
+    try:
+        target_date = parse_date(request.args.get('date'))
+        if not target_date:
+            return jsonify({'success': False, 'error': 'date is required (YYYY-MM-DD)'}), 400
+        
+        query = WaitlistEntry.query.filter_by(date=target_date)
+        
+        service_id = request.args.get('service_id', type=int)
+        if service_id:
+            query = query.filter_by(service_id=service_id)
+        
+        status = request.args.get('status', 'waiting')
+        if status:
+            query = query.filter_by(status=status)
+        
+        entries = query.order_by(WaitlistEntry.id).all()
+        
+        return jsonify({
+            'success': True,
+            'entries': [e.to_dict() for e in entries]
+        })
+    except Exception as e:
+        logger.error(f"Error getting waitlist: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/waitlist', methods=['POST'])
+def create_waitlist_entry():
+    """Join the waitlist for a service on a date, within a time window"""
+    try:
+        data = request.json
+        
+        # Validate required fields
+        required_fields = ['date', 'client', 'phone', 'service_id']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({'success': False, 'error': f'{field} is required'}), 400
+        
+        target_date = parse_date(data['date'])
+        window_start = parse_time(data.get('window_start', '00:00'))
+        window_end = parse_time(data.get('window_end', '23:59'))
+        
+        if not target_date or not window_start or not window_end:
+            return jsonify({'success': False, 'error': 'Invalid date or time format'}), 400
+        
+        if target_date < date.today():
+            return jsonify({'success': False, 'error': 'Cannot join the waitlist for a past date'}), 400
+        
+        if not validate_phone(data['phone']):
+            return jsonify({'success': False, 'error': 'Invalid phone number'}), 400
+        
+        if data.get('email') and not validate_email(data['email']):
+            return jsonify({'success': False, 'error': 'Invalid email'}), 400
+        
+        service = Service.query.get(data['service_id'])
+        if not service or not service.active:
+            return jsonify({'success': False, 'error': 'Service not found'}), 404
+        
+        window_minutes = (
+            datetime.combine(target_date, window_end) - datetime.combine(target_date, window_start)
+        ).total_seconds() / 60
+        if window_minutes < (service.duration or 60):
+            return jsonify({'success': False, 'error': 'Time window is shorter than the service duration'}), 400
+        
+        client_name = sanitize_string(data['client'], 100)
+        phone = sanitize_string(data['phone'], 20)
+        
+        entry = WaitlistEntry(
+            date=target_date,
+            service_id=service.id,
+            window_start=window_start,
+            window_end=window_end,
+            client=client_name,
+            phone=phone,
+            client_id=get_or_create_client(client_name, phone).id,
+            email=sanitize_string(data.get('email', ''), 120) or None,
+            auto_book=bool(data.get('auto_book', False)),
+            status='waiting'
+        )
+        
+        db.session.add(entry)
+        commit_changes()
+        
+        return jsonify({
+            'success': True,
+            'entry': entry.to_dict()
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error creating waitlist entry: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/waitlist/<int:entry_id>', methods=['DELETE'])
+def cancel_waitlist_entry(entry_id):
+    """Leave the waitlist"""
+    try:
+        entry = WaitlistEntry.query.get(entry_id)
+        if not entry:
+            return jsonify({'success': False, 'error': 'Waitlist entry not found'}), 404
+        
+        if entry.status in ('waiting', 'offered'):
+            entry.status = 'cancelled'
+        commit_changes()
+        
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error cancelling waitlist entry: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============================================================================
+# API ENDPOINTS - CLIENTS
+# ============================================================================
+
+@app.route('/api/clients/<int:client_id>', methods=['GET'])
+@read_only
+def get_client(client_id):
+    """Get a client with appointment counts by status"""
+    try:
+        client = Client.query.get(client_id)
+        if not client:
+            return jsonify({'success': False, 'error': 'Client not found'}), 404
+        counts = count_client_appointments(client.id)
+        
+        return jsonify({
+            'success': True,
+            'client': client.to_dict(),
+            'appointment_counts': counts,
+            'total_appointments': sum(counts.values()),
+            'calendar_url': url_for(
+                'client_calendar_feed', client_id=client.id,
+                token=client_feed_token(client.id, app.config['SECRET_KEY']), _external=True
+            )
+        })
+    except Exception as e:
+        logger.error(f"Error getting client: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/clients/<int:client_id>/appointments', methods=['GET'])
+@read_only
+def get_client_appointments(client_id):
+    """Get a client's appointments, newest first"""
+    try:
+        client = Client.query.get(client_id)
+        if not client:
+            return jsonify({'success': False, 'error': 'Client not found'}), 404
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        
+        fields, error = parse_fields(
+            request.args.get('fields'),
+            ARCHIVED_APPOINTMENT_FIELDS if include_archived else APPOINTMENT_FIELDS
+        )
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        max_results = app.config['CLIENT_HISTORY_MAX_RESULTS']
+        limit = min(max(request.args.get('limit', max_results, type=int), 1), max_results)
+        
+        appointments = client_history(
+            client.id,
+            status=request.args.get('status') or None,
+            include_archived=include_archived,
+            limit=limit,
+            fields=fields
+        )
+        return jsonify({
+            'success': True,
+            'client': client.to_dict(),
+            'appointments': [a.to_dict(fields) for a in appointments]
+        })
+    except Exception as e:
+        logger.error(f"Error getting client appointments: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============================================================================
+# API ENDPOINTS - CALENDAR FEEDS
+# ============================================================================
+
+def calendar_feed(name, client_id=None, service_id=None):
+    """
+    Answer a feed poll: 304 if unchanged since the client's copy, else the streamed feed
+    """
+    window = feed_window(app.config['ICS_PAST_DAYS'], app.config['ICS_FUTURE_DAYS'])
+    etag, last_modified = feed_validators(window, client_id=client_id, service_id=service_id)
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = bool(request.if_modified_since) and \
+            last_modified <= request.if_modified_since.replace(tzinfo=None)
+    
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = Response(
+            stream_with_context(stream_calendar(name, window, request.host, client_id, service_id)),
+            mimetype='text/calendar'
+        )
+        response.headers['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/calendar.ics', methods=['GET'])
+@read_only
+def calendar_feed_all():
+    """iCalendar feed of all appointments, optionally of one service (?service_id=)"""
+    try:
+        service_id = request.args.get('service_id', type=int)
+        name = 'Citas'
+        if service_id is not None:
+            service = Service.query.get(service_id)
+            if not service:
+                return jsonify({'success': False, 'error': 'Service not found'}), 404
+            name = f'Citas - {service.name}'
+        return calendar_feed(name, service_id=service_id)
+    except Exception as e:
+        logger.error(f"Error building calendar feed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/clients/<int:client_id>/calendar.ics', methods=['GET'])
+@read_only
+def client_calendar_feed(client_id):
+    """iCalendar feed of a client's appointments (URL from GET /api/clients/<id>)"""
+    try:
+        if not verify_client_feed_token(client_id, request.args.get('token'), app.config['SECRET_KEY']):
+            return jsonify({'success': False, 'error': 'Invalid calendar token'}), 403
+        if not Client.query.get(client_id):
+            return jsonify({'success': False, 'error': 'Client not found'}), 404
+        return calendar_feed('Mis citas', client_id=client_id)
+    except Exception as e:
+        logger.error(f"Error building client calendar feed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============================================================================
+# API ENDPOINTS - BATCH
+# ============================================================================
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Execute several write operations in a single transaction"""
+    try:
+        data = request.json or {}
+        operations = data.get('operations')
+        
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'success': False, 'error': 'operations must be a non-empty list'}), 400
+        
+        if len(operations) > app.config['BATCH_MAX_OPERATIONS']:
+            return jsonify({
+                'success': False,
+                'error': f"A batch can contain at most {app.config['BATCH_MAX_OPERATIONS']} operations"
+            }), 400
+        
+        committed, results = run_batch(operations)
+        
+        return jsonify({
+            'success': committed,
+            'results': results
+        }), 200 if committed else results[-1]['status']
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error executing batch: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============================================================================
+# API ENDPOINTS - STATISTICS
+# ============================================================================
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Get daily appointment statistics for a date range"""
+    try:
+        end_date = parse_date(request.args.get('end')) or date.today()
+        start_date = parse_date(request.args.get('start')) or end_date - timedelta(days=30)
+        
+        if start_date > end_date:
+            return jsonify({'success': False, 'error': 'Start date must be before end date'}), 400
+        
+        service_id = request.args.get('service_id', type=int)
+        stats, totals = get_stats_range(start_date, end_date, service_id)
+        
+        return jsonify({
+            'success': True,
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'stats': [s.to_dict() for s in stats],
+            'totals': totals
+        })
+    except Exception as e:
+        logger.error(f"Error getting stats: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============================================================================
 # ERROR HANDLERS
 # ============================================================================
@@ -590,39 +1257,105 @@ def internal_error(error):
 
 @app.cli.command('init-db')
 def init_db():
-    """Initialize the database"""
+    """Initialize the database (tables, migrations, defaults and schema version)"""
+    # Same path as init_db.py and boot.py, so migrations always run before
+    # the schema version is recorded
+    from init_db import init_database
+    init_database()
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    """Recompute the daily stats table from the appointments table"""
     with app.app_context():
-        db.create_all()
-        logger.info("Database tables created successfully")
-        
-        # Create default services if none exist
-        if Service.query.count() == 0:
-            default_services = [
-                Service(name='Consulta General', description='Consulta médica general', duration=30, price=50.0),
-                Service(name='Consulta Especializada', description='Consulta con especialista', duration=45, price=80.0),
-                Service(name='Revisión', description='Revisión médica completa', duration=60, price=100.0)
-            ]
-            for service in default_services:
-                db.session.add(service)
-            
-            db.session.commit()
-            logger.info("Default services created")
-        
-        # Create default availability if none exists
-        if Availability.query.count() == 0:
-            # Monday to Friday, 9 AM to 6 PM
-            for day in range(5):
-                availability = Availability(
-                    day_of_week=day,
-                    start_time=time(9, 0),
-                    end_time=time(18, 0),
-                    duration_minutes=60,
-                    enabled=True
-                )
-                db.session.add(availability)
-            
-            db.session.commit()
-            logger.info("Default availability created")
+        rows = rebuild_daily_stats()
+        logger.info(f"Daily stats rebuilt ({rows} rows)")
+
+
+@app.cli.command('archive-appointments')
+@click.option('--before', 'before_str', help='Archive appointments before this date (YYYY-MM-DD)')
+@click.option('--batch-size', default=None, type=int, help='Rows moved per transaction')
+def archive_appointments_command(before_str, batch_size):
+    """Move past cancelled/completed appointments to the archive table"""
+    before_date = parse_date(before_str) if before_str else (
+        date.today() - timedelta(days=app.config['ARCHIVE_AFTER_DAYS'])
+    )
+    if not before_date:
+        raise click.BadParameter('Invalid date format', param_hint='--before')
+    
+    with app.app_context():
+        archived = archive_appointments(
+            before_date, batch_size or app.config['ARCHIVE_BATCH_SIZE']
+        )
+        logger.info(f"Archived {archived} appointments before {before_date.isoformat()}")
+
+
+@app.cli.command('complete-appointments')
+@click.option('--batch-size', default=None, type=int, help='Rows updated per transaction')
+def complete_appointments_command(batch_size):
+    """Mark elapsed active appointments as completed (run periodically, e.g. from cron)"""
+    with app.app_context():
+        completed, elapsed = complete_past_appointments(
+            batch_size=batch_size or app.config['COMPLETION_BATCH_SIZE']
+        )
+        rate = completed / elapsed if elapsed else 0
+        logger.info(f"Completed {completed} appointments in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+
+@app.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Delete expired Idempotency-Key responses"""
+    with app.app_context():
+        purged = purge_expired_keys()
+        logger.info(f"Purged {purged} expired idempotency keys")
+
+
+@app.cli.command('purge-events')
+def purge_events_command():
+    """Delete change-feed events older than EVENT_RETENTION_HOURS"""
+    with app.app_context():
+        purged = purge_events(app.config['EVENT_RETENTION_HOURS'])
+        logger.info(f"Purged {purged} appointment events")
+
+
+@app.cli.command('expire-waitlist')
+def expire_waitlist_command():
+    """Expire unanswered offers (re-offering their slots) and entries for past dates"""
+    with app.app_context():
+        offers, refilled = expire_offers()
+        logger.info(f"Expired {offers} waitlist offers, {refilled} slots offered again")
+        expired = expire_waitlist()
+        logger.info(f"Expired {expired} waitlist entries")
+
+
+@app.cli.command('seed-appointments')
+@click.option('--count', default=100000, type=int, help='Appointments to insert')
+@click.option('--days', default=730, type=int, help='Date range centered on today')
+@click.option('--services', 'service_mix', default=None,
+              help='Service weights, e.g. "1=5,2=3,3=1" (default: all active services equally)')
+@click.option('--recurring', default=0.1, type=float, help='Fraction of bookings starting a recurring series')
+@click.option('--cancelled', default=0.08, type=float, help='Fraction of cancelled appointments')
+@click.option('--clients', default=None, type=int, help='Distinct clients (default: count / 5)')
+@click.option('--seed', default=1, type=int, help='Random seed')
+@click.option('--chunk-size', default=10000, type=int, help='Rows per INSERT and transaction')
+@click.option('--rebuild-indexes', is_flag=True,
+              help='Drop the appointment indexes during the load and rebuild them afterwards')
+def seed_appointments_command(count, days, service_mix, recurring, cancelled, clients, seed, chunk_size,
+                              rebuild_indexes):
+    """Insert synthetic appointments for capacity testing (never on production data)"""
+    with app.app_context():
+        result = seed_appointments(
+            count, days=days,
+            service_mix=parse_service_mix(service_mix) if service_mix else None,
+            recurring=recurring, cancelled=cancelled, clients=clients,
+            seed=seed, chunk_size=chunk_size, rebuild_indexes=rebuild_indexes
+        )
+        rate = result['appointments'] / result['insert_seconds'] if result['insert_seconds'] else 0
+        logger.info(
+            f"Seeded {result['appointments']} appointments ({result['series']} series, "
+            f"{result['cancelled']} cancelled, {result['clients']} clients) in "
+            f"{result['insert_seconds']:.1f}s ({rate:.0f} rows/s), {result['total_seconds']:.1f}s with stats"
+        )
 
 
 # ============================================================================
@@ -0,0 +1,356 @@
+"""
+End-to-end concurrent load generator for the API
+
+Seeds a synthetic dataset into a local database, serves app.py on a
+loopback port (threaded WSGI server) and drives a weighted mix of
+workloads from concurrent client threads over real HTTP:
+
+  slots   GET /api/available-slots/<date>        (client panel browsing)
+  book    POST /api/appointments                  (random slot, client and service)
+  cancel  DELETE /api/appointments/<id>           (a previously booked appointment)
+  list    GET /api/appointments?date=...          (admin listing)
+  search  GET /api/appointments/search?q=...      (admin client lookup)
+
+Reports throughput and p50/p95/p99 latency per workload, plus error
+(5xx/connection) and conflict (booking rejected because the slot is taken)
+rates. Runs are reproducible for a given --seed; pass --json to save the
+results for comparison between revisions. Nothing leaves the machine.
+
+Usage:
+    cd backend && python benchmarks/loadtest.py --concurrency 16 --duration 30
+    cd backend && python benchmarks/loadtest.py --url http://127.0.0.1:5000 --no-seed
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import date, datetime, time as dtime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_MIX = 'slots=50,book=15,cancel=5,list=20,search=10'
+FIRST_NAMES = ['Ana', 'Luis', 'María', 'José', 'Carmen', 'Jorge', 'Lucía', 'Pedro', 'Sofía', 'Diego']
+LAST_NAMES = ['García', 'Pérez', 'López', 'Martínez', 'Sánchez', 'Gómez', 'Díaz', 'Torres', 'Ruiz', 'Vargas']
+OPEN_HOUR, CLOSE_HOUR, SLOT_MINUTES = 8, 20, 30
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in WORKLOADS:
+            raise SystemExit(f"Unknown workload: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def slot_times():
+    current = datetime.combine(date.today(), dtime(OPEN_HOUR))
+    while current.hour < CLOSE_HOUR:
+        yield current.time()
+        current += timedelta(minutes=SLOT_MINUTES)
+
+
+def random_client(rng):
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    phone = f"+34 6{rng.randrange(10 ** 8):08d}"
+    return name, phone
+
+
+# ============================================================================
+# DATASET
+# ============================================================================
+
+def has_appointments(database_url: str) -> bool:
+    """Whether the database already holds appointments (live or archived)"""
+    from sqlalchemy import create_engine, inspect, text
+
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as connection:
+            tables = set(inspect(connection).get_table_names())
+            return any(
+                connection.execute(text(f'SELECT 1 FROM {table} LIMIT 1')).first() is not None
+                for table in ('appointments', 'appointments_archive') if table in tables
+            )
+    finally:
+        engine.dispose()
+
+
+def seed_database(appointments: int, days: int, seed: int, fill: float):
+    """
+    Create the schema, the bookable grid and a synthetic dataset
+
+    Appointments come from utils.seeding.seed_appointments, the generator
+    behind `flask seed-appointments`, capped at `fill` of the (date, start
+    time) grid so bookings during the run succeed or conflict in realistic
+    proportions. The availability is replaced by the grid that the book
+    workload uses, which is why main() only seeds a database without
+    appointments unless --force is given.
+    """
+    import init_db
+    from app import app
+    from models import db, Availability
+    from utils.seeding import seed_appointments
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db.init_database()
+
+    with app.app_context():
+        Availability.query.delete()
+        for day in range(7):
+            db.session.add(Availability(
+                day_of_week=day, start_time=dtime(OPEN_HOUR), end_time=dtime(CLOSE_HOUR),
+                duration_minutes=SLOT_MINUTES, enabled=True
+            ))
+        db.session.commit()
+
+        count = min(appointments, int(days * len(list(slot_times())) * fill))
+        return seed_appointments(count, days=days, seed=seed, rebuild_indexes=True)['appointments']
+
+
+# ============================================================================
+# WORKLOADS
+# ============================================================================
+
+class Session:
+    """Per-thread client state: random source, base URL and shared booked ids"""
+
+    def __init__(self, base_url, rng, horizon, service_ids, booked, booked_lock):
+        self.base_url = base_url
+        self.rng = rng
+        self.horizon = horizon
+        self.service_ids = service_ids
+        self.booked = booked
+        self.booked_lock = booked_lock
+
+    def future_date(self):
+        return (date.today() + timedelta(days=self.rng.randint(1, self.horizon))).isoformat()
+
+    def request(self, method, path, body=None):
+        """Return (status, parsed JSON body or None)"""
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b'null')
+            except ValueError:
+                return e.code, None
+
+
+def run_slots(session):
+    return session.request('GET', f'/api/available-slots/{session.future_date()}')
+
+
+def run_book(session):
+    name, phone = random_client(session.rng)
+    status, body = session.request('POST', '/api/appointments', {
+        'date': session.future_date(),
+        'time': session.rng.choice(list(slot_times())).strftime('%H:%M'),
+        'client': name,
+        'phone': phone,
+        'service_id': session.rng.choice(session.service_ids)
+    })
+    if status == 201:
+        with session.booked_lock:
+            session.booked.append(body['appointment']['id'])
+    return status, body
+
+
+def run_cancel(session):
+    with session.booked_lock:
+        if not session.booked:
+            appointment_id = None
+        else:
+            appointment_id = session.booked.pop(session.rng.randrange(len(session.booked)))
+    if appointment_id is None:
+        return run_book(session)
+    return session.request('DELETE', f'/api/appointments/{appointment_id}')
+
+
+def run_list(session):
+    return session.request('GET', f'/api/appointments?date={session.future_date()}&status=active')
+
+
+def run_search(session):
+    prefix = session.rng.choice(FIRST_NAMES)[:3]
+    return session.request('GET', f'/api/appointments/search?q={urllib.request.quote(prefix)}&limit=20')
+
+
+WORKLOADS = {
+    'slots': run_slots,
+    'book': run_book,
+    'cancel': run_cancel,
+    'list': run_list,
+    'search': run_search,
+}
+
+
+def is_conflict(status, body) -> bool:
+    """Booking rejected because the slot is taken or full (expected under contention)"""
+    error = (body or {}).get('error', '') if isinstance(body, dict) else ''
+    return status in (400, 409) and ('conflicts' in error or 'fully booked' in error)
+
+
+# ============================================================================
+# DRIVER
+# ============================================================================
+
+def worker(index, args, weights, service_ids, deadline, results, booked, booked_lock):
+    rng = random.Random(args.seed * 1000 + index)
+    session = Session(args.url, rng, args.horizon, service_ids, booked, booked_lock)
+    names, weight_values = list(weights), list(weights.values())
+
+    sent = 0
+    while time.monotonic() < deadline and (not args.requests_per_worker or sent < args.requests_per_worker):
+        name = rng.choices(names, weights=weight_values)[0]
+        started = time.perf_counter()
+        try:
+            status, body = WORKLOADS[name](session)
+        except Exception:
+            status, body = None, None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        results.append((name, status, elapsed_ms, is_conflict(status, body)))
+        sent += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(results, wall_seconds) -> dict:
+    by_workload = defaultdict(list)
+    for row in results:
+        by_workload[row[0]].append(row)
+
+    summary = {'wall_seconds': round(wall_seconds, 2), 'requests': len(results),
+               'throughput_rps': round(len(results) / wall_seconds, 1), 'workloads': {}}
+    for name, rows in sorted(by_workload.items()):
+        latencies = [r[2] for r in rows]
+        errors = sum(1 for r in rows if r[1] is None or r[1] >= 500)
+        summary['workloads'][name] = {
+            'requests': len(rows),
+            'rps': round(len(rows) / wall_seconds, 1),
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'error_rate': round(errors / len(rows), 4),
+            'conflict_rate': round(sum(1 for r in rows if r[3]) / len(rows), 4),
+            'rate_limited': sum(1 for r in rows if r[1] == 429),
+        }
+    return summary
+
+
+def print_summary(summary, args):
+    print(f"concurrency {args.concurrency}, {summary['requests']} requests in "
+          f"{summary['wall_seconds']}s: {summary['throughput_rps']} req/s")
+    print(f"  {'workload':<8} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>8} {'conflicts':>10} {'429':>6}")
+    for name, row in summary['workloads'].items():
+        print(f"  {name:<8} {row['requests']:>9} {row['rps']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['error_rate']:>8.2%} {row['conflict_rate']:>10.2%} "
+              f"{row['rate_limited']:>6}")
+
+
+def serve_app():
+    """Serve app.py on a free loopback port from a background thread"""
+    from werkzeug.serving import make_server
+
+    from app import app
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end concurrent load generator')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    parser.add_argument('--requests-per-worker', type=int, default=0, help='stop each thread after N requests')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'workload weights (default {DEFAULT_MIX})')
+    parser.add_argument('--appointments', type=int, default=5000, help='seeded appointments')
+    parser.add_argument('--days', type=int, default=730, help='seeded date range, centered on today')
+    parser.add_argument('--fill', type=float, default=0.3, help='maximum fraction of slots seeded')
+    parser.add_argument('--horizon', type=int, default=30, help='days ahead that clients browse and book')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='database to seed and serve (default: temporary SQLite file)')
+    parser.add_argument('--url', help='drive an already running server instead of serving app.py here')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the existing data')
+    parser.add_argument('--force', action='store_true',
+                        help='seed --database-url even if it already has appointments')
+    parser.add_argument('--rate-limit', action='store_true', help='keep the API rate limits enabled')
+    parser.add_argument('--json', help='write the summary to this file')
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{tmp.name}/loadtest.db'
+    os.environ['DEBUG'] = 'False'
+    if not args.rate_limit:
+        os.environ['RATE_LIMIT_ENABLED'] = 'False'
+
+    if not args.no_seed:
+        if args.database_url and not args.force and has_appointments(args.database_url):
+            raise SystemExit(
+                "The database already has appointments: seeding adds synthetic rows and replaces "
+                "the availability. Use a scratch database, --no-seed, or --force."
+            )
+        started = time.perf_counter()
+        seeded = seed_database(args.appointments, args.days, args.seed, args.fill)
+        print(f"seeded {seeded} appointments in {time.perf_counter() - started:.1f}s")
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    server = None
+    if not args.url:
+        server, args.url = serve_app()
+
+    with urllib.request.urlopen(f'{args.url}/api/services') as response:
+        service_ids = [s['id'] for s in json.loads(response.read())['services'] if s['active']]
+
+    results, booked, booked_lock = [], [], threading.Lock()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(i, args, weights, service_ids, deadline, results, booked, booked_lock))
+        for i in range(args.concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+
+    if server:
+        server.shutdown()
+
+    summary = summarize(results, wall_seconds)
+    summary['config'] = {k: v for k, v in vars(args).items() if k != 'json'}
+    print_summary(summary, args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
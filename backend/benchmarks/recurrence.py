@@ -0,0 +1,73 @@
+"""
+Recurrence engine benchmark for multi-decade rules
+
+Compares the previous approach (build the whole date list, then len())
+with RecurrencePattern's arithmetic count, nth occurrence and lazy
+window expansion.
+
+Usage:
+    cd backend && python benchmarks/recurrence.py --years 50
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.recurrence import RecurrencePattern  # noqa: E402
+
+
+def legacy_count(start_date, recurrence_type, recurrence_end):
+    """Previous calculate_occurrences_count: iterate and materialize every date"""
+    step = timedelta(weeks=1) if recurrence_type == 'weekly' else relativedelta(months=1)
+    dates = []
+    current_date = start_date
+    while True:
+        current_date = current_date + step
+        if current_date > recurrence_end:
+            break
+        dates.append(current_date)
+    return len(dates) + 1
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print(f"  {label:<44} {seconds * 1e6:12.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recurrence engine benchmark')
+    parser.add_argument('--years', type=int, default=50)
+    args = parser.parse_args()
+
+    start = date(2025, 1, 6)
+    until = start + relativedelta(years=args.years)
+    window_start = start + relativedelta(years=args.years - 1)
+
+    rules = [
+        ('weekly', RecurrencePattern(start, 'weekly', until=until)),
+        ('monthly', RecurrencePattern(start, 'monthly', until=until)),
+        ('daily', RecurrencePattern(start, 'daily', until=until)),
+        ('weekly MO,WE,FR every 2 weeks', RecurrencePattern(start, 'weekly', 2, until=until, by_day='MO,WE,FR')),
+        ('monthly 1MO,-1FR', RecurrencePattern(start, 'monthly', until=until, by_day='1MO,-1FR')),
+    ]
+
+    print(f"{args.years}-year rules starting {start.isoformat()}")
+    for name, pattern in rules:
+        total = pattern.total()
+        print(f"{name} ({total} occurrences)")
+        if name in ('weekly', 'monthly'):
+            assert legacy_count(start, name, until) == total
+            bench('legacy count (materialize list)', lambda: legacy_count(start, name, until), 5)
+        bench('count (arithmetic)', pattern.total, 2000)
+        bench('nth(total - 1) (arithmetic)', lambda: pattern.nth(total - 1), 2000)
+        bench('occurrences in the last year (lazy window)',
+              lambda: list(pattern.between(window_start, until)), 200)
+
+
+if __name__ == '__main__':
+    main()
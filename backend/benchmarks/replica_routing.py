@@ -0,0 +1,100 @@
+"""
+Read-replica routing check
+
+Builds the local two-file SQLite setup of the README (the replica is a
+copy of the primary made with the SQLite backup API), then renames the
+services in the replica only, so every response shows which database
+served it, and checks that:
+
+  * read-only GETs from a new client are served by the replica
+  * a write goes to the primary and sets the sticky cookie
+  * the writer's next GET is served by the primary (read-your-writes)
+  * other clients keep reading from the replica
+
+Exits with status 1 if any check fails.
+
+Usage:
+    cd backend && python benchmarks/replica_routing.py
+"""
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+REPLICA_MARK = ' (replica)'
+
+
+def service_names(client):
+    response = client.get('/api/services')
+    return {s['name'] for s in response.get_json()['services']}
+
+
+def main() -> int:
+    tmp = tempfile.TemporaryDirectory()
+    primary = os.path.join(tmp.name, 'primary.db')
+    replica = os.path.join(tmp.name, 'replica.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{primary}'
+    os.environ['DATABASE_REPLICA_URLS'] = f'sqlite:///{replica}'
+    os.environ['DEBUG'] = 'False'
+    os.environ['RATE_LIMIT_ENABLED'] = 'False'
+
+    import init_db
+    from app import app
+    from models import db
+    from utils.replicas import STICKY_COOKIE
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db.init_database()
+    with app.app_context():
+        db.engine.dispose()
+
+    source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+    source.backup(target)
+    target.execute('UPDATE services SET name = name || ?', (REPLICA_MARK,))
+    target.commit()
+    source.close()
+    target.close()
+
+    failures = []
+
+    def check(description, passed):
+        print(f"  {'ok  ' if passed else 'FAIL'} {description}")
+        if not passed:
+            failures.append(description)
+
+    writer, reader = app.test_client(), app.test_client()
+
+    names = service_names(writer)
+    check('GET /api/services is served by the replica', all(n.endswith(REPLICA_MARK) for n in names))
+
+    service_id = writer.get('/api/services').get_json()['services'][0]['id']
+    response = writer.put(f'/api/services/{service_id}', json={'price': 42})
+    check('PUT /api/services/<id> is applied on the primary',
+          response.status_code == 200 and not response.get_json()['service']['name'].endswith(REPLICA_MARK))
+    check(f'the write sets the {STICKY_COOKIE} cookie',
+          any(STICKY_COOKIE in header for header in response.headers.getlist('Set-Cookie')))
+
+    names = service_names(writer)
+    check('the writer reads its own write from the primary',
+          not any(n.endswith(REPLICA_MARK) for n in names))
+
+    names = service_names(reader)
+    check('a client without the cookie still reads from the replica',
+          all(n.endswith(REPLICA_MARK) for n in names))
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    tmp.cleanup()
+
+    print('all checks passed' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
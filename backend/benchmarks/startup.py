@@ -0,0 +1,78 @@
+"""
+Cold start benchmark
+
+Measures, in fresh processes against a local SQLite database:
+  * boot: the pre-server step of the container (legacy init_db.py vs boot.py)
+  * first response: importing app.py and serving GET /api/services
+
+Only the boot step differs between the two container commands. The first
+response is dominated by importing Flask, SQLAlchemy and the models, which
+both commands pay alike, so it is added unchanged to both totals.
+
+The legacy container command also slept a fixed 5 seconds before init_db.py;
+that sleep is reported separately rather than actually waited for.
+
+Usage:
+    cd backend && python benchmarks/startup.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEGACY_SLEEP_SECONDS = 5
+
+FIRST_RESPONSE_SNIPPET = """
+import time
+started = time.perf_counter()
+from app import app
+response = app.test_client().get('/api/services')
+assert response.status_code == 200, response.status_code
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def run(args, env):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable] + args, cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return (time.perf_counter() - started) * 1000, result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp}/startup.db', DEBUG='False')
+        run(['init_db.py'], env)  # create and seed the database once
+
+        legacy_boot, new_boot, first_responses = [], [], []
+        for _ in range(args.runs):
+            legacy_boot.append(run(['init_db.py'], env)[0])
+            new_boot.append(run(['boot.py'], env)[0])
+            _, output = run(['-c', FIRST_RESPONSE_SNIPPET], env)
+            first_responses.append(float(output))
+
+    legacy_total = LEGACY_SLEEP_SECONDS * 1000 + statistics.median(legacy_boot)
+    new_total = statistics.median(new_boot)
+    first_response = statistics.median(first_responses)
+    print(f"runs: {args.runs} (medians, ms)")
+    print(f"  legacy boot (sleep 5 + init_db):  {legacy_total:8.1f}")
+    print(f"  boot.py (schema version current): {new_total:8.1f}")
+    print(f"  first response (same for both):   {first_response:8.1f}")
+    print(f"  container start to first response: "
+          f"{legacy_total + first_response:.1f} -> {new_total + first_response:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Container boot script
+
+Waits until the database accepts connections, then runs the full
+initialization (init_db.py) only when the stored schema version differs
+from config.SCHEMA_VERSION. On a normal restart this only imports
+SQLAlchemy and issues two cheap queries instead of importing the whole
+application, running create_all and counting rows.
+"""
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+
+from config import Config, SCHEMA_VERSION
+
+
+def wait_for_database(engine, timeout: float, interval: float = 0.25) -> bool:
+    """
+    Poll the database with SELECT 1 until it answers or the timeout expires
+
+    Returns:
+        True if the database is ready
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return True
+        except DBAPIError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+            interval = min(interval * 2, 2.0)
+
+
+def stored_schema_version(engine):
+    """Return the latest applied schema version, or None if the database is not initialized"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+    except DBAPIError:
+        return None
+
+
+def main() -> int:
+    started = time.perf_counter()
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+
+    print("Waiting for database...")
+    if not wait_for_database(engine, Config.DB_WAIT_TIMEOUT):
+        print(f"✗ Database not reachable after {Config.DB_WAIT_TIMEOUT}s")
+        return 1
+
+    version = stored_schema_version(engine)
+    engine.dispose()
+
+    if version == SCHEMA_VERSION:
+        print(f"✓ Schema version {version} is current, skipping initialization")
+    else:
+        print(f"Schema version {version} != {SCHEMA_VERSION}, initializing database...")
+        from init_db import init_database
+        init_database()
+
+    print(f"✓ Boot completed in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,11 @@
 import os
 
+# Version of the database schema defined in models.py. Bump it whenever a
+# model or index changes so boot.py runs the initialization again, and add
+# a migration to utils/migrations.py if existing tables change.
+SCHEMA_VERSION = 10
+
+
 class Config:
     # Flask settings
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -18,6 +24,32 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = DEBUG
+    
+    # Optional read replicas (comma-separated URIs) used by read-only GET handlers;
+    # bind keys must start with utils.replicas.REPLICA_BIND_PREFIX
+    SQLALCHEMY_REPLICA_URIS = [
+        uri.strip() for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri.strip()
+    ]
+    SQLALCHEMY_BINDS = {f'replica_{i}': uri for i, uri in enumerate(SQLALCHEMY_REPLICA_URIS)}
+    # Seconds a client keeps reading from the primary after it wrote something
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    
+    # Single-node SQLite profile (DATABASE_URL=sqlite:///...), see utils.sqlite:
+    # WAL and synchronous=NORMAL, memory-mapped I/O and page cache sizes, and how
+    # long a writer waits for the lock before failing with "database is locked"
+    SQLITE_TUNING_ENABLED = os.environ.get('SQLITE_TUNING_ENABLED', 'True').lower() == 'true'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KIB = int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 64 * 1024))
+    
+    # Minutes a waitlist offer stays valid before the slot goes to the next waiter
+    WAITLIST_OFFER_TTL_MINUTES = int(os.environ.get('WAITLIST_OFFER_TTL_MINUTES', 60))
+    
+    # Boot: seconds to wait for the database to accept connections
+    DB_WAIT_TIMEOUT = int(os.environ.get('DB_WAIT_TIMEOUT', 60))
+    
+    # CORS origins ('*', a comma-separated list, or empty to disable CORS)
+    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*')
 
     # Email settings
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -32,3 +64,63 @@ class Config:
     TIMEZONE = os.environ.get('TIMEZONE', 'UTC')
     DEFAULT_APPOINTMENT_DURATION = int(os.environ.get('DEFAULT_APPOINTMENT_DURATION', 60))
     ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE', 20))
+
+    # Archival settings
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+    COMPLETION_BATCH_SIZE = int(os.environ.get('COMPLETION_BATCH_SIZE', 1000))
+
+    # Idempotency-Key responses for POST /api/appointments are kept this long
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+
+    # Admission control: token buckets per client IP and route ('N/second|minute|hour')
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    # '' = per-process buckets, 'sqlite:////tmp/appo_ratelimit.db' = shared by workers
+    # on one host, 'redis://host:6379/0' = shared across hosts (requires redis package)
+    RATE_LIMIT_STORAGE_URI = os.environ.get('RATE_LIMIT_STORAGE_URI', '')
+    RATE_LIMIT_SLOTS = os.environ.get('RATE_LIMIT_SLOTS', '120/minute')
+    RATE_LIMIT_BOOKINGS = os.environ.get('RATE_LIMIT_BOOKINGS', '10/minute')
+    # Concurrent write requests (POST/PUT/DELETE on /api/) per worker process
+    WRITE_CONCURRENCY_LIMIT = int(os.environ.get('WRITE_CONCURRENCY_LIMIT', 8))
+
+    # Admin change feed (server-sent events)
+    EVENT_STREAM_MAX_SECONDS = int(os.environ.get('EVENT_STREAM_MAX_SECONDS', 300))
+    EVENT_STREAM_POLL_SECONDS = float(os.environ.get('EVENT_STREAM_POLL_SECONDS', 2))
+    EVENT_RETENTION_HOURS = int(os.environ.get('EVENT_RETENTION_HOURS', 48))
+    # Open streams per process, and how long a skipped event id is waited for
+    EVENT_STREAM_MAX_OPEN = int(os.environ.get('EVENT_STREAM_MAX_OPEN', 50))
+    EVENT_GAP_TIMEOUT_SECONDS = float(os.environ.get('EVENT_GAP_TIMEOUT_SECONDS', 30))
+
+    # Delta sync (GET /api/appointments?updated_since=...)
+    SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 1000))
+
+    # Maximum results returned by GET /api/appointments/search
+    SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', 50))
+
+    # Maximum appointments returned by GET /api/clients/<id>/appointments
+    CLIENT_HISTORY_MAX_RESULTS = int(os.environ.get('CLIENT_HISTORY_MAX_RESULTS', 200))
+
+    # Maximum number of operations accepted by POST /api/batch
+    BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 100))
+
+    # Seconds between background database pings reported by /readyz
+    HEALTH_CHECK_INTERVAL = float(os.environ.get('HEALTH_CHECK_INTERVAL', 5))
+
+    # Per-process caches of services/availability (see utils.cache): seconds
+    # between generation checks per worker (0 = on every request using a
+    # cache) and an optional 'redis://host:6379/0' to push invalidations
+    # (requires redis package)
+    CACHE_CHECK_SECONDS = float(os.environ.get('CACHE_CHECK_SECONDS', 0))
+    CACHE_PUBSUB_URI = os.environ.get('CACHE_PUBSUB_URI', '')
+
+    # Days before/after today covered by the iCalendar feeds
+    ICS_PAST_DAYS = int(os.environ.get('ICS_PAST_DAYS', 30))
+    ICS_FUTURE_DAYS = int(os.environ.get('ICS_FUTURE_DAYS', 180))
+
+    # Request profiling (see utils.profiling): requests sending
+    # "X-Profile: <PROFILE_TOKEN>" are profiled, plus a random
+    # PROFILE_SAMPLE_RATE fraction of /api/ requests. Off when both are unset.
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
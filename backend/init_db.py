@@ -2,7 +2,10 @@
 Database initialization script
 """
 from app import app, db
-from models import Service, Availability
+from config import SCHEMA_VERSION
+from models import Service, Availability, SchemaVersion
+from utils.migrations import run_migrations
+from sqlalchemy import func
 from datetime import time
 
 
@@ -11,9 +14,16 @@ def init_database():
     with app.app_context():
         # Create all tables
         print("Creating database tables...")
-        db.create_all()
+        db.create_all(bind_key=None)  # replicas receive the schema through replication
         print("✓ Tables created successfully")
         
+        # Bring tables created by an older schema version up to date
+        stored_version = db.session.query(func.max(SchemaVersion.version)).scalar()
+        if stored_version != SCHEMA_VERSION:
+            applied = run_migrations(stored_version)
+            if applied:
+                print(f"✓ Migrations applied: {', '.join(str(v) for v in applied)}")
+        
         # Create default services if none exist
         if Service.query.count() == 0:
             print("Creating default services...")
@@ -77,6 +87,11 @@ def init_database():
         else:
             print(f"✓ Availability already configured ({Availability.query.count()} days)")
         
+        # Record the schema version so the next boot can skip initialization
+        db.session.merge(SchemaVersion(version=SCHEMA_VERSION))
+        db.session.commit()
+        print(f"✓ Schema version {SCHEMA_VERSION} recorded")
+        
         print("\n✅ Database initialization completed successfully!")
 
 
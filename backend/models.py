@@ -3,8 +3,101 @@ Database models for the appointment booking system
 """
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 
-db = SQLAlchemy()
+from utils.replicas import RoutingSession
+from utils.validators import normalize_name, normalize_phone
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _hhmm(value):
+    return value.strftime('%H:%M') if value else None
+
+
+def serialize(obj, serializers, fields=None):
+    """
+    Serialize obj with a {name: function} map, optionally restricted to fields
+
+    Only the requested serializers run, so unrequested relationships
+    (e.g. service_name) are never loaded.
+    """
+    if fields is None:
+        return {name: serializer(obj) for name, serializer in serializers.items()}
+    return {name: serializer(obj) for name, serializer in serializers.items() if name in fields}
+
+
+SERVICE_FIELDS = {
+    'id': lambda s: s.id,
+    'name': lambda s: s.name,
+    'description': lambda s: s.description,
+    'duration': lambda s: s.duration,
+    'price': lambda s: s.price,
+    'capacity': lambda s: s.capacity,
+    'active': lambda s: s.active,
+    'created_at': lambda s: _iso(s.created_at)
+}
+
+APPOINTMENT_FIELDS = {
+    'id': lambda a: a.id,
+    'date': lambda a: _iso(a.date),
+    'time': lambda a: _hhmm(a.time),
+    'client': lambda a: a.client,
+    'phone': lambda a: a.phone,
+    'client_id': lambda a: a.client_id,
+    'service_id': lambda a: a.service_id,
+    'service_name': lambda a: a.service.name if a.service else None,
+    'recurrence': lambda a: a.recurrence,
+    'recurrence_end': lambda a: _iso(a.recurrence_end),
+    'parent_appointment_id': lambda a: a.parent_appointment_id,
+    'status': lambda a: a.status,
+    'notes': lambda a: a.notes,
+    'price': lambda a: a.price,
+    'created_at': lambda a: _iso(a.created_at),
+    'updated_at': lambda a: _iso(a.updated_at)
+}
+
+ARCHIVED_APPOINTMENT_FIELDS = dict(APPOINTMENT_FIELDS, archived=lambda a: True)
+
+CLIENT_FIELDS = {
+    'id': lambda c: c.id,
+    'name': lambda c: c.name,
+    'phone': lambda c: c.phone,
+    'created_at': lambda c: _iso(c.created_at),
+    'updated_at': lambda c: _iso(c.updated_at)
+}
+
+WAITLIST_FIELDS = {
+    'id': lambda w: w.id,
+    'date': lambda w: _iso(w.date),
+    'service_id': lambda w: w.service_id,
+    'window_start': lambda w: _hhmm(w.window_start),
+    'window_end': lambda w: _hhmm(w.window_end),
+    'client': lambda w: w.client,
+    'phone': lambda w: w.phone,
+    'client_id': lambda w: w.client_id,
+    'email': lambda w: w.email,
+    'auto_book': lambda w: w.auto_book,
+    'status': lambda w: w.status,
+    'offered_time': lambda w: _hhmm(w.offered_time),
+    'appointment_id': lambda w: w.appointment_id,
+    'notified_at': lambda w: _iso(w.notified_at),
+    'created_at': lambda w: _iso(w.created_at)
+}
+
+AVAILABILITY_FIELDS = {
+    'id': lambda a: a.id,
+    'day_of_week': lambda a: a.day_of_week,
+    'start_time': lambda a: _hhmm(a.start_time),
+    'end_time': lambda a: _hhmm(a.end_time),
+    'duration_minutes': lambda a: a.duration_minutes,
+    'enabled': lambda a: a.enabled,
+    'created_at': lambda a: _iso(a.created_at)
+}
 
 
 class Service(db.Model):
@@ -16,62 +109,118 @@ class Service(db.Model):
     description = db.Column(db.Text)
     duration = db.Column(db.Integer, default=60)  # in minutes
     price = db.Column(db.Float, default=0.0)
+    capacity = db.Column(db.Integer, default=1)  # concurrent bookings per slot, e.g. group classes
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     appointments = db.relationship('Appointment', backref='service', lazy=True)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'duration': self.duration,
-            'price': self.price,
-            'active': self.active,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
+    def to_dict(self, fields=None):
+        return serialize(self, SERVICE_FIELDS, fields)
+
+
+class Client(db.Model):
+    """Client identified by normalized phone number (see utils.validators.normalize_phone)"""
+    __tablename__ = 'clients'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), nullable=False, unique=True)
+    name = db.Column(db.String(100), nullable=False)  # name used in the latest booking
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self, fields=None):
+        return serialize(self, CLIENT_FIELDS, fields)
 
 
 class Appointment(db.Model):
     """Appointment model with recurrence support"""
     __tablename__ = 'appointments'
+    __table_args__ = (
+        db.Index('ix_appointments_date_status', 'date', 'status'),
+        db.Index('ix_appointments_updated_at', 'updated_at', 'id'),
+        db.Index('ix_appointments_client_search', 'client_search', 'date', 'time'),
+        db.Index('ix_appointments_phone_digits', 'phone_digits', 'date', 'time'),
+        # Per-client history in date order; status makes it covering for counts
+        db.Index('ix_appointments_client_id', 'client_id', 'date', 'time', 'status'),
+        # Overlap checks: status plus a range on start_datetime, end_datetime read from the index
+        db.Index('ix_appointments_window', 'status', 'start_datetime', 'end_datetime'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
     time = db.Column(db.Time, nullable=False)
     client = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'))  # client/phone keep the values as booked
     service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
-    recurrence = db.Column(db.String(20), default='none')  # none, weekly, monthly
+    recurrence = db.Column(db.String(20), default='none')  # none, weekly, monthly, rule (see RecurrenceRule)
     recurrence_end = db.Column(db.Date)
     parent_appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'))
     status = db.Column(db.String(20), default='active')  # active, cancelled, completed
     notes = db.Column(db.Text)
+    price = db.Column(db.Float)  # service price at booking time, used by the stats
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Normalized lookup keys for /api/appointments/search, kept in sync with client/phone
+    client_search = db.Column(db.String(100))
+    phone_digits = db.Column(db.String(20))
+    
+    # Booked window, fixed at booking time with the service duration of that moment
+    start_datetime = db.Column(db.DateTime)
+    end_datetime = db.Column(db.DateTime)
+    
     # Self-referential relationship for recurring appointments
     children = db.relationship('Appointment', backref=db.backref('parent', remote_side=[id]))
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'date': self.date.isoformat() if self.date else None,
-            'time': self.time.strftime('%H:%M') if self.time else None,
-            'client': self.client,
-            'phone': self.phone,
-            'service_id': self.service_id,
-            'service_name': self.service.name if self.service else None,
-            'recurrence': self.recurrence,
-            'recurrence_end': self.recurrence_end.isoformat() if self.recurrence_end else None,
-            'parent_appointment_id': self.parent_appointment_id,
-            'status': self.status,
-            'notes': self.notes,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+    @validates('client')
+    def _set_client_search(self, key, value):
+        self.client_search = normalize_name(value)
+        return value
+    
+    @validates('phone')
+    def _set_phone_digits(self, key, value):
+        self.phone_digits = normalize_phone(value)
+        return value
+    
+    def to_dict(self, fields=None):
+        return serialize(self, APPOINTMENT_FIELDS, fields)
+
+
+class AppointmentArchive(db.Model):
+    """Past cancelled/completed appointments moved out of the hot table"""
+    __tablename__ = 'appointments_archive'
+    __table_args__ = (
+        db.Index('ix_appointments_archive_date', 'date'),
+        db.Index('ix_appointments_archive_archived_at', 'archived_at'),
+        db.Index('ix_appointments_archive_client_id', 'client_id', 'date', 'time', 'status'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # same id as in appointments
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    client = db.Column(db.String(100), nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    client_id = db.Column(db.Integer)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    recurrence = db.Column(db.String(20), default='none')
+    recurrence_end = db.Column(db.Date)
+    parent_appointment_id = db.Column(db.Integer)  # no FK: the parent may still be in the hot table
+    status = db.Column(db.String(20))
+    notes = db.Column(db.Text)
+    price = db.Column(db.Float)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    service = db.relationship('Service', viewonly=True)
+    
+    def to_dict(self, fields=None):
+        if fields is not None:
+            fields = set(fields) | {'archived'}
+        return serialize(self, ARCHIVED_APPOINTMENT_FIELDS, fields)
 
 
 class Availability(db.Model):
@@ -86,21 +235,16 @@ class Availability(db.Model):
     enabled = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'day_of_week': self.day_of_week,
-            'start_time': self.start_time.strftime('%H:%M') if self.start_time else None,
-            'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
-            'duration_minutes': self.duration_minutes,
-            'enabled': self.enabled,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
+    def to_dict(self, fields=None):
+        return serialize(self, AVAILABILITY_FIELDS, fields)
 
 
 class RecurrenceRule(db.Model):
     """Rules for recurring appointments"""
     __tablename__ = 'recurrence_rules'
+    __table_args__ = (
+        db.Index('ix_recurrence_rules_appointment_id', 'appointment_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
@@ -122,3 +266,106 @@ class RecurrenceRule(db.Model):
             'by_day': self.by_day,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class DailyStat(db.Model):
+    """Per-day, per-service appointment aggregates for the admin dashboard"""
+    __tablename__ = 'daily_stats'
+    __table_args__ = (
+        db.UniqueConstraint('date', 'service_id', name='uq_daily_stats_date_service'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    booked_count = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)  # price of non-cancelled bookings
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'date': self.date.isoformat() if self.date else None,
+            'service_id': self.service_id,
+            'booked_count': self.booked_count,
+            'cancelled_count': self.cancelled_count,
+            'completed_count': self.completed_count,
+            'revenue': self.revenue
+        }
+
+
+class IdempotencyKey(db.Model):
+    """Stored responses for client-supplied Idempotency-Key headers"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('route', 'key', name='uq_idempotency_keys_route_key'),
+        db.Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(128), nullable=False)
+    route = db.Column(db.String(100), nullable=False)  # e.g. "POST /api/appointments"
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of the request body
+    status_code = db.Column(db.Integer, nullable=False)
+    response_body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class AppointmentEvent(db.Model):
+    """Ordered log of appointment changes for the admin change feed"""
+    __tablename__ = 'appointment_events'
+    
+    id = db.Column(db.Integer, primary_key=True)  # monotonically increasing event id
+    event_type = db.Column(db.String(20), nullable=False)  # created, updated, cancelled
+    appointment_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON of Appointment.to_dict()
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class WaitlistEntry(db.Model):
+    """Client waiting for a place of a service on a date, within a time window"""
+    __tablename__ = 'waitlist'
+    __table_args__ = (
+        # Candidates for a freed slot, in arrival (id) order
+        db.Index('ix_waitlist_match', 'date', 'service_id', 'status', 'window_start'),
+        # Archival skips appointments still referenced by an entry
+        db.Index('ix_waitlist_appointment_id', 'appointment_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    window_start = db.Column(db.Time, nullable=False)
+    window_end = db.Column(db.Time, nullable=False)  # the appointment must end by this time
+    client = db.Column(db.String(100), nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'))
+    email = db.Column(db.String(120))
+    auto_book = db.Column(db.Boolean, default=False)  # book directly instead of offering the slot
+    status = db.Column(db.String(20), default='waiting')  # waiting, offered, booked, cancelled, expired
+    offered_time = db.Column(db.Time)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'))
+    notified_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self, fields=None):
+        return serialize(self, WAITLIST_FIELDS, fields)
+
+
+class CacheGeneration(db.Model):
+    """Generation counter of a per-process cache, bumped by the writes that invalidate it"""
+    __tablename__ = 'cache_generations'
+    
+    name = db.Column(db.String(50), primary_key=True)  # e.g. services, availability
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchemaVersion(db.Model):
+    """Schema versions applied by init_db.py, checked at boot by boot.py"""
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
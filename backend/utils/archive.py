@@ -0,0 +1,98 @@
+"""
+Archival of past appointments into the cold appointments_archive table
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import exists, insert, literal, select
+from sqlalchemy.orm import aliased
+
+from models import db, Appointment, AppointmentArchive, RecurrenceRule, WaitlistEntry
+
+logger = logging.getLogger(__name__)
+
+ARCHIVABLE_STATUSES = ('cancelled', 'completed')
+
+ARCHIVE_COLUMNS = [
+    'id', 'date', 'time', 'client', 'phone', 'client_id', 'service_id', 'recurrence',
+    'recurrence_end', 'parent_appointment_id', 'status', 'notes', 'price',
+    'created_at', 'updated_at'
+]
+
+
+def archive_appointments(before_date, batch_size: int = 1000, max_batches: int = None) -> int:
+    """
+    Move past cancelled/completed appointments into the archive table
+
+    Each batch copies rows with INSERT ... SELECT and deletes them from the
+    hot table in the same transaction, so a crash never loses or duplicates
+    a row. Parents that still have children in the hot table are kept until
+    their children are archived, to preserve the self-referential FK, and
+    appointments referenced by a waitlist entry or a recurrence rule stay
+    in the hot table for the same reason.
+
+    Args:
+        before_date: archive appointments strictly before this date
+        batch_size: rows moved per transaction
+        max_batches: stop after this many batches (None = until done)
+
+    Returns:
+        Number of rows archived
+    """
+    child = aliased(Appointment)
+    has_hot_children = exists().where(child.parent_appointment_id == Appointment.id)
+    has_waitlist_entry = exists().where(WaitlistEntry.appointment_id == Appointment.id)
+    has_rule = exists().where(RecurrenceRule.appointment_id == Appointment.id)
+
+    candidates = select(Appointment.id).where(
+        Appointment.date < before_date,
+        Appointment.status.in_(ARCHIVABLE_STATUSES),
+        ~has_hot_children,
+        ~has_waitlist_entry,
+        ~has_rule
+    ).order_by(Appointment.id).limit(batch_size)
+
+    archived = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(candidates).scalars().all()
+        if not ids:
+            break
+
+        columns = [getattr(Appointment, name) for name in ARCHIVE_COLUMNS]
+        db.session.execute(
+            insert(AppointmentArchive).from_select(
+                ARCHIVE_COLUMNS + ['archived_at'],
+                select(*columns, literal(datetime.utcnow())).where(Appointment.id.in_(ids))
+            )
+        )
+        Appointment.query.filter(Appointment.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+        archived += len(ids)
+        batches += 1
+        logger.info(f"Archived batch of {len(ids)} appointments ({archived} total)")
+
+    return archived
+
+
+def query_archived_appointments(target_date=None, status=None):
+    """
+    Build a query over archived appointments using the same filters as the hot table
+
+    Args:
+        target_date: only appointments on this date
+        status: only appointments with this status
+
+    Returns:
+        SQLAlchemy query for AppointmentArchive
+    """
+    query = AppointmentArchive.query
+
+    if target_date:
+        query = query.filter_by(date=target_date)
+
+    if status:
+        query = query.filter_by(status=status)
+
+    return query.order_by(AppointmentArchive.date, AppointmentArchive.time)
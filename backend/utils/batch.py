@@ -0,0 +1,116 @@
+"""
+Transactional batch execution of API write operations
+"""
+from flask import current_app, g, request
+
+from models import db
+from utils.idempotency import IDEMPOTENCY_HEADER, get_idempotency_key
+
+# Endpoints that may appear in a batch (write handlers only)
+BATCH_ENDPOINTS = {
+    'create_service', 'update_service', 'delete_service',
+    'create_availability', 'update_availability', 'delete_availability',
+    'create_appointment', 'update_appointment', 'cancel_appointment',
+    'create_waitlist_entry', 'cancel_waitlist_entry'
+}
+
+# Outer headers not forwarded to the operations (each has its own JSON body)
+BODY_HEADERS = {'content-type', 'content-length'}
+
+
+def in_batch() -> bool:
+    """True while the current request is executing a batch of operations"""
+    return g.get('batch_callbacks') is not None
+
+
+def commit_changes():
+    """
+    Commit the current transaction
+
+    Inside a batch only flush, so every operation shares the single commit
+    issued by run_batch (and a later failure rolls all of them back).
+    """
+    if in_batch():
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+def after_commit(callback, *args):
+    """Run a side effect (e.g. an email) once the data it describes is committed"""
+    if in_batch():
+        g.batch_callbacks.append((callback, args))
+    else:
+        callback(*args)
+
+
+def run_batch(operations):
+    """
+    Execute operations in one transaction with one commit
+
+    Each operation is {"method": ..., "path": ..., "body": {...}} and is
+    dispatched to the same view function as the equivalent HTTP request,
+    with the client address and headers of the batch request, so rate
+    limits are charged per operation to the calling client. An optional
+    "headers" dict overrides headers for one operation; otherwise the
+    batch's Idempotency-Key is forwarded as "<index>:<key>", so retrying
+    the batch with the same key replays each operation.
+    Execution stops at the first operation that does not return 2xx and
+    the whole batch is rolled back.
+
+    Returns:
+        Tuple of (committed, list of per-operation {'status', 'body'} results)
+    """
+    app = current_app._get_current_object()
+    adapter = app.url_map.bind('localhost')
+    results = []
+    g.batch_callbacks = []
+
+    environ_base = {'REMOTE_ADDR': request.remote_addr}
+    outer_headers = {
+        name: value for name, value in request.headers.items()
+        if name.lower() not in BODY_HEADERS and name.lower() != IDEMPOTENCY_HEADER.lower()
+    }
+    idempotency_key = get_idempotency_key()
+
+    try:
+        for index, operation in enumerate(operations):
+            method = str(operation.get('method', '')).upper()
+            path = operation.get('path', '')
+
+            try:
+                endpoint, view_args = adapter.match(path, method=method)
+            except Exception:
+                endpoint, view_args = None, {}
+
+            if endpoint not in BATCH_ENDPOINTS or not isinstance(operation.get('headers', {}), dict):
+                results.append({
+                    'status': 400,
+                    'body': {'success': False, 'error': f'Unsupported operation: {method} {path}'}
+                })
+                break
+
+            headers = dict(outer_headers)
+            if idempotency_key:
+                headers[IDEMPOTENCY_HEADER] = f'{index}:{idempotency_key}'
+            headers.update(operation.get('headers') or {})
+
+            with app.test_request_context(path, method=method, json=operation.get('body', {}),
+                                          headers=headers, environ_base=environ_base):
+                response = app.make_response(app.view_functions[endpoint](**view_args))
+
+            results.append({'status': response.status_code, 'body': response.get_json()})
+            if response.status_code >= 300:
+                break
+        else:
+            db.session.commit()
+            callbacks = g.batch_callbacks
+            g.batch_callbacks = None
+            for callback, args in callbacks:
+                callback(*args)
+            return True, results
+
+        db.session.rollback()
+        return False, results
+    finally:
+        g.batch_callbacks = None
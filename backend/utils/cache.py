@@ -0,0 +1,214 @@
+"""
+Per-process caches kept coherent across workers with generation counters
+
+Each cache name (e.g. 'services') has a row in cache_generations. Write
+handlers call bump_generation() in their transaction, so the counter
+changes exactly when the data does. Readers go through cached(), which
+compares the counters with the ones its values were loaded under - one
+query on a tiny table, at most once per request - and drops the values
+of the caches whose generation moved.
+
+With CACHE_PUBSUB_URI set (redis://...), committed bumps are also
+published and every worker drops its values as soon as the message
+arrives; CACHE_CHECK_SECONDS can then be raised so the database is only
+checked as a safety net for lost messages.
+"""
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from flask import g
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, CacheGeneration
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_CHANNEL = 'appo:cache-invalidations'
+
+
+class GenerationCache:
+    """Values per cache name(s), valid while the names' generations are unchanged"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._generations = {}
+        self._checked_at = None
+        self.check_interval = 0.0
+
+    def _drop(self, changed):
+        """Drop the values depending on any of the changed names (lock held)"""
+        for names in [names for names in self._values if not changed.isdisjoint(names)]:
+            del self._values[names]
+
+    def _refresh_generations(self):
+        """Read the counters (once per request, at most every check_interval seconds)"""
+        if g.get('cache_generations_checked'):
+            return
+        g.cache_generations_checked = True
+
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+
+        generations = dict(db.session.query(CacheGeneration.name, CacheGeneration.generation).all())
+        self._checked_at = now
+        with self._lock:
+            changed = {
+                name for name in set(self._generations) | set(generations)
+                if self._generations.get(name) != generations.get(name)
+            }
+            self._drop(changed)
+            self._generations.update((name, generations.get(name)) for name in changed)
+
+    def get(self, names, key, loader, version=None):
+        """
+        Cached value of key, loaded with loader() on a miss
+
+        names is a cache name or a tuple of names the value depends on.
+        version is an optional cheap fingerprint of data not covered by the
+        generations; an entry with another version is reloaded in place.
+
+        A value is only stored if no generation moved while it was being
+        loaded, so a concurrent invalidation is never overwritten.
+        """
+        names = (names,) if isinstance(names, str) else tuple(names)
+        self._refresh_generations()
+        with self._lock:
+            entry = self._values.get(names, {}).get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            generations = [self._generations.get(name) for name in names]
+
+        value = loader()
+        with self._lock:
+            if [self._generations.get(name) for name in names] == generations:
+                self._values.setdefault(names, {})[key] = (version, value)
+        return value
+
+    def invalidate(self, names):
+        """Drop the values of names; the next check reloads their generations"""
+        with self._lock:
+            self._drop(set(names))
+            for name in names:
+                self._generations.pop(name, None)
+        self._checked_at = None
+
+    def invalidate_all(self):
+        with self._lock:
+            names = list(self._generations)
+        self.invalidate(names)
+
+
+class RedisInvalidationBus:
+    """Publishes committed bumps and applies the ones of other workers"""
+
+    RECONNECT_SECONDS = 5
+
+    def __init__(self, url: str, cache: GenerationCache):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('CACHE_PUBSUB_URI uses redis but the redis package is not installed') from e
+        self._redis = redis.Redis.from_url(url)
+        self._cache = cache
+        threading.Thread(target=self._listen, name='cache-invalidations', daemon=True).start()
+
+    def publish(self, names):
+        self._redis.publish(PUBSUB_CHANNEL, ','.join(names))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(PUBSUB_CHANNEL)
+                # Messages may have been missed while disconnected
+                self._cache.invalidate_all()
+                for message in pubsub.listen():
+                    self._cache.invalidate(message['data'].decode().split(','))
+            except Exception as e:
+                logger.warning(f"Cache invalidation subscriber disconnected: {str(e)}")
+                time.sleep(self.RECONNECT_SECONDS)
+
+
+_cache = GenerationCache()
+_bus = None
+
+
+def init_cache(app):
+    """Configure the generation check interval and the optional pub/sub backend"""
+    global _bus
+    _cache.check_interval = app.config['CACHE_CHECK_SECONDS']
+    if app.config['CACHE_PUBSUB_URI']:
+        _bus = RedisInvalidationBus(app.config['CACHE_PUBSUB_URI'], _cache)
+
+
+def cached(names, key, loader, version=None):
+    """
+    Per-process cached value, invalidated by bump_generation() of any of names
+
+    Example:
+        services = cached('services', 'active', lambda: [s.to_dict() for s in ...])
+    """
+    return _cache.get(names, key, loader, version)
+
+
+def snapshot(obj):
+    """
+    Plain copy of a model row's columns, safe to keep across sessions
+
+    Returns None for None.
+    """
+    if obj is None:
+        return None
+    return SimpleNamespace(**{column.key: getattr(obj, column.key) for column in obj.__table__.columns})
+
+
+@event.listens_for(db.session, 'after_commit')
+def _announce_bumps(session):
+    names = session.info.pop('bumped_generations', None)
+    if not names:
+        return
+    _cache.invalidate(names)
+    if _bus is not None:
+        try:
+            _bus.publish(sorted(names))
+        except Exception as e:
+            # Other workers still see the new generation on their next check
+            logger.warning(f"Error publishing cache invalidation: {str(e)}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_bumps(session):
+    session.info.pop('bumped_generations', None)
+
+
+def bump_generation(*names):
+    """
+    Increment the generations of names in the current transaction
+
+    Call it in write handlers before committing; the local cache (and the
+    other workers, with pub/sub) are invalidated once the transaction
+    commits, and nothing happens if it rolls back.
+    """
+    for name in names:
+        bumped = db.session.execute(
+            update(CacheGeneration).where(CacheGeneration.name == name)
+            .values(generation=CacheGeneration.generation + 1)
+        ).rowcount
+        if bumped:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(CacheGeneration(name=name, generation=1))
+        except IntegrityError:
+            # Created by a concurrent writer
+            db.session.execute(
+                update(CacheGeneration).where(CacheGeneration.name == name)
+                .values(generation=CacheGeneration.generation + 1)
+            )
+
+    db.session.info.setdefault('bumped_generations', set()).update(names)
@@ -0,0 +1,74 @@
+"""
+Clients keyed by normalized phone number, and per-client history
+"""
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Appointment, AppointmentArchive, Client
+from utils.fields import project_query
+from utils.validators import normalize_phone
+
+
+def get_or_create_client(name: str, phone: str) -> Client:
+    """
+    Return the client with this phone number, creating it if needed
+
+    The client's name is updated to the one used in the latest booking.
+    A concurrent request creating the same client is handled with a
+    savepoint, so the caller's transaction is not lost.
+    """
+    key = normalize_phone(phone)
+    client = Client.query.filter_by(phone=key).first()
+
+    if client is None:
+        try:
+            with db.session.begin_nested():
+                client = Client(phone=key, name=name)
+                db.session.add(client)
+        except IntegrityError:
+            client = Client.query.filter_by(phone=key).one()
+
+    if client.name != name:
+        client.name = name
+    return client
+
+
+def count_client_appointments(client_id: int, include_archived: bool = True) -> dict:
+    """
+    Number of appointments of a client by status
+
+    Answered from the (client_id, ..., status) indexes without reading
+    the appointment rows.
+    """
+    counts = {}
+    models = (Appointment, AppointmentArchive) if include_archived else (Appointment,)
+    for model in models:
+        rows = db.session.query(model.status, func.count()).filter(
+            model.client_id == client_id
+        ).group_by(model.status).all()
+        for status, count in rows:
+            counts[status] = counts.get(status, 0) + count
+    return counts
+
+
+def client_history(client_id: int, status=None, include_archived: bool = False,
+                   limit: int = 100, fields=None) -> list:
+    """
+    Most recent appointments of a client, newest first
+
+    Each table is read backwards along its client_id index and stops after
+    limit rows; archived rows are only read when include_archived is set.
+    """
+    sort_columns = ('date', 'time')
+    models = (Appointment, AppointmentArchive) if include_archived else (Appointment,)
+
+    appointments = []
+    for model in models:
+        query = model.query.filter(model.client_id == client_id)
+        if status:
+            query = query.filter(model.status == status)
+        query = project_query(query, model, fields, extra_columns=sort_columns)
+        appointments += query.order_by(model.date.desc(), model.time.desc()).limit(limit).all()
+
+    appointments.sort(key=lambda a: (a.date, a.time), reverse=True)
+    return appointments[:limit]
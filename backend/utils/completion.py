@@ -0,0 +1,95 @@
+"""
+Batched auto-completion of elapsed appointments
+"""
+import logging
+import time as timer
+from datetime import datetime
+
+from sqlalchemy import and_, func, select
+
+from models import db, Appointment
+from utils.events import record_event
+from utils.stats import new_stats_delta, apply_stats_delta
+
+logger = logging.getLogger(__name__)
+
+
+def _elapsed_filter(now: datetime):
+    """
+    Build a SQL predicate matching active appointments whose end time has passed
+
+    Reads ix_appointments_window: the stored end_datetime is compared
+    directly, with start_datetime bounding the range scan (an appointment
+    cannot end before it starts).
+    """
+    return and_(
+        Appointment.status == 'active',
+        Appointment.start_datetime < now,
+        Appointment.end_datetime <= now
+    )
+
+
+def complete_past_appointments(now: datetime = None, batch_size: int = 1000,
+                               max_batches: int = None):
+    """
+    Mark elapsed active appointments as completed in bounded batches
+
+    Each batch locks its rows (SKIP LOCKED on MySQL, so concurrent bookings
+    and cancellations are never blocked or overwritten), updates them with a
+    single set-based UPDATE and adjusts the daily stats in the same commit,
+    together with an 'updated' change-feed event per completed appointment
+    so event streams and delta-sync clients see the new status.
+
+    Args:
+        now: reference time (defaults to the current time)
+        batch_size: rows updated per transaction
+        max_batches: stop after this many batches (None = until done)
+
+    Returns:
+        Tuple of (rows completed, elapsed seconds)
+    """
+    now = now or datetime.now()
+    elapsed_filter = _elapsed_filter(now)
+    started = timer.perf_counter()
+
+    completed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(
+            select(Appointment.id).where(elapsed_filter).order_by(Appointment.id)
+            .limit(batch_size).with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            db.session.rollback()
+            break
+
+        stats_delta = new_stats_delta()
+        for appointment_date, service_id, count in db.session.query(
+            Appointment.date, Appointment.service_id, func.count(Appointment.id)
+        ).filter(Appointment.id.in_(ids)).group_by(Appointment.date, Appointment.service_id):
+            stats_delta[(appointment_date, service_id, 'completed_count')] += count
+
+        updated = Appointment.query.filter(
+            Appointment.id.in_(ids),
+            Appointment.status == 'active'
+        ).update({'status': 'completed'}, synchronize_session=False)
+        apply_stats_delta(stats_delta)
+
+        # Same payload as the update and cancel paths: the full appointment
+        for appointment in Appointment.query.filter(
+            Appointment.id.in_(ids),
+            Appointment.status == 'completed'
+        ).execution_options(populate_existing=True):
+            record_event('updated', appointment)
+        db.session.commit()
+
+        completed += updated
+        batches += 1
+
+        elapsed = timer.perf_counter() - started
+        logger.info(
+            f"Completed batch of {updated} appointments "
+            f"({completed} total, {completed / elapsed:.0f} rows/s)"
+        )
+
+    return completed, timer.perf_counter() - started
@@ -1,17 +1,65 @@
 """
 Email notification service for appointment booking
 """
-from flask_mail import Mail, Message
 from flask import current_app
 import logging
+import queue
+import threading
+
+from utils.health import register_gauge
 
-mail = Mail()
 logger = logging.getLogger(__name__)
 
+_mail = None
+
+# Emails queued by send_async, sent by one background thread per process
+_outbox = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+register_gauge('email_queue', _outbox.qsize)
+
 
-def init_mail(app):
-    """Initialize mail service with Flask app"""
-    mail.init_app(app)
+def get_mail():
+    """
+    Initialize Flask-Mail on first use
+
+    Importing and configuring it lazily keeps it out of application startup,
+    since most processes never send an email.
+    """
+    global _mail
+    if _mail is None:
+        from flask_mail import Mail
+        _mail = Mail(current_app._get_current_object())
+    return _mail
+
+
+def send_async(send, data):
+    """
+    Queue an email so the caller does not wait for SMTP
+
+    Args:
+        send: one of the send_* functions of this module
+        data: dict passed to it
+    """
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = threading.Thread(target=_send_queued, name='email-outbox', daemon=True)
+                _worker.start()
+    _outbox.put((current_app._get_current_object(), send, data))
+
+
+def _send_queued():
+    while True:
+        app, send, data = _outbox.get()
+        try:
+            with app.app_context():
+                send(data)
+        except Exception as e:
+            logger.error(f"Error sending queued email: {str(e)}")
+        finally:
+            _outbox.task_done()
 
 
 def send_appointment_confirmation(appointment_data):
@@ -52,12 +100,13 @@ def send_appointment_confirmation(appointment_data):
         logger.info(f"Body: {body}")
         
         # Uncomment when SMTP is configured
+        # from flask_mail import Message
         # msg = Message(
         #     subject,
         #     recipients=[appointment_data.get('email')],
         #     body=body
         # )
-        # mail.send(msg)
+        # get_mail().send(msg)
         
         return True
     except Exception as e:
@@ -145,3 +194,42 @@ def send_cancellation_confirmation(appointment_data):
     except Exception as e:
         logger.error(f"Error sending cancellation email: {str(e)}")
         return False
+
+
+def send_waitlist_offer(offer_data):
+    """
+    Tell a waitlisted client that a slot has become available
+    
+    Args:
+        offer_data: dict with client, date, time, service_name and email
+    """
+    try:
+        client_name = offer_data.get('client', 'Cliente')
+        date = offer_data.get('date', '')
+        time = offer_data.get('time', '')
+        service = offer_data.get('service_name', 'Servicio')
+        
+        subject = f'Horario Disponible - {date} {time}'
+        
+        body = f"""
+        Hola {client_name},
+        
+        Se ha liberado un horario que estabas esperando:
+        
+        📅 Fecha: {date}
+        🕐 Hora: {time}
+        💼 Servicio: {service}
+        
+        Resérvalo cuanto antes en nuestro sistema; el horario se asigna a quien reserve primero.
+        
+        ---
+        Sistema de Agendamiento APPO
+        """
+        
+        logger.info(f"Waitlist offer would be sent to: {client_name}")
+        logger.info(f"Subject: {subject}")
+        
+        return True
+    except Exception as e:
+        logger.error(f"Error sending waitlist offer email: {str(e)}")
+        return False
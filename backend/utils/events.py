@@ -0,0 +1,171 @@
+"""
+Server-sent change feed for appointment create/update/cancel events
+
+Event ids come from an auto-increment column, so they are assigned at
+insert time but become visible at commit time: a transaction holding id 7
+may commit after id 8 has already been streamed. Each stream therefore
+remembers the ids it skipped and looks for them again on every poll for
+EVENT_GAP_TIMEOUT_SECONDS; ids still missing after that belonged to a
+rolled-back transaction. Late events are sent with the stream's current
+cursor as their id so that the client's Last-Event-ID never moves back.
+"""
+import json
+import threading
+import time as timer
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+
+from models import db, AppointmentEvent
+from utils.health import register_gauge
+
+EVENT_BATCH_SIZE = 100
+
+# Skipped ids tracked per stream; a larger jump only tracks the newest ones
+MAX_TRACKED_GAPS = 1000
+
+# Wakes streams in this process as soon as a local write commits; streams
+# also poll the table so events committed by other workers are picked up.
+_new_events = threading.Condition()
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+register_gauge('event_streams_open', lambda: _open_streams)
+
+
+def record_event(event_type: str, appointment):
+    """
+    Add a change event for an appointment to the current session
+
+    The appointment must have been flushed (it needs an id). The event is
+    committed atomically with the change it describes.
+    """
+    db.session.add(AppointmentEvent(
+        event_type=event_type,
+        appointment_id=appointment.id,
+        payload=json.dumps(appointment.to_dict())
+    ))
+    db.session.info['events_recorded'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_streams(session):
+    if session.info.pop('events_recorded', False):
+        with _new_events:
+            _new_events.notify_all()
+
+
+def format_event(event_id: int, event_type: str, data: str) -> str:
+    """Format one server-sent event"""
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+
+
+def open_stream(limit: int) -> bool:
+    """
+    Reserve one of the limit stream slots of this process
+
+    Returns:
+        False if all slots are taken; otherwise the caller must call
+        close_stream once the response is closed
+    """
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= limit:
+            return False
+        _open_streams += 1
+        return True
+
+
+def close_stream():
+    """Release a slot taken by open_stream"""
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+
+def stream_events(last_event_id=None, max_seconds: int = 300, poll_interval: float = 2.0,
+                  gap_timeout: float = 30.0):
+    """
+    Generate server-sent events after last_event_id
+
+    Without a last_event_id the stream starts at the current end of the log.
+    If the requested id has already been purged, a 'reset' event tells the
+    client to reload its full list. The stream ends after max_seconds and
+    the browser's EventSource reconnects with Last-Event-ID. Ids skipped
+    while the stream is open are looked for again for gap_timeout seconds.
+    """
+    deadline = timer.monotonic() + max_seconds
+    # Skipped id -> monotonic time it was first found missing
+    gaps = {}
+
+    first_id, last_id = db.session.query(
+        func.min(AppointmentEvent.id), func.max(AppointmentEvent.id)
+    ).one()
+    db.session.rollback()
+
+    yield f'retry: {int(poll_interval * 1000)}\n\n'
+
+    if last_event_id is None:
+        last_event_id = last_id or 0
+    elif first_id is not None and last_event_id < first_id - 1:
+        yield format_event(last_id, 'reset', '{}')
+        last_event_id = last_id
+
+    while timer.monotonic() < deadline:
+        now = timer.monotonic()
+        for event_id in [i for i, seen in gaps.items() if now - seen > gap_timeout]:
+            del gaps[event_id]
+
+        late = []
+        if gaps:
+            late = [
+                (e.id, e.event_type, e.payload)
+                for e in AppointmentEvent.query.filter(
+                    AppointmentEvent.id.in_(sorted(gaps)[:EVENT_BATCH_SIZE])
+                ).order_by(AppointmentEvent.id)
+            ]
+        events = [
+            (e.id, e.event_type, e.payload)
+            for e in AppointmentEvent.query.filter(
+                AppointmentEvent.id > last_event_id
+            ).order_by(AppointmentEvent.id).limit(EVENT_BATCH_SIZE)
+        ]
+        # End the read transaction so the next poll sees newly committed rows
+        db.session.rollback()
+
+        for event_id, event_type, payload in late:
+            del gaps[event_id]
+            yield format_event(last_event_id, event_type, payload)
+
+        for event_id, event_type, payload in events:
+            for missing in range(max(last_event_id + 1, event_id - MAX_TRACKED_GAPS), event_id):
+                gaps[missing] = now
+            yield format_event(event_id, event_type, payload)
+            last_event_id = event_id
+
+        if len(gaps) > MAX_TRACKED_GAPS:
+            for event_id in sorted(gaps)[:len(gaps) - MAX_TRACKED_GAPS]:
+                del gaps[event_id]
+
+        if len(events) == EVENT_BATCH_SIZE:
+            continue
+
+        with _new_events:
+            notified = _new_events.wait(timeout=poll_interval)
+        if not notified and not events and not late:
+            yield ': keep-alive\n\n'
+
+
+def purge_events(older_than_hours: int) -> int:
+    """
+    Delete change events older than the retention window
+
+    Returns:
+        Number of events deleted
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    deleted = AppointmentEvent.query.filter(
+        AppointmentEvent.created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,59 @@
+"""
+Sparse field projection (?fields=...) for list endpoints
+"""
+from sqlalchemy.orm import joinedload, load_only
+
+from models import Service
+
+# Serialized fields that are not plain columns of the model
+RELATIONSHIP_FIELDS = {'service_name'}
+COMPUTED_FIELDS = {'archived'}
+
+
+def parse_fields(fields_arg, allowed):
+    """
+    Parse a comma-separated fields parameter
+
+    Args:
+        fields_arg: raw ?fields= value (None when absent)
+        allowed: serializer map of the model
+
+    Returns:
+        Tuple of (set of field names or None for all fields, error message)
+    """
+    if not fields_arg:
+        return None, None
+
+    fields = {name.strip() for name in fields_arg.split(',') if name.strip()}
+    unknown = fields - set(allowed)
+    if unknown:
+        return None, f"Unknown fields: {', '.join(sorted(unknown))}"
+
+    # The id is always returned so clients can key the rows
+    fields.add('id')
+    return fields, None
+
+
+def project_query(query, model, fields, extra_columns=()):
+    """
+    Restrict a query to the columns needed for the requested fields
+
+    service_name is loaded with a joined eager load of Service.name instead
+    of one lazy query per row.
+
+    Args:
+        query: query over model
+        model: mapped class
+        fields: set of field names (None leaves the query untouched)
+        extra_columns: column names needed by the caller, e.g. for cursors
+    """
+    if fields is None:
+        return query
+
+    column_names = (fields - RELATIONSHIP_FIELDS - COMPUTED_FIELDS) | set(extra_columns)
+    query = query.options(load_only(*[getattr(model, name) for name in column_names]))
+
+    if 'service_name' in fields:
+        query = query.options(joinedload(model.service).load_only(Service.name))
+
+    return query
@@ -0,0 +1,115 @@
+"""
+Liveness/readiness state: cached database ping, pool usage and queue depths
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import text
+
+from utils.sqlite import READ_ONLY_OPTION
+
+logger = logging.getLogger(__name__)
+
+# name -> callable returning the current depth of an in-process queue
+_gauges = {}
+
+
+def register_gauge(name: str, read):
+    """Expose an in-process queue depth (or similar counter) in /readyz"""
+    _gauges[name] = read
+
+
+class DatabaseProbe:
+    """
+    Pings the database from a background thread and caches the result
+
+    /readyz only reads the cached state, so it answers in microseconds and
+    never competes with requests for a pool connection.
+    """
+
+    def __init__(self, app, engine_getter, interval: float):
+        self._app = app
+        self._engine_getter = engine_getter
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self.ok = False
+        self.error = None
+        self.latency_ms = None
+        self.checked_at = None
+
+    def ping(self):
+        started = time.perf_counter()
+        try:
+            with self._app.app_context():
+                with self._engine_getter().connect() as connection:
+                    # Never waits for the SQLite write lock (see utils.sqlite)
+                    connection.execution_options(**{READ_ONLY_OPTION: True})
+                    connection.execute(text('SELECT 1'))
+            self.ok, self.error = True, None
+        except Exception as e:
+            self.ok, self.error = False, str(e)
+            logger.warning(f"Readiness ping failed: {str(e)}")
+        self.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.checked_at = time.time()
+
+    def ensure_running(self):
+        """Start the background pinger on first use (after any worker fork)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self.ping()
+                self._thread = threading.Thread(target=self._run, name='db-probe', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            self.ping()
+
+    def is_stale(self) -> bool:
+        return self.checked_at is None or time.time() - self.checked_at > 3 * self._interval
+
+
+def pool_status(engine) -> dict:
+    """Checked-out/overflow counts of a QueuePool (other pool types report what they have)"""
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    max_overflow = getattr(pool, '_max_overflow', None)
+    if max_overflow is not None and 'size' in status:
+        status['max_overflow'] = max_overflow
+        status['saturated'] = (
+            max_overflow >= 0 and status['checkedout'] >= status['size'] + max_overflow
+        )
+    return status
+
+
+def readiness_report(probe: DatabaseProbe, engine) -> dict:
+    """
+    Build the /readyz payload from in-memory state
+
+    Not ready when the last ping failed or is stale, or when the connection
+    pool is saturated, so load balancers drain the instance.
+    """
+    pool = pool_status(engine)
+    database = {
+        'ok': probe.ok,
+        'latency_ms': probe.latency_ms,
+        'checked_at': probe.checked_at,
+        'error': probe.error
+    }
+    queues = {name: read() for name, read in _gauges.items()}
+    ready = probe.ok and not probe.is_stale() and not pool.get('saturated', False)
+
+    return {
+        'ready': ready,
+        'database': database,
+        'pool': pool,
+        'queues': queues
+    }
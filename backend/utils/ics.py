@@ -0,0 +1,354 @@
+"""
+iCalendar (RFC 5545) subscription feeds of appointments
+
+Calendar apps poll feed URLs every few minutes, so a feed is answered in
+two steps: feed_validators() computes the ETag/Last-Modified from a couple
+of index lookups, which is all a 304 costs, and only a changed feed is
+rendered by stream_calendar(), which streams VEVENTs from a windowed query.
+
+Recurring series are sent as one VEVENT with an RRULE (plus EXDATEs for
+occurrences that were skipped, cancelled or moved) instead of one VEVENT
+per child appointment. Times are floating local times, as stored.
+"""
+import hashlib
+import hmac
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy import func, or_
+
+from models import db, Appointment, AppointmentArchive, RecurrenceRule, Service
+from utils.recurrence import RecurrencePattern
+
+# Legacy Appointment.recurrence values expressible as an RRULE
+RRULE_FREQUENCIES = {'weekly': 'WEEKLY', 'monthly': 'MONTHLY'}
+
+# Appointment.recurrence of series created from a stored RecurrenceRule
+RULE_RECURRENCE = 'rule'
+
+# Parent ids looked up per query when loading series
+PARENT_BATCH_SIZE = 500
+
+STREAM_BATCH_SIZE = 500
+
+PRODID = '-//Appo//Appointments//ES'
+
+
+def client_feed_token(client_id: int, secret: str) -> str:
+    """Unguessable token of a client's feed URL, derived from SECRET_KEY"""
+    return hmac.new(secret.encode(), f'client-feed:{client_id}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def verify_client_feed_token(client_id: int, token: str, secret: str) -> bool:
+    return bool(token) and hmac.compare_digest(token, client_feed_token(client_id, secret))
+
+
+def feed_window(past_days: int, future_days: int, today: date = None):
+    """(first date, last date) covered by a feed"""
+    today = today or date.today()
+    return today - timedelta(days=past_days), today + timedelta(days=future_days)
+
+
+def _scope_filters(client_id=None, service_id=None) -> list:
+    filters = []
+    if client_id is not None:
+        filters.append(Appointment.client_id == client_id)
+    if service_id is not None:
+        filters.append(Appointment.service_id == service_id)
+    return filters
+
+
+def feed_validators(window, client_id=None, service_id=None):
+    """
+    ETag and Last-Modified of a feed, without reading the feed's rows
+
+    The latest updated_at is taken from the ix_appointments_updated_at
+    index (from the client's rows for a client feed) and the row count of
+    the window from the date or client_id index; the count catches rows
+    that were archived. Service feeds use the global latest change, which
+    only makes them revalidate a little more often.
+
+    Last-Modified is at least the start of today, because the window moves
+    once a day.
+
+    Returns:
+        Tuple of (etag, last_modified)
+    """
+    window_start, window_end = window
+
+    changed_query = db.session.query(func.max(Appointment.updated_at))
+    if client_id is not None:
+        changed_query = changed_query.filter(Appointment.client_id == client_id)
+    last_changed = changed_query.scalar()
+    last_archived = db.session.query(func.max(AppointmentArchive.archived_at)).scalar()
+
+    count = db.session.query(func.count(Appointment.id)).filter(
+        Appointment.date >= window_start,
+        Appointment.date <= window_end,
+        *_scope_filters(client_id, service_id)
+    ).scalar()
+
+    last_modified = max(
+        value for value in (last_changed, last_archived, datetime.combine(date.today(), time()))
+        if value is not None
+    )
+
+    key = f'{client_id}|{service_id}|{window_start}|{window_end}|{last_changed}|{last_archived}|{count}'
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    return etag, last_modified.replace(microsecond=0)
+
+
+# ----------------------------------------------------------------------
+# Formatting
+# ----------------------------------------------------------------------
+
+def escape_text(value) -> str:
+    """Escape a TEXT property value"""
+    return (str(value or '')
+            .replace('\\', '\\\\')
+            .replace(';', '\\;')
+            .replace(',', '\\,')
+            .replace('\r\n', '\\n')
+            .replace('\n', '\\n'))
+
+
+def fold_line(line: str) -> str:
+    """Fold a content line to 75 octets per physical line, ending with CRLF"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    parts = []
+    current = ''
+    limit = 75
+    for char in line:
+        if len((current + char).encode('utf-8')) > limit:
+            parts.append(current)
+            current = char
+            limit = 74  # continuation lines start with a space
+        else:
+            current += char
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_local(day: date, at: time) -> str:
+    return datetime.combine(day, at).strftime('%Y%m%dT%H%M%S')
+
+
+def format_utc(moment: datetime) -> str:
+    return (moment or datetime.utcnow()).strftime('%Y%m%dT%H%M%SZ')
+
+
+def vevent(appointment, service, uid_domain: str, for_client: bool, start_date: date = None,
+           rrule=None, exdates=(), dtstamp=None) -> str:
+    """
+    Render an appointment as a VEVENT
+
+    For a series, start_date is the first occurrence sent and rrule/exdates
+    describe the following ones.
+    """
+    start_date = start_date or appointment.date
+    if appointment.end_datetime:
+        # The window booked, even if the service duration changed since
+        duration = appointment.end_datetime - appointment.start_datetime
+    else:
+        duration = timedelta(minutes=(service.duration if service else None) or 60)
+    start = datetime.combine(start_date, appointment.time)
+    service_name = service.name if service else 'Cita'
+
+    if for_client:
+        summary = service_name
+        description = ''
+    else:
+        summary = f'{service_name} - {appointment.client}'
+        description = '\n'.join(part for part in (appointment.phone, appointment.notes) if part)
+
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{appointment.id}@{uid_domain}',
+        f'DTSTAMP:{format_utc(dtstamp or appointment.updated_at)}',
+        f'DTSTART:{format_local(start_date, appointment.time)}',
+        f'DTEND:{(start + duration).strftime("%Y%m%dT%H%M%S")}',
+        f'SUMMARY:{escape_text(summary)}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{escape_text(description)}')
+    if rrule:
+        lines.append(f'RRULE:{rrule}')
+    if exdates:
+        lines.append('EXDATE:' + ','.join(format_local(day, appointment.time) for day in exdates))
+    lines += ['STATUS:CONFIRMED', 'END:VEVENT']
+    return ''.join(fold_line(line) for line in lines)
+
+
+# ----------------------------------------------------------------------
+# Series
+# ----------------------------------------------------------------------
+
+def _expressible(parent) -> bool:
+    """
+    Whether a parent's legacy recurrence matches an RRULE exactly
+
+    Monthly series starting after the 28th are clamped to the end of
+    shorter months, which an RRULE cannot express; their occurrences are
+    sent one by one.
+    """
+    if parent.recurrence not in RRULE_FREQUENCIES or not parent.recurrence_end:
+        return False
+    return parent.recurrence != 'monthly' or parent.date.day <= 28
+
+
+def _load_parents(parent_ids) -> dict:
+    parents = {}
+    parent_ids = sorted(parent_ids)
+    for start in range(0, len(parent_ids), PARENT_BATCH_SIZE):
+        batch = parent_ids[start:start + PARENT_BATCH_SIZE]
+        for parent in Appointment.query.filter(Appointment.id.in_(batch)):
+            parents[parent.id] = parent
+    return parents
+
+
+def _load_rules(parent_ids) -> dict:
+    rules = {}
+    parent_ids = sorted(parent_ids)
+    for start in range(0, len(parent_ids), PARENT_BATCH_SIZE):
+        batch = parent_ids[start:start + PARENT_BATCH_SIZE]
+        for rule in RecurrenceRule.query.filter(RecurrenceRule.appointment_id.in_(batch)):
+            rules[rule.appointment_id] = rule
+    return rules
+
+
+def _series_rule(parent, rule):
+    """
+    (RecurrencePattern, RRULE without UNTIL) of a parent's series, or None
+
+    Legacy series use their recurrence column, 'rule' series their stored
+    RecurrenceRule. Rules whose dates are clamped to the end of a shorter
+    month (monthly without by_day after the 28th, yearly from February 29)
+    cannot be expressed as an RRULE, like legacy monthly ones.
+    """
+    if parent.recurrence != RULE_RECURRENCE:
+        if not _expressible(parent):
+            return None
+        pattern = RecurrencePattern.from_legacy(parent.date, parent.recurrence, parent.recurrence_end)
+        return pattern, f'FREQ={RRULE_FREQUENCIES[parent.recurrence]}'
+
+    if rule is None:
+        return None
+    if rule.frequency == 'monthly' and not rule.by_day and parent.date.day > 28:
+        return None
+    if rule.frequency == 'yearly' and (parent.date.month, parent.date.day) == (2, 29):
+        return None
+
+    parts = [f'FREQ={rule.frequency.upper()}']
+    if (rule.interval or 1) > 1:
+        parts.append(f'INTERVAL={rule.interval}')
+    if rule.by_day:
+        by_day = [item for item in rule.by_day.upper().replace(' ', '').split(',') if item]
+        parts.append('BYDAY=' + ','.join(by_day))
+    return RecurrencePattern.from_rule(rule, parent.date), ';'.join(parts)
+
+
+def collapse_series(window, filters):
+    """
+    Find the recurring series of the window that can be sent as RRULEs
+
+    Only the light columns of series members in the window are read. A
+    member is covered by its series' RRULE when it is on a date of the
+    pattern, at the series' time and service, and not cancelled; the
+    pattern dates in between without such a member become EXDATEs. The
+    RRULE starts at the first covered date in the window and ends at the
+    last one, so nothing outside the window is needed.
+
+    Returns:
+        Tuple of (list of (parent, dtstart, rrule, exdates, dtstamp), set of covered ids)
+    """
+    window_start, window_end = window
+    members = db.session.query(
+        Appointment.id, Appointment.date, Appointment.time, Appointment.service_id,
+        Appointment.status, Appointment.parent_appointment_id, Appointment.updated_at
+    ).filter(
+        Appointment.date >= window_start,
+        Appointment.date <= window_end,
+        or_(Appointment.parent_appointment_id.isnot(None),
+            Appointment.recurrence.in_([*RRULE_FREQUENCIES, RULE_RECURRENCE])),
+        *filters
+    ).all()
+
+    by_series = {}
+    for member in members:
+        by_series.setdefault(member.parent_appointment_id or member.id, []).append(member)
+
+    series = []
+    covered = set()
+    parents = _load_parents(by_series)
+    rules = _load_rules([p.id for p in parents.values() if p.recurrence == RULE_RECURRENCE])
+    for parent in parents.values():
+        series_rule = _series_rule(parent, rules.get(parent.id))
+        if series_rule is None:
+            continue
+        pattern, rrule_prefix = series_rule
+
+        until = min(parent.recurrence_end, window_end) if parent.recurrence_end else window_end
+        pattern_dates = set(pattern.between(window_start, until))
+
+        matching = {}
+        for member in by_series[parent.id]:
+            if (member.date in pattern_dates and member.date not in matching
+                    and member.status != 'cancelled' and member.time == parent.time
+                    and member.service_id == parent.service_id):
+                matching[member.date] = member
+        if not matching:
+            continue
+
+        first, last = min(matching), max(matching)
+        exdates = sorted(day for day in pattern_dates if first < day < last and day not in matching)
+        rrule = f'{rrule_prefix};UNTIL={format_local(last, parent.time)}'
+        dtstamp = max(member.updated_at for member in matching.values() if member.updated_at)
+
+        series.append((parent, first, rrule, exdates, dtstamp))
+        covered.update(member.id for member in matching.values())
+
+    return series, covered
+
+
+# ----------------------------------------------------------------------
+# Feed
+# ----------------------------------------------------------------------
+
+def stream_calendar(name: str, window, uid_domain: str, client_id=None, service_id=None):
+    """
+    Generate the iCalendar text of a feed
+
+    Series are collapsed first; the remaining appointments of the window
+    are then streamed in date order in batches of STREAM_BATCH_SIZE.
+    """
+    window_start, window_end = window
+    filters = _scope_filters(client_id, service_id)
+    for_client = client_id is not None
+    services = {service.id: service for service in Service.query.all()}
+
+    yield ''.join(fold_line(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ))
+
+    series, covered = collapse_series(window, filters)
+    for parent, first, rrule, exdates, dtstamp in series:
+        yield vevent(parent, services.get(parent.service_id), uid_domain, for_client,
+                     start_date=first, rrule=rrule, exdates=exdates, dtstamp=dtstamp)
+
+    appointments = Appointment.query.filter(
+        Appointment.date >= window_start,
+        Appointment.date <= window_end,
+        Appointment.status != 'cancelled',
+        *filters
+    ).order_by(Appointment.date, Appointment.time, Appointment.id).yield_per(STREAM_BATCH_SIZE)
+    for appointment in appointments:
+        if appointment.id not in covered:
+            yield vevent(appointment, services.get(appointment.service_id), uid_domain, for_client)
+
+    yield fold_line('END:VCALENDAR')
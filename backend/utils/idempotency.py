@@ -0,0 +1,105 @@
+"""
+Idempotency-Key support: stored responses for retried write requests
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app, request
+
+from models import db, IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 128
+
+
+def request_fingerprint() -> str:
+    """Hash the raw request body so a reused key with a different payload can be rejected"""
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def get_idempotency_key():
+    """Return the Idempotency-Key header of the current request, or None"""
+    key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    return key[:MAX_KEY_LENGTH] or None
+
+
+def find_stored_response(route: str, key: str):
+    """
+    Look up the stored response for a key
+
+    Expired entries are deleted on sight so the key can be reused. The
+    delete is only flushed: it is committed with the caller's transaction,
+    so a lookup never commits the earlier operations of a batch.
+
+    Returns:
+        IdempotencyKey row, or None if the key is unknown or expired
+    """
+    stored = IdempotencyKey.query.filter_by(route=route, key=key).first()
+    if stored and stored.expires_at <= datetime.utcnow():
+        db.session.delete(stored)
+        db.session.flush()
+        return None
+    return stored
+
+
+def is_key_conflict(error) -> bool:
+    """Whether an IntegrityError comes from a duplicate idempotency key"""
+    message = str(getattr(error, 'orig', error))
+    return 'uq_idempotency_keys_route_key' in message or f'{IdempotencyKey.__tablename__}.' in message
+
+
+def replay_response(stored: IdempotencyKey, fingerprint: str):
+    """Build the Flask response for a retried request"""
+    if stored.request_hash != fingerprint:
+        body = json.dumps({
+            'success': False,
+            'error': f'{IDEMPOTENCY_HEADER} was already used with a different request'
+        })
+        return current_app.response_class(body, status=422, mimetype='application/json')
+
+    response = current_app.response_class(
+        stored.response_body, status=stored.status_code, mimetype='application/json'
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def store_response(route: str, key: str, fingerprint: str, status_code: int, body: dict):
+    """
+    Add the response for a key to the current session
+
+    The caller commits it together with the write it describes, so either
+    both the appointment and its stored response exist or neither does.
+    """
+    ttl = timedelta(seconds=current_app.config['IDEMPOTENCY_TTL_SECONDS'])
+    db.session.add(IdempotencyKey(
+        key=key,
+        route=route,
+        request_hash=fingerprint,
+        status_code=status_code,
+        response_body=json.dumps(body),
+        expires_at=datetime.utcnow() + ttl
+    ))
+
+
+def purge_expired_keys(batch_size: int = 1000) -> int:
+    """
+    Delete expired idempotency keys in batches
+
+    Returns:
+        Number of keys deleted
+    """
+    purged = 0
+    while True:
+        ids = [row.id for row in IdempotencyKey.query.with_entities(IdempotencyKey.id).filter(
+            IdempotencyKey.expires_at <= datetime.utcnow()
+        ).limit(batch_size)]
+        if not ids:
+            break
+
+        IdempotencyKey.query.filter(IdempotencyKey.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        purged += len(ids)
+
+    return purged
@@ -0,0 +1,282 @@
+"""
+Schema migrations for databases created by an older SCHEMA_VERSION
+
+db.create_all() creates missing tables (with their indexes) but never
+alters an existing one. Each migration brings a database up to its
+version; init_db.py runs the pending ones in order after create_all.
+Migrations are idempotent, so re-running one is harmless.
+"""
+import logging
+
+from sqlalchemy import insert, inspect, select, text, update
+
+from models import db, Appointment, AppointmentArchive, Client, RecurrenceRule, Service, WaitlistEntry
+from utils.validators import booking_window, normalize_name, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(model, *names):
+    """
+    ALTER TABLE ... ADD COLUMN for model columns the table does not have yet
+
+    Only the column and its type are added (no constraints), which every
+    backend supports on a populated table.
+    """
+    table = model.__table__
+    # Inspected on the session's connection: a second connection could wait
+    # for the write lock held by the session itself on SQLite
+    existing = {column['name'] for column in inspect(db.session.connection()).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            continue
+        column = table.columns[name]
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {column_type}'))
+        logger.info(f"Added column {table.name}.{name}")
+    db.session.commit()
+
+
+def create_missing_indexes(model, *names):
+    """Create the named indexes of the model if they do not exist yet"""
+    for index in model.__table__.indexes:
+        if index.name in names:
+            index.create(bind=db.session.connection(), checkfirst=True)
+    db.session.commit()
+
+
+def backfill_search_keys(batch_size: int = 1000) -> int:
+    """
+    Fill Appointment.client_search/phone_digits for rows created before they existed
+
+    Walks the table in primary-key order, one transaction per batch, and
+    keeps updated_at unchanged so delta-sync clients do not refetch
+    every row.
+
+    Returns:
+        Number of rows updated
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            select(Appointment.id, Appointment.client, Appointment.phone, Appointment.updated_at)
+            .where(Appointment.id > last_id, Appointment.client_search.is_(None))
+            .order_by(Appointment.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        db.session.execute(update(Appointment), [
+            {
+                'id': row.id,
+                'client_search': normalize_name(row.client),
+                'phone_digits': normalize_phone(row.phone),
+                'updated_at': row.updated_at
+            }
+            for row in rows
+        ])
+        db.session.commit()
+
+        last_id = rows[-1].id
+        updated += len(rows)
+        logger.info(f"Backfilled search keys for {updated} appointments")
+
+    return updated
+
+
+def backfill_client_ids(model, batch_size: int = 1000) -> int:
+    """
+    Link rows of model (appointments or their archive) to clients by phone
+
+    Per batch, the clients of all phones in the batch are read with one
+    query, the missing ones inserted in bulk, and client_id is set on the
+    rows by primary key, leaving updated_at unchanged.
+
+    Returns:
+        Number of rows updated
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            select(model.id, model.client, model.phone, model.updated_at)
+            .where(model.id > last_id, model.client_id.is_(None))
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        names = {}
+        for row in rows:
+            names.setdefault(normalize_phone(row.phone), row.client)
+
+        client_ids = dict(db.session.execute(
+            select(Client.phone, Client.id).where(Client.phone.in_(names))
+        ).all())
+        missing = [{'phone': phone, 'name': name} for phone, name in names.items() if phone not in client_ids]
+        if missing:
+            db.session.execute(insert(Client), missing)
+            client_ids.update(db.session.execute(
+                select(Client.phone, Client.id).where(Client.phone.in_([c['phone'] for c in missing]))
+            ).all())
+
+        db.session.execute(update(model), [
+            {
+                'id': row.id,
+                'client_id': client_ids[normalize_phone(row.phone)],
+                'updated_at': row.updated_at
+            }
+            for row in rows
+        ])
+        db.session.commit()
+
+        last_id = rows[-1].id
+        updated += len(rows)
+        logger.info(f"Linked {updated} rows of {model.__tablename__} to clients")
+
+    return updated
+
+
+def backfill_booking_windows(batch_size: int = 1000) -> int:
+    """
+    Fill Appointment.start_datetime/end_datetime for rows created before they existed
+
+    The end uses each service's current duration, the best information
+    available for old rows; updated_at is left unchanged.
+
+    Returns:
+        Number of rows updated
+    """
+    durations = dict(db.session.execute(select(Service.id, Service.duration)).all())
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            select(Appointment.id, Appointment.date, Appointment.time, Appointment.service_id,
+                   Appointment.updated_at)
+            .where(Appointment.id > last_id, Appointment.end_datetime.is_(None))
+            .order_by(Appointment.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for row in rows:
+            start, end = booking_window(row.date, row.time, durations.get(row.service_id))
+            params.append({'id': row.id, 'start_datetime': start, 'end_datetime': end,
+                           'updated_at': row.updated_at})
+        db.session.execute(update(Appointment), params)
+        db.session.commit()
+
+        last_id = rows[-1].id
+        updated += len(rows)
+        logger.info(f"Backfilled booking windows for {updated} appointments")
+
+    return updated
+
+
+def backfill_prices(model, batch_size: int = 1000) -> int:
+    """
+    Fill the booking-time price of rows of model created before it was stored
+
+    The current service price is the best information available for old
+    rows; updated_at is left unchanged.
+
+    Returns:
+        Number of rows updated
+    """
+    prices = dict(db.session.execute(select(Service.id, Service.price)).all())
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.session.execute(
+            select(model.id, model.service_id, model.updated_at)
+            .where(model.id > last_id, model.price.is_(None))
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        db.session.execute(update(model), [
+            {'id': row.id, 'price': prices.get(row.service_id) or 0.0, 'updated_at': row.updated_at}
+            for row in rows
+        ])
+        db.session.commit()
+
+        last_id = rows[-1].id
+        updated += len(rows)
+        logger.info(f"Backfilled prices for {updated} rows of {model.__tablename__}")
+
+    return updated
+
+
+def migrate_appointment_search_keys():
+    add_missing_columns(Appointment, 'client_search', 'phone_digits')
+    create_missing_indexes(Appointment, 'ix_appointments_client_search', 'ix_appointments_phone_digits')
+    backfill_search_keys()
+
+
+def migrate_clients():
+    for model in (Appointment, AppointmentArchive):
+        add_missing_columns(model, 'client_id')
+        create_missing_indexes(model, 'ix_appointments_client_id', 'ix_appointments_archive_client_id')
+        backfill_client_ids(model)
+
+
+def migrate_service_capacity():
+    add_missing_columns(Service, 'capacity')
+    db.session.execute(update(Service).where(Service.capacity.is_(None)).values(capacity=1))
+    db.session.commit()
+
+
+def migrate_booking_windows():
+    add_missing_columns(Appointment, 'start_datetime', 'end_datetime')
+    create_missing_indexes(Appointment, 'ix_appointments_window')
+    backfill_booking_windows()
+
+
+def migrate_appointment_prices():
+    for model in (Appointment, AppointmentArchive):
+        add_missing_columns(model, 'price')
+        backfill_prices(model)
+
+
+def migrate_archive_reference_indexes():
+    create_missing_indexes(WaitlistEntry, 'ix_waitlist_appointment_id')
+    create_missing_indexes(RecurrenceRule, 'ix_recurrence_rules_appointment_id')
+
+
+def migrate_appointment_query_indexes():
+    create_missing_indexes(Appointment, 'ix_appointments_date_status', 'ix_appointments_updated_at')
+
+
+# (schema version, migration) in ascending order
+MIGRATIONS = [
+    (2, migrate_appointment_search_keys),
+    (3, migrate_clients),
+    (4, migrate_service_capacity),
+    (7, migrate_booking_windows),
+    (8, migrate_appointment_prices),
+    (9, migrate_archive_reference_indexes),
+    (10, migrate_appointment_query_indexes),
+]
+
+
+def run_migrations(from_version) -> list:
+    """
+    Run the migrations newer than from_version (None = unknown, run all)
+
+    Returns:
+        Versions that were applied
+    """
+    applied = []
+    for version, migration in MIGRATIONS:
+        if from_version is None or version > from_version:
+            migration()
+            applied.append(version)
+    return applied
@@ -0,0 +1,207 @@
+"""
+On-demand profiling of individual API requests
+
+A request is profiled when it carries the X-Profile header with the
+configured PROFILE_TOKEN, or when it is picked by PROFILE_SAMPLE_RATE.
+Each profile is written to PROFILE_DIR as a cProfile .prof file (open it
+with `python -m pstats` or snakeviz) next to a .json file with the route,
+status, timing and SQL query count. Only the newest PROFILE_KEEP profiles
+are kept.
+
+Only one request is profiled at a time per process: a deterministic
+profiler can only be enabled once (on Python 3.12+ cProfile is built on
+sys.monitoring and a second enable() fails), and while it runs it also
+sees the work of other threads. Requests arriving meanwhile are not
+profiled (header requests get "X-Profile-Skipped: busy").
+
+When neither the token nor a sample rate is configured no hook is
+installed, so disabled profiling costs nothing per request.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+# Query counters of the request being profiled on each thread
+_active = threading.local()
+
+# Held while a request is being profiled
+_profiler_lock = threading.Lock()
+
+
+class QueryStats:
+    """Number and total duration of the SQL statements of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._started = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_active, 'stats', None)
+    if stats is not None:
+        stats._started.append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = getattr(_active, 'stats', None)
+    if stats is not None and stats._started:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - stats._started.pop()
+
+
+def should_profile(token: str, sample_rate: float) -> str:
+    """
+    Decide whether the current request is profiled
+
+    Returns:
+        'header', 'sampled' or '' (not profiled)
+    """
+    if not request.path.startswith('/api/'):
+        return ''
+    supplied = request.headers.get(PROFILE_HEADER)
+    if supplied and token and hmac.compare_digest(supplied, token):
+        return 'header'
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    return ''
+
+
+def rotate_profiles(directory: str, keep: int):
+    """Delete all but the newest keep profiles (and their .json files)"""
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith('.prof'))
+    for name in profiles[:max(len(profiles) - keep, 0)]:
+        base = os.path.join(directory, name[:-len('.prof')])
+        for path in (base + '.prof', base + '.json'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def write_profile(directory: str, keep: int, profiler, annotations: dict) -> str:
+    """
+    Save a profile and its annotations, then rotate the directory
+
+    File names start with a UTC timestamp so they sort by age.
+
+    Returns:
+        Path of the .prof file
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    endpoint = (annotations['endpoint'] or 'unknown').replace('.', '_')
+    base = os.path.join(
+        directory,
+        f"{stamp}-{annotations['method']}-{endpoint}-{annotations['elapsed_ms']:.0f}ms"
+    )
+
+    profiler.dump_stats(base + '.prof')
+    with open(base + '.json', 'w') as f:
+        json.dump(annotations, f, indent=2)
+
+    rotate_profiles(directory, keep)
+    return base + '.prof'
+
+
+def init_profiling(app):
+    """Install the profiling hooks when a token or sample rate is configured"""
+    token = app.config['PROFILE_TOKEN']
+    sample_rate = app.config['PROFILE_SAMPLE_RATE']
+    if not token and sample_rate <= 0:
+        return
+
+    directory = app.config['PROFILE_DIR']
+    keep = app.config['PROFILE_KEEP']
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        reason = should_profile(token, sample_rate)
+        if not reason:
+            return None
+
+        if not _profiler_lock.acquire(blocking=False):
+            if reason == 'header':
+                g.profile_skipped = 'busy'
+            return None
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except (ValueError, RuntimeError) as e:
+            # Another profiling tool (e.g. a debugger or coverage) is active
+            _profiler_lock.release()
+            logger.warning(f"Request profiling skipped: {str(e)}")
+            if reason == 'header':
+                g.profile_skipped = 'unavailable'
+            return None
+
+        _active.stats = QueryStats()
+        g.profile = {
+            'owner': id(request._get_current_object()),
+            'reason': reason,
+            'profiler': profiler,
+            'started': time.perf_counter()
+        }
+        return None
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.get('profile')
+        if not profile or profile['owner'] != id(request._get_current_object()):
+            if g.get('profile_skipped'):
+                response.headers['X-Profile-Skipped'] = g.profile_skipped
+            return response
+
+        profile['profiler'].disable()
+        elapsed = time.perf_counter() - profile['started']
+        stats = _active.stats
+        annotations = {
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'reason': profile['reason'],
+            'elapsed_ms': round(elapsed * 1000, 2),
+            'query_count': stats.count,
+            'query_ms': round(stats.seconds * 1000, 2),
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+        try:
+            path = write_profile(directory, keep, profile['profiler'], annotations)
+            response.headers['X-Profile-File'] = os.path.basename(path)
+        except OSError as e:
+            logger.error(f"Error writing profile: {str(e)}")
+        return response
+
+    @app.teardown_request
+    def stop_profile(exc):
+        # Nested request contexts (batch operations) share g; only the
+        # request that started the profiler stops it
+        profile = g.get('profile')
+        if profile and profile['owner'] == id(request._get_current_object()):
+            g.pop('profile')
+            profile['profiler'].disable()
+            _active.stats = None
+            _profiler_lock.release()
+
+    logger.info(f"Request profiling enabled (sample rate {sample_rate}, writing to {directory})")
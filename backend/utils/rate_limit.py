@@ -0,0 +1,244 @@
+"""
+Admission control: token-bucket rate limiting and a write concurrency cap
+"""
+import logging
+import math
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+
+from utils.health import register_gauge
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+
+def parse_limit(limit: str):
+    """
+    Parse a limit string such as '120/minute'
+
+    Returns:
+        Tuple of (capacity, refill rate in tokens per second)
+    """
+    amount, _, period = limit.partition('/')
+    capacity = int(amount)
+    return capacity, capacity / PERIODS[period.strip() or 'second']
+
+
+class MemoryBucketStore:
+    """
+    Per-process token buckets (each worker enforces its own share)
+
+    Each bucket keeps the time its route's limit takes to refill it
+    completely, so pruning drops a bucket only once it is full again under
+    its own limit, whichever route triggered the prune.
+    """
+
+    MAX_BUCKETS = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float):
+        """
+        Take one token from a bucket
+
+        Returns:
+            Tuple of (allowed, seconds until a token is available)
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, None))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if len(self._buckets) >= self.MAX_BUCKETS and key not in self._buckets:
+                self._prune(now)
+            self._buckets[key] = (tokens, now, capacity / rate)
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        """Drop buckets idle long enough to have refilled completely"""
+        for key, (_, updated, refill_seconds) in list(self._buckets.items()):
+            if now - updated >= refill_seconds:
+                del self._buckets[key]
+
+
+class SqliteBucketStore:
+    """
+    Token buckets in a local SQLite file shared by all workers on one host
+
+    Stands in for a shared counter service without external dependencies;
+    BEGIN IMMEDIATE serializes the read-modify-write across processes.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = sqlite3.connect(self._path, timeout=1, isolation_level=None)
+        return self._local.connection
+
+    def take(self, key: str, capacity: int, rate: float):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            connection.execute(
+                'INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class RedisBucketStore:
+    """Token buckets in Redis, updated atomically with a Lua script"""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('RATE_LIMIT_STORAGE_URI uses redis but the redis package is not installed') from e
+        self._script = redis.Redis.from_url(url).register_script(self.SCRIPT)
+
+    def take(self, key: str, capacity: int, rate: float):
+        allowed, tokens = self._script(keys=[f'ratelimit:{key}'], args=[capacity, rate, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0 if allowed else (1 - tokens) / rate
+
+
+def create_bucket_store(uri: str):
+    """Create the bucket store for RATE_LIMIT_STORAGE_URI ('' = in-process)"""
+    if not uri:
+        return MemoryBucketStore()
+    if uri.startswith('sqlite:///'):
+        return SqliteBucketStore(uri[len('sqlite:///'):])
+    if uri.startswith(('redis://', 'rediss://')):
+        return RedisBucketStore(uri)
+    raise ValueError(f'Unsupported RATE_LIMIT_STORAGE_URI: {uri}')
+
+
+def too_many_requests(retry_after: float, message: str = 'Too many requests'):
+    """Fast 429 response with a Retry-After header"""
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limit(config_key: str):
+    """
+    Limit a view per client IP with the token bucket configured in config_key
+
+    Example:
+        @rate_limit('RATE_LIMIT_SLOTS')  # RATE_LIMIT_SLOTS = '120/minute'
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            store = get_bucket_store(current_app)
+            if store is not None:
+                capacity, rate = parse_limit(current_app.config[config_key])
+                key = f'{request.endpoint}:{request.remote_addr}'
+                try:
+                    allowed, retry_after = store.take(key, capacity, rate)
+                except Exception as e:
+                    # Fail open: a broken counter backend must not take the API down
+                    logger.error(f"Rate limit store error: {str(e)}")
+                    allowed, retry_after = True, 0
+                if not allowed:
+                    return too_many_requests(retry_after)
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+_store_lock = threading.Lock()
+
+
+def get_bucket_store(app):
+    """Return the app's bucket store, creating it on first use (None when disabled)"""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return None
+
+    store = app.extensions.get('rate_limit_store')
+    if store is None:
+        with _store_lock:
+            store = app.extensions.get('rate_limit_store')
+            if store is None:
+                store = create_bucket_store(app.config['RATE_LIMIT_STORAGE_URI'])
+                app.extensions['rate_limit_store'] = store
+    return store
+
+
+def init_rate_limiting(app):
+    """Set up the per-process concurrency cap on write endpoints (buckets are created lazily)"""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return
+
+    write_limit = app.config['WRITE_CONCURRENCY_LIMIT']
+    write_slots = threading.BoundedSemaphore(write_limit)
+    register_gauge('write_requests_in_flight', lambda: write_limit - write_slots._value)
+
+    @app.before_request
+    def admit_write_request():
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or not request.path.startswith('/api/'):
+            return None
+        if not write_slots.acquire(blocking=False):
+            return too_many_requests(1, 'Server busy, please retry')
+        g.write_slot_owner = id(request._get_current_object())
+        return None
+
+    @app.teardown_request
+    def release_write_slot(exc):
+        # Only the request that took the slot releases it (nested request
+        # contexts, e.g. batch operations, share the same g)
+        if g.get('write_slot_owner') == id(request._get_current_object()):
+            g.pop('write_slot_owner')
+            write_slots.release()
@@ -1,80 +1,259 @@
 """
 Recurrence logic for recurring appointments
+
+RecurrencePattern implements RRULE-style rules (frequency, interval,
+count, until, by_day). Occurrences are grouped into periods (one day,
+week, month or year, every `interval` of them) that each hold the same
+number of dates, so the nth occurrence and the number of occurrences up
+to a date are computed arithmetically instead of by iterating from the
+start date.
 """
+import calendar
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from typing import List, Tuple
+from typing import Iterator, List, Optional
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def parse_by_day(by_day: Optional[str]):
+    """
+    Parse a BYDAY value such as "MO,WE,FR" or "1MO,-1FR"
+
+    Returns:
+        List of (ordinal or None, weekday index) tuples
+    """
+    if not by_day:
+        return []
+
+    parsed = []
+    for item in by_day.upper().replace(' ', '').split(','):
+        if not item:
+            continue
+        weekday = item[-2:]
+        if weekday not in WEEKDAYS:
+            raise ValueError(f"Invalid weekday in by_day: {item}")
+        ordinal = int(item[:-2]) if item[:-2] else None
+        if ordinal is not None and not (1 <= abs(ordinal) <= 4):
+            # 5th/-5th weekdays do not exist in every month
+            raise ValueError(f"by_day ordinal must be between -4 and 4: {item}")
+        if (ordinal, WEEKDAYS.index(weekday)) not in parsed:
+            parsed.append((ordinal, WEEKDAYS.index(weekday)))
+
+    # e.g. 4FR and -2FR are the same day in months with five Fridays, which
+    # would make the number of occurrences per month vary
+    for ordinal, weekday in parsed:
+        if ordinal and ordinal > 0 and any(o and o < 0 and w == weekday for o, w in parsed):
+            raise ValueError("by_day cannot mix positive and negative ordinals for the same weekday")
+    return parsed
+
+
+def _nth_weekday_of_month(year: int, month: int, ordinal: int, weekday: int) -> datetime.date:
+    """Date of the ordinal-th (negative = from the end) weekday of a month"""
+    first_weekday, days_in_month = calendar.monthrange(year, month)
+    if ordinal > 0:
+        day = 1 + (weekday - first_weekday) % 7 + (ordinal - 1) * 7
+    else:
+        last_weekday = (first_weekday + days_in_month - 1) % 7
+        day = days_in_month - (last_weekday - weekday) % 7 + (ordinal + 1) * 7
+    return datetime(year, month, day).date()
+
+
+class RecurrencePattern:
+    """RRULE-style recurrence with arithmetic counting and lazy expansion"""
+
+    def __init__(self, start_date: datetime.date, frequency: str, interval: int = 1,
+                 count: Optional[int] = None, until: Optional[datetime.date] = None,
+                 by_day: Optional[str] = None):
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Invalid frequency. Must be one of: {', '.join(FREQUENCIES)}")
+        if interval is None or interval < 1:
+            raise ValueError("Interval must be a positive integer")
+
+        self.start_date = start_date
+        self.frequency = frequency
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.by_day = parse_by_day(by_day)
+
+        if self.by_day and frequency not in ('weekly', 'monthly'):
+            raise ValueError("by_day is only supported for weekly and monthly rules")
+        if frequency == 'weekly' and any(ordinal for ordinal, _ in self.by_day):
+            raise ValueError("Weekly by_day values cannot have an ordinal")
+        if frequency == 'monthly' and any(ordinal is None for ordinal, _ in self.by_day):
+            raise ValueError("Monthly by_day values need an ordinal, e.g. 1MO or -1FR")
+
+        self._week_anchor = start_date - timedelta(days=start_date.weekday())
+        self._per_period = len(self.by_day) or 1
+        # Dates of the first period that fall before the start date
+        self._offset = sum(1 for d in self._period_dates(0) if d < start_date)
+
+    @classmethod
+    def from_rule(cls, rule, start_date: datetime.date) -> 'RecurrencePattern':
+        """Build a pattern from a RecurrenceRule model row"""
+        return cls(start_date, rule.frequency, rule.interval or 1,
+                   rule.count, rule.until, rule.by_day)
+
+    @classmethod
+    def from_legacy(cls, start_date: datetime.date, recurrence_type: str,
+                    recurrence_end: Optional[datetime.date]) -> 'RecurrencePattern':
+        """Build a pattern from the Appointment.recurrence/recurrence_end columns"""
+        return cls(start_date, recurrence_type, until=recurrence_end)
+
+    # ------------------------------------------------------------------
+    # Periods
+    # ------------------------------------------------------------------
+
+    def _period_dates(self, period: int) -> List[datetime.date]:
+        """Sorted occurrence dates of a period, before count/until limits"""
+        step = period * self.interval
+
+        if self.frequency == 'daily':
+            return [self.start_date + timedelta(days=step)]
+
+        if self.frequency == 'weekly':
+            if not self.by_day:
+                return [self.start_date + timedelta(weeks=step)]
+            week_start = self._week_anchor + timedelta(weeks=step)
+            return sorted(week_start + timedelta(days=weekday) for _, weekday in self.by_day)
 
+        if self.frequency == 'monthly':
+            if not self.by_day:
+                return [self.start_date + relativedelta(months=step)]
+            month = self.start_date.replace(day=1) + relativedelta(months=step)
+            return sorted(
+                _nth_weekday_of_month(month.year, month.month, ordinal, weekday)
+                for ordinal, weekday in self.by_day
+            )
 
-def generate_recurring_dates(start_date: datetime.date, recurrence_type: str, 
+        return [self.start_date + relativedelta(years=step)]
+
+    def _period_of(self, target: datetime.date) -> int:
+        """Index of the last period starting on or before target"""
+        if self.frequency == 'daily':
+            units = (target - self.start_date).days
+        elif self.frequency == 'weekly':
+            units = (target - self._week_anchor).days // 7
+        elif self.frequency == 'monthly':
+            units = (target.year - self.start_date.year) * 12 + target.month - self.start_date.month
+        else:
+            units = target.year - self.start_date.year
+        return units // self.interval
+
+    def _unbounded_count_through(self, target: datetime.date) -> int:
+        """Occurrences on or before target, ignoring count/until"""
+        if target < self.start_date:
+            return 0
+        period = self._period_of(target)
+        in_period = sum(1 for d in self._period_dates(period) if d <= target)
+        return max(0, period * self._per_period + in_period - self._offset)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def nth(self, n: int) -> Optional[datetime.date]:
+        """
+        The nth occurrence (0-based), or None past the end of the rule
+
+        Computed in constant time from the period arithmetic.
+        """
+        if n < 0 or (self.count is not None and n >= self.count):
+            return None
+        index = n + self._offset
+        occurrence = self._period_dates(index // self._per_period)[index % self._per_period]
+        if self.until is not None and occurrence > self.until:
+            return None
+        return occurrence
+
+    def count_through(self, target: datetime.date) -> int:
+        """Number of occurrences on or before target"""
+        if self.until is not None and target > self.until:
+            target = self.until
+        total = self._unbounded_count_through(target)
+        if self.count is not None:
+            total = min(total, self.count)
+        return total
+
+    def total(self) -> Optional[int]:
+        """Total number of occurrences, or None for an unbounded rule"""
+        if self.until is not None:
+            return self.count_through(self.until)
+        return self.count
+
+    def between(self, window_start: datetime.date, window_end: datetime.date) -> Iterator[datetime.date]:
+        """Lazily yield the occurrences within [window_start, window_end]"""
+        n = self.count_through(window_start - timedelta(days=1))
+        while True:
+            occurrence = self.nth(n)
+            if occurrence is None or occurrence > window_end:
+                return
+            yield occurrence
+            n += 1
+
+    def __iter__(self) -> Iterator[datetime.date]:
+        n = 0
+        while True:
+            occurrence = self.nth(n)
+            if occurrence is None:
+                return
+            yield occurrence
+            n += 1
+
+
+def generate_recurring_dates(start_date: datetime.date, recurrence_type: str,
                              recurrence_end: datetime.date) -> List[datetime.date]:
     """
     Generate list of dates for recurring appointments
-    
+
     Args:
         start_date: initial appointment date
         recurrence_type: 'weekly' or 'monthly'
         recurrence_end: end date for recurrence
-    
+
     Returns:
         List of dates for recurring appointments (excluding the initial date)
     """
-    dates = []
-    current_date = start_date
-    
-    if recurrence_type == 'weekly':
-        # Generate weekly occurrences
-        while True:
-            current_date = current_date + timedelta(weeks=1)
-            if current_date > recurrence_end:
-                break
-            dates.append(current_date)
-    
-    elif recurrence_type == 'monthly':
-        # Generate monthly occurrences
-        while True:
-            current_date = current_date + relativedelta(months=1)
-            if current_date > recurrence_end:
-                break
-            dates.append(current_date)
-    
-    return dates
+    if recurrence_type not in FREQUENCIES:
+        return []
+
+    pattern = RecurrencePattern.from_legacy(start_date, recurrence_type, recurrence_end)
+    return list(pattern.between(start_date + timedelta(days=1), recurrence_end))
 
 
 def get_next_occurrence(start_date: datetime.date, recurrence_type: str) -> datetime.date:
     """
     Get the next occurrence date based on recurrence type
-    
+
     Args:
         start_date: current occurrence date
         recurrence_type: 'weekly' or 'monthly'
-    
+
     Returns:
         Next occurrence date
     """
-    if recurrence_type == 'weekly':
-        return start_date + timedelta(weeks=1)
-    elif recurrence_type == 'monthly':
-        return start_date + relativedelta(months=1)
-    
-    return start_date
+    if recurrence_type not in FREQUENCIES:
+        return start_date
+
+    return RecurrencePattern(start_date, recurrence_type).nth(1)
 
 
 def calculate_occurrences_count(start_date: datetime.date, recurrence_type: str,
                                 recurrence_end: datetime.date) -> int:
     """
     Calculate the number of occurrences for a recurring appointment
-    
+
     Args:
         start_date: initial appointment date
         recurrence_type: 'weekly' or 'monthly'
         recurrence_end: end date for recurrence
-    
+
     Returns:
         Number of occurrences (including the initial appointment)
     """
     if recurrence_type == 'none':
         return 1
-    
-    dates = generate_recurring_dates(start_date, recurrence_type, recurrence_end)
-    return len(dates) + 1  # +1 for the initial appointment
+
+    return RecurrencePattern.from_legacy(start_date, recurrence_type, recurrence_end).total()
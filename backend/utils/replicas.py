@@ -0,0 +1,80 @@
+"""
+Read-replica routing for read-only request handlers
+"""
+import random
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_PREFIX = 'replica_'  # Config.SQLALCHEMY_BINDS keys for replicas
+STICKY_COOKIE = 'appo_primary'
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a replica engine while the current request
+    is marked read-only, and everything else to the primary.
+
+    A session that has flushed or issued a bulk UPDATE/DELETE stays on the
+    primary for the rest of the request, so it always reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            replicas = [
+                engine for key, engine in self._db.engines.items()
+                if key and key.startswith(REPLICA_BIND_PREFIX)
+            ]
+            if replicas:
+                return random.choice(replicas)
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause) -> bool:
+        if isinstance(clause, sa.UpdateBase):
+            self.info['wrote'] = True
+            return False
+
+        if self._flushing or self.info.get('wrote') or self.new or self.dirty or self.deleted:
+            return False
+
+        return has_app_context() and g.get('use_replica', False)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_session_wrote(session, flush_context):
+    session.info['wrote'] = True
+
+
+def read_only(view):
+    """
+    Mark a view as read-only so its queries may be served by a replica
+
+    Clients that wrote recently carry the sticky cookie and keep reading
+    from the primary until it expires (read-your-writes across requests).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = STICKY_COOKIE not in request.cookies
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def init_replicas(app, db):
+    """Register the read-your-writes cookie hook when replicas are configured"""
+    if not app.config.get('SQLALCHEMY_REPLICA_URIS'):
+        return
+
+    @app.after_request
+    def stick_to_primary_after_write(response):
+        if db.session.info.get('wrote'):
+            response.set_cookie(
+                STICKY_COOKIE, '1',
+                max_age=app.config['REPLICA_STICKY_SECONDS'],
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,95 @@
+"""
+Client lookup by name or phone prefix for the admin panel
+"""
+import re
+
+from models import Appointment
+from utils.fields import project_query
+from utils.validators import normalize_name
+
+MIN_NAME_CHARS = 2
+MIN_PHONE_DIGITS = 3
+
+PHONE_QUERY = re.compile(r'^[\d\s\-\(\)\+]+$')
+NON_DIGITS = re.compile(r'\D+')
+
+# Characters of normalized search keys, in collation order
+KEY_ALPHABET = ' 0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def parse_search_query(q: str):
+    """
+    Decide whether q is a phone or a name prefix and normalize it
+
+    Returns:
+        Tuple of (column, normalized prefix, error message)
+    """
+    q = (q or '').strip()
+    if PHONE_QUERY.match(q):
+        # Stored keys are digits only; a '+' is accepted anywhere in q
+        prefix = NON_DIGITS.sub('', q)
+        if len(prefix) < MIN_PHONE_DIGITS:
+            return None, None, f"Phone searches need at least {MIN_PHONE_DIGITS} digits"
+        return Appointment.phone_digits, prefix, None
+
+    prefix = normalize_name(q)
+    if len(prefix) < MIN_NAME_CHARS:
+        return None, None, f"Name searches need at least {MIN_NAME_CHARS} characters"
+    return Appointment.client_search, prefix, None
+
+
+def prefix_upper_bound(prefix: str):
+    """
+    Smallest key greater than every key starting with prefix
+
+    Returns None when there is no such key (e.g. "zz"). Raises ValueError
+    if prefix has characters outside KEY_ALPHABET (it must be normalized).
+    """
+    if any(char not in KEY_ALPHABET for char in prefix):
+        raise ValueError(f"Search prefix is not normalized: {prefix!r}")
+
+    chars = list(prefix)
+    while chars:
+        position = KEY_ALPHABET.index(chars[-1])
+        if position + 1 < len(KEY_ALPHABET):
+            chars[-1] = KEY_ALPHABET[position + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+
+def prefix_filter(column, prefix: str):
+    """
+    Prefix match written as a range so any B-tree index on column is used
+
+    LIKE 'abc%' only uses an index on MySQL, or on SQLite with a NOCASE
+    column; the equivalent range works on both.
+    """
+    upper = prefix_upper_bound(prefix)
+    if upper is None:
+        return column >= prefix
+    return (column >= prefix) & (column < upper)
+
+
+def search_appointments(column, prefix: str, status=None, limit: int = 20, fields=None):
+    """
+    Appointments whose normalized name or phone starts with prefix
+
+    Rows are read in (key, date, time) order straight from the
+    ix_appointments_client_search / ix_appointments_phone_digits index, so
+    the query stops after limit rows however many clients share the prefix.
+
+    Returns:
+        Dict with 'appointments' (model objects) and 'truncated'
+    """
+    query = Appointment.query.filter(prefix_filter(column, prefix))
+    if status:
+        query = query.filter(Appointment.status == status)
+
+    query = project_query(query, Appointment, fields)
+    appointments = query.order_by(column, Appointment.date, Appointment.time).limit(limit + 1).all()
+
+    return {
+        'appointments': appointments[:limit],
+        'truncated': len(appointments) > limit
+    }
@@ -0,0 +1,338 @@
+"""
+Synthetic appointment data for capacity testing
+
+Rows are generated in memory from a seeded random source and written with
+chunked Core bulk inserts (one executemany and one commit per chunk), so
+ORM unit-of-work costs and per-row defaults are skipped entirely. Ids,
+normalized search keys, client ids and timestamps are computed here
+instead of by the model. Appointments follow the enabled availability
+of their weekday but ignore slot conflicts, so the data suits volume
+tests rather than booking-logic tests.
+"""
+import logging
+import random
+import time as timer
+from datetime import datetime, date, time, timedelta
+
+from sqlalchemy import func, insert
+
+from models import db, Appointment, AppointmentArchive, Availability, Client, Service
+from utils.recurrence import RecurrencePattern
+from utils.stats import rebuild_daily_stats
+from utils.validators import booking_window, normalize_name, normalize_phone
+
+logger = logging.getLogger(__name__)
+
+FIRST_NAMES = ['Ana', 'Luis', 'María', 'José', 'Carmen', 'Jorge', 'Lucía', 'Pedro', 'Sofía', 'Diego',
+               'Elena', 'Pablo', 'Marta', 'Javier', 'Laura', 'Andrés', 'Paula', 'Raúl', 'Isabel', 'Hugo']
+LAST_NAMES = ['García', 'Pérez', 'López', 'Martínez', 'Sánchez', 'Gómez', 'Díaz', 'Torres', 'Ruiz',
+              'Vargas', 'Romero', 'Navarro', 'Molina', 'Castro', 'Ortiz', 'Rubio', 'Marín', 'Iglesias']
+
+# Synthetic clients use phones +34 7XXXXXXXX, outside the usual Spanish mobile range
+PHONE_PREFIX = '+34 7'
+
+# Recurring series: frequency weights and number of occurrences
+SERIES_FREQUENCIES = (('weekly', 4), ('monthly', 1))
+SERIES_LENGTH = (4, 12)
+
+APPOINTMENT_COLUMNS = (
+    'id', 'date', 'time', 'client', 'phone', 'client_id', 'client_search', 'phone_digits',
+    'service_id', 'recurrence', 'recurrence_end', 'parent_appointment_id', 'status', 'notes',
+    'price', 'start_datetime', 'end_datetime', 'created_at', 'updated_at'
+)
+
+
+def parse_service_mix(mix: str) -> dict:
+    """
+    Parse service weights such as '1=5,2=3,3=1'
+
+    Returns:
+        Dict of service id -> weight
+    """
+    weights = {}
+    for item in mix.split(','):
+        service_id, _, weight = item.partition('=')
+        weights[int(service_id)] = float(weight or 1)
+    return weights
+
+
+def _slot_times(availability):
+    """Start times of the slots of an availability row"""
+    times = []
+    current = datetime.combine(date.today(), availability.start_time)
+    end = datetime.combine(date.today(), availability.end_time)
+    step = timedelta(minutes=availability.duration_minutes or 60)
+    while current < end:
+        times.append(current.time())
+        current += step
+    return times
+
+
+def _seed_clients(count: int) -> list:
+    """
+    Insert the synthetic clients that do not exist yet
+
+    Returns:
+        List of (name, phone, client id, client_search, phone_digits)
+    """
+    rng = random.Random(0)
+    wanted = {}
+    for index in range(count):
+        phone = f'{PHONE_PREFIX}{index:08d}'
+        wanted[normalize_phone(phone)] = (f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', phone)
+
+    prefix = normalize_phone(PHONE_PREFIX)
+    existing = dict(db.session.query(Client.phone, Client.id).filter(
+        Client.phone >= prefix, Client.phone < prefix + 'a'
+    ).all())
+    missing = [{'phone': key, 'name': name} for key, (name, _) in wanted.items() if key not in existing]
+    for start in range(0, len(missing), 10000):
+        db.session.execute(insert(Client.__table__), missing[start:start + 10000])
+    db.session.commit()
+
+    if missing:
+        existing = dict(db.session.query(Client.phone, Client.id).filter(
+            Client.phone >= prefix, Client.phone < prefix + 'a'
+        ).all())
+
+    return [
+        (name, phone, existing[key], normalize_name(name), key)
+        for key, (name, phone) in wanted.items()
+    ]
+
+
+class BulkInserter:
+    """
+    executemany of plain rows straight on the DBAPI cursor
+
+    Core's executemany converts every value of every row with the column
+    types' bind processors, which costs more than SQLite's own insert; the
+    rows here repeat a small set of dates and times, so converted values
+    are memoized per column and the compiled statement is sent with
+    exec_driver_sql.
+    """
+
+    def __init__(self, table, columns):
+        dialect = db.engine.dialect
+        compiled = insert(table).compile(dialect=dialect, column_keys=columns)
+        self._sql = compiled.string
+        self._positional = compiled.positiontup is not None
+        self._columns = compiled.positiontup if self._positional else list(columns)
+        self._converters = [
+            self._converter(processor) if processor else None
+            for processor in (table.c[name].type._cached_bind_processor(dialect) for name in self._columns)
+        ]
+
+    @staticmethod
+    def _converter(processor):
+        memo = {}
+
+        def convert(value):
+            if value is None:
+                return None
+            try:
+                return memo[value]
+            except KeyError:
+                memo[value] = converted = processor(value)
+                return converted
+        return convert
+
+    def insert(self, rows):
+        columns = list(zip(self._columns, self._converters))
+        if self._positional:
+            params = [
+                tuple(convert(row[name]) if convert else row[name] for name, convert in columns)
+                for row in rows
+            ]
+        else:
+            params = [
+                {name: convert(row[name]) if convert else row[name] for name, convert in columns}
+                for row in rows
+            ]
+        db.session.connection().exec_driver_sql(self._sql, params)
+
+
+def _generate(rng, count, first_day, days, times_by_weekday, service_ids, service_weights,
+              durations, prices, clients, first_id, recurring, cancelled):
+    """Yield appointment rows with consecutive ids starting at first_id"""
+    today = date.today()
+    now = datetime.utcnow().replace(microsecond=0)
+    next_id = first_id
+    produced = 0
+    bookable_days = [
+        first_day + timedelta(days=offset) for offset in range(days)
+        if times_by_weekday.get((first_day + timedelta(days=offset)).weekday())
+    ]
+    frequencies = [frequency for frequency, _ in SERIES_FREQUENCIES]
+    frequency_weights = [weight for _, weight in SERIES_FREQUENCIES]
+
+    while produced < count:
+        start = rng.choice(bookable_days)
+        slot_time = rng.choice(times_by_weekday[start.weekday()])
+        name, phone, client_id, client_search, phone_digits = rng.choice(clients)
+        service_id = rng.choices(service_ids, service_weights)[0]
+        created_at = min(now, datetime.combine(start - timedelta(days=rng.randrange(30)), slot_time))
+
+        dates = [start]
+        recurrence = 'none'
+        if rng.random() < recurring:
+            recurrence = rng.choices(frequencies, frequency_weights)[0]
+            length = min(rng.randint(*SERIES_LENGTH), count - produced)
+            pattern = RecurrencePattern(start, recurrence)
+            dates += [pattern.nth(n) for n in range(1, length)]
+            if len(dates) == 1:
+                recurrence = 'none'
+
+        parent_id = next_id
+        for n, day in enumerate(dates):
+            if rng.random() < cancelled:
+                status = 'cancelled'
+            else:
+                status = 'completed' if day < today else 'active'
+            start_datetime, end_datetime = booking_window(day, slot_time, durations[service_id])
+            yield {
+                'id': next_id,
+                'date': day,
+                'time': slot_time,
+                'client': name,
+                'phone': phone,
+                'client_id': client_id,
+                'client_search': client_search,
+                'phone_digits': phone_digits,
+                'service_id': service_id,
+                'recurrence': recurrence if n == 0 else 'none',
+                'recurrence_end': dates[-1] if n == 0 and recurrence != 'none' else None,
+                'parent_appointment_id': parent_id if n else None,
+                'status': status,
+                'notes': '',
+                'price': prices[service_id],
+                'start_datetime': start_datetime,
+                'end_datetime': end_datetime,
+                'created_at': created_at,
+                'updated_at': created_at
+            }
+            next_id += 1
+            produced += 1
+
+
+def rebuildable_indexes(table) -> list:
+    """
+    Indexes of table that may be dropped during a bulk load
+
+    An index whose leading columns are a foreign key's may be the one
+    MySQL uses to enforce it, and dropping it fails; those are kept.
+    """
+    foreign_keys = [
+        [column.name for column in constraint.columns]
+        for constraint in table.foreign_key_constraints
+    ]
+    return [
+        index for index in table.indexes
+        if not any([column.name for column in index.columns][:len(key)] == key for key in foreign_keys)
+    ]
+
+
+def seed_appointments(count: int, days: int = 730, service_mix: dict = None, recurring: float = 0.1,
+                      cancelled: float = 0.08, clients: int = None, seed: int = 1,
+                      chunk_size: int = 10000, rebuild_indexes: bool = False) -> dict:
+    """
+    Insert count synthetic appointments spread over days centered on today
+
+    Args:
+        count: appointments to insert (series occurrences included)
+        days: width of the date range
+        service_mix: service id -> weight (default: active services equally)
+        recurring: fraction of series starts (weekly or monthly, 4-12 occurrences)
+        cancelled: fraction of cancelled appointments
+        clients: distinct clients (default: count / 5)
+        seed: random seed; the same seed gives the same dataset on an empty database
+        chunk_size: rows per INSERT statement and transaction
+        rebuild_indexes: drop the appointment indexes during the load and
+            create them afterwards (much faster, but other sessions lose
+            the indexes meanwhile); see rebuildable_indexes
+
+    Returns:
+        Dict with counts and elapsed seconds
+    """
+    started = timer.perf_counter()
+    rng = random.Random(seed)
+
+    if service_mix:
+        service_ids = list(service_mix)
+        known = {s.id for s in Service.query.filter(Service.id.in_(service_ids))}
+        if known != set(service_ids):
+            raise ValueError(f"Unknown services: {sorted(set(service_ids) - known)}")
+    else:
+        service_ids = [s.id for s in Service.query.filter_by(active=True).order_by(Service.id)]
+        if not service_ids:
+            raise ValueError('No active services; run init_db.py first')
+        service_mix = dict.fromkeys(service_ids, 1.0)
+    service_weights = [service_mix[service_id] for service_id in service_ids]
+    durations, prices = {}, {}
+    for service_id, duration, price in db.session.query(Service.id, Service.duration, Service.price).filter(
+        Service.id.in_(service_ids)
+    ):
+        durations[service_id], prices[service_id] = duration, price
+
+    times_by_weekday = {}
+    for availability in Availability.query.filter_by(enabled=True):
+        times_by_weekday.setdefault(availability.day_of_week, []).extend(_slot_times(availability))
+    if not times_by_weekday:
+        times_by_weekday = {day: [time(hour) for hour in range(9, 18)] for day in range(7)}
+
+    client_rows = _seed_clients(clients or max(1, count // 5))
+
+    # Archived rows keep their ids, so new ids start after both tables
+    first_id = 1 + max(
+        db.session.query(func.max(Appointment.id)).scalar() or 0,
+        db.session.query(func.max(AppointmentArchive.id)).scalar() or 0
+    )
+    first_day = date.today() - timedelta(days=days // 2)
+
+    rows = _generate(rng, count, first_day, days, times_by_weekday, service_ids, service_weights,
+                     durations, prices, client_rows, first_id, recurring, cancelled)
+
+    # Maintaining the secondary indexes row by row costs several times the
+    # inserts themselves; building them once from the loaded table is a sort
+    indexes = rebuildable_indexes(Appointment.__table__) if rebuild_indexes else []
+    db.session.commit()
+
+    inserter = BulkInserter(Appointment.__table__, APPOINTMENT_COLUMNS)
+    inserted = 0
+    series = 0
+    cancelled_count = 0
+    try:
+        for index in indexes:
+            index.drop(bind=db.session.connection(), checkfirst=True)
+        db.session.commit()
+
+        while True:
+            chunk = [row for _, row in zip(range(chunk_size), rows)]
+            if not chunk:
+                break
+            inserter.insert(chunk)
+            db.session.commit()
+
+            inserted += len(chunk)
+            series += sum(1 for row in chunk if row['recurrence'] != 'none')
+            cancelled_count += sum(1 for row in chunk if row['status'] == 'cancelled')
+            if inserted % (chunk_size * 10) == 0:
+                logger.info(f"Inserted {inserted} appointments")
+    finally:
+        # Recreated even when the load fails: boot.py would not notice the
+        # missing indexes, since the schema version is still current
+        db.session.rollback()
+        for index in indexes:
+            index.create(bind=db.session.connection(), checkfirst=True)
+        db.session.commit()
+    insert_seconds = timer.perf_counter() - started
+    rebuild_daily_stats()
+
+    return {
+        'appointments': inserted,
+        'series': series,
+        'cancelled': cancelled_count,
+        'clients': len(client_rows),
+        'insert_seconds': round(insert_seconds, 2),
+        'total_seconds': round(timer.perf_counter() - started, 2)
+    }
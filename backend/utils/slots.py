@@ -0,0 +1,135 @@
+"""
+Slot occupancy computed from aggregated booking counts
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import and_, func, or_
+
+from models import db, Appointment, Service
+from utils.validators import MAX_DURATION_MINUTES, overlapping_bookings
+
+# Active bookings sharing a booked window and service
+BookedGroup = namedtuple('BookedGroup', 'start end service_id capacity count')
+
+# Windows per overlap query, to keep the OR of ranges small
+WINDOWS_PER_QUERY = 100
+
+
+def booked_slot_groups(dates) -> dict:
+    """
+    Count active bookings per (date, time, service) with one GROUP BY
+
+    Args:
+        dates: iterable of dates
+
+    Returns:
+        Dict of date -> list of BookedGroup (dates without bookings are absent)
+    """
+    dates = list(dates)
+    if not dates:
+        return {}
+
+    rows = db.session.query(
+        Appointment.date, Appointment.start_datetime, Appointment.end_datetime,
+        Appointment.service_id, Service.capacity, func.count(Appointment.id)
+    ).join(Service, Service.id == Appointment.service_id).filter(
+        Appointment.date.in_(dates),
+        Appointment.status == 'active'
+    ).group_by(
+        Appointment.date, Appointment.start_datetime, Appointment.end_datetime,
+        Appointment.service_id, Service.capacity
+    ).all()
+
+    groups = defaultdict(list)
+    for booking_date, start, end, service_id, capacity, count in rows:
+        groups[booking_date].append(BookedGroup(start, end, service_id, capacity or 1, count))
+    return groups
+
+
+def overlapping_groups(windows) -> list:
+    """
+    Active bookings overlapping any of the windows, aggregated by window and service
+
+    Each window is one range on ix_appointments_window: bookings last at
+    most MAX_DURATION_MINUTES, so start_datetime is bounded on both sides
+    and only the bookings starting shortly before the window are read
+    besides the conflicting ones.
+
+    Args:
+        windows: iterable of (start, end) datetimes
+
+    Returns:
+        List of BookedGroup
+    """
+    windows = list(windows)
+    longest = timedelta(minutes=MAX_DURATION_MINUTES)
+
+    groups = []
+    for first in range(0, len(windows), WINDOWS_PER_QUERY):
+        ranges = [
+            and_(
+                Appointment.start_datetime > start - longest,
+                Appointment.start_datetime < end,
+                Appointment.end_datetime > start
+            )
+            for start, end in windows[first:first + WINDOWS_PER_QUERY]
+        ]
+        rows = db.session.query(
+            Appointment.start_datetime, Appointment.end_datetime,
+            Appointment.service_id, Service.capacity, func.count(Appointment.id)
+        ).join(Service, Service.id == Appointment.service_id).filter(
+            Appointment.status == 'active',
+            or_(*ranges)
+        ).group_by(
+            Appointment.start_datetime, Appointment.end_datetime,
+            Appointment.service_id, Service.capacity
+        ).all()
+        groups.extend(
+            BookedGroup(start, end, service_id, capacity or 1, count)
+            for start, end, service_id, capacity, count in rows
+        )
+    return groups
+
+
+def build_slots(target_date, availability, booked_groups, service=None) -> list:
+    """
+    Time slots of an availability window with their remaining capacity
+
+    Without a service, a slot is available when nothing overlaps it, or
+    when everything overlapping it belongs to one service that still has
+    room; service_id then tells which service the remaining places are for.
+    With a service, remaining is computed for booking that service.
+    """
+    duration = service.duration if service else availability.duration_minutes
+    slot_step = timedelta(minutes=availability.duration_minutes)
+
+    slots = []
+    current_time = availability.start_time
+    while current_time < availability.end_time:
+        overlapping = overlapping_bookings(target_date, current_time, duration, booked_groups)
+        booked_services = {group.service_id for group in overlapping}
+        booked = sum(group.count for group in overlapping)
+
+        if not overlapping:
+            shared_service_id = None
+            remaining = (service.capacity or 1) if service else None
+        elif len(booked_services) > 1 or (service and booked_services != {service.id}):
+            shared_service_id = None
+            remaining = 0
+        else:
+            shared_service_id = overlapping[0].service_id
+            remaining = max(0, overlapping[0].capacity - booked)
+
+        slots.append({
+            'time': current_time.strftime('%H:%M'),
+            'available': remaining is None or remaining > 0,
+            'remaining': remaining,
+            'service_id': shared_service_id
+        })
+
+        # Move to next slot
+        dt = datetime.combine(date.today(), current_time) + slot_step
+        current_time = dt.time()
+
+    return slots
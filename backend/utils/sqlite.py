@@ -0,0 +1,81 @@
+"""
+Single-node SQLite profile: connection pragmas and write transactions
+
+With DATABASE_URL=sqlite:///... every new connection gets WAL journaling
+(readers never block the writer and vice versa), synchronous=NORMAL
+(durable at each checkpoint instead of at each commit), a memory-mapped
+database and a larger page cache, and a busy timeout so concurrent
+writers wait for the lock instead of failing at once.
+
+Transactions are begun by SQLAlchemy rather than by the sqlite3 module.
+Write requests (POST/PUT/DELETE) and all work outside a request (CLI
+jobs such as archive-appointments or complete-appointments, the seeder,
+background threads) use BEGIN IMMEDIATE, which takes the write lock up
+front and waits for it within the busy timeout; a deferred transaction
+that reads and then writes would instead fail with "database is locked"
+if another worker committed in between. GET requests, and connections
+with the READ_ONLY_OPTION execution option (e.g. the readiness ping),
+use a plain (deferred) BEGIN, so reads never queue behind writers.
+"""
+from flask import has_request_context, request
+from sqlalchemy import event
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Execution option marking a connection that only reads
+READ_ONLY_OPTION = 'read_only_transaction'
+
+
+def _immediate(connection) -> bool:
+    """Whether a transaction may write and must take the write lock up front"""
+    if connection.get_execution_options().get(READ_ONLY_OPTION):
+        return False
+    if has_request_context():
+        return request.method not in SAFE_METHODS
+    return True
+
+
+def configure_sqlite_engine(engine, busy_timeout_ms: int, mmap_size: int, cache_size_kib: int):
+    """
+    Apply the pragmas on connect and take over transaction begin
+
+    Args:
+        engine: SQLAlchemy engine of a SQLite file database
+        busy_timeout_ms: how long a writer waits for the lock
+        mmap_size: bytes of the database file mapped into memory
+        cache_size_kib: page cache per connection
+    """
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        # SQLAlchemy emits BEGIN itself (see _begin), which also makes SAVEPOINT work
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        cursor.execute(f'PRAGMA cache_size={-int(cache_size_kib)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _begin(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE' if _immediate(connection) else 'BEGIN')
+
+
+def init_sqlite(app, db):
+    """Configure the SQLite engines of the app (no-op for other databases)"""
+    if not app.config['SQLITE_TUNING_ENABLED']:
+        return
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+            continue
+        configure_sqlite_engine(
+            engine,
+            app.config['SQLITE_BUSY_TIMEOUT_MS'],
+            app.config['SQLITE_MMAP_SIZE'],
+            app.config['SQLITE_CACHE_SIZE_KIB']
+        )
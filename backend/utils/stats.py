@@ -0,0 +1,194 @@
+"""
+Incrementally maintained daily statistics for the admin dashboard
+"""
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Appointment, AppointmentArchive, DailyStat
+
+STAT_FIELDS = ('booked_count', 'cancelled_count', 'completed_count', 'revenue')
+
+
+def new_stats_delta() -> Counter:
+    """Create an accumulator for pending stat changes, keyed by (date, service_id, field)"""
+    return Counter()
+
+
+def record_booking(delta: Counter, appointment_date, service_id, price, status='active'):
+    """
+    Record a newly created appointment in the pending stats delta
+
+    Args:
+        delta: accumulator from new_stats_delta()
+        appointment_date: date of the appointment
+        service_id: service of the appointment
+        price: service price at booking time
+        status: initial status of the appointment
+    """
+    delta[(appointment_date, service_id, 'booked_count')] += 1
+    record_status_change(delta, appointment_date, service_id, price, None, status)
+
+
+def record_status_change(delta: Counter, appointment_date, service_id, price,
+                         old_status, new_status):
+    """
+    Record a status transition in the pending stats delta
+
+    Revenue counts every booking that is not cancelled, so moving into
+    'cancelled' subtracts the price and moving out of it adds it back.
+    """
+    if old_status == new_status:
+        return
+
+    for status, sign in ((old_status, -1), (new_status, 1)):
+        if status == 'cancelled':
+            delta[(appointment_date, service_id, 'cancelled_count')] += sign
+        elif status == 'completed':
+            delta[(appointment_date, service_id, 'completed_count')] += sign
+
+    price = price or 0.0
+    if new_status == 'cancelled' and old_status is not None:
+        delta[(appointment_date, service_id, 'revenue')] -= price
+    elif new_status != 'cancelled' and old_status in (None, 'cancelled'):
+        delta[(appointment_date, service_id, 'revenue')] += price
+
+
+def _upsert_stat(stat_date, service_id, changes: dict):
+    """
+    Add changes to a stat row, creating it if needed, in one atomic statement
+
+    Two transactions creating the same (date, service) row concurrently
+    must not both INSERT, so the insert is an upsert (ON DUPLICATE KEY
+    UPDATE on MySQL, ON CONFLICT on SQLite/PostgreSQL); other backends
+    insert in a savepoint and fall back to the increment.
+    """
+    table = DailyStat.__table__
+    values = {'date': stat_date, 'service_id': service_id, 'updated_at': datetime.utcnow(),
+              **{field: 0 for field in STAT_FIELDS}, **changes}
+    increments = {field: table.c[field] + amount for field, amount in changes.items()}
+    increments['updated_at'] = values['updated_at']
+
+    dialect = db.session.get_bind(mapper=DailyStat.__mapper__).dialect.name
+    if dialect == 'mysql':
+        db.session.execute(mysql_insert(table).values(values).on_duplicate_key_update(increments))
+    elif dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        db.session.execute(insert(table).values(values).on_conflict_do_update(
+            index_elements=['date', 'service_id'], set_=increments
+        ))
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(values))
+        except IntegrityError:
+            # Created by a concurrent writer
+            db.session.execute(table.update().where(
+                table.c.date == stat_date, table.c.service_id == service_id
+            ).values(increments))
+
+
+def apply_stats_delta(delta: Counter):
+    """
+    Apply pending stat changes to the current session
+
+    Increments are issued as SQL expressions (``col = col + n``) so that
+    concurrent writers do not overwrite each other's counts; a missing
+    row is created with an upsert, so concurrent first bookings of a day
+    never collide. The caller commits as part of the same transaction as
+    the appointment change.
+    """
+    rows = {}
+    for (stat_date, service_id, field), amount in delta.items():
+        if amount:
+            rows.setdefault((stat_date, service_id), {})[field] = amount
+
+    for (stat_date, service_id), changes in rows.items():
+        values = {
+            field: getattr(DailyStat, field) + amount
+            for field, amount in changes.items()
+        }
+        updated = DailyStat.query.filter_by(
+            date=stat_date, service_id=service_id
+        ).update(values, synchronize_session=False)
+
+        if not updated:
+            _upsert_stat(stat_date, service_id, changes)
+
+    delta.clear()
+
+
+def _aggregate_by_day(model):
+    """GROUP BY (date, service_id) over an appointments table, at booking-time prices"""
+    not_cancelled = model.status != 'cancelled'
+    return db.session.query(
+        model.date,
+        model.service_id,
+        func.count(model.id),
+        func.sum(case((model.status == 'cancelled', 1), else_=0)),
+        func.sum(case((model.status == 'completed', 1), else_=0)),
+        func.sum(case((not_cancelled, func.coalesce(model.price, 0.0)), else_=0.0))
+    ).group_by(
+        model.date, model.service_id
+    ).all()
+
+
+def rebuild_daily_stats() -> int:
+    """
+    Recompute the daily stats table from scratch with GROUP BY queries
+    over the hot and archived appointments
+
+    Returns:
+        Number of stat rows written
+    """
+    totals = {}
+    for model in (Appointment, AppointmentArchive):
+        for stat_date, service_id, booked, cancelled, completed, revenue in _aggregate_by_day(model):
+            row = totals.setdefault((stat_date, service_id), {
+                'date': stat_date,
+                'service_id': service_id,
+                'booked_count': 0,
+                'cancelled_count': 0,
+                'completed_count': 0,
+                'revenue': 0.0
+            })
+            row['booked_count'] += booked or 0
+            row['cancelled_count'] += cancelled or 0
+            row['completed_count'] += completed or 0
+            row['revenue'] += float(revenue or 0.0)
+
+    DailyStat.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(DailyStat, list(totals.values()))
+    db.session.commit()
+
+    return len(totals)
+
+
+def get_stats_range(start_date, end_date, service_id=None):
+    """
+    Read daily stats for a date range
+
+    Returns:
+        Tuple of (list of DailyStat rows, totals dict)
+    """
+    query = DailyStat.query.filter(
+        DailyStat.date >= start_date,
+        DailyStat.date <= end_date
+    )
+    if service_id:
+        query = query.filter(DailyStat.service_id == service_id)
+
+    stats = query.order_by(DailyStat.date, DailyStat.service_id).all()
+
+    totals = {field: 0 for field in STAT_FIELDS}
+    totals['revenue'] = 0.0
+    for stat in stats:
+        for field in STAT_FIELDS:
+            totals[field] += getattr(stat, field) or 0
+
+    return stats, totals
@@ -0,0 +1,110 @@
+"""
+Incremental (delta) sync of appointments based on updated_at
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, func, or_
+
+from models import db, Appointment, AppointmentArchive
+from utils.fields import project_query
+
+
+def parse_sync_timestamp(value):
+    """Parse an ISO 8601 timestamp into a naive UTC datetime, or None if invalid"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def latest_change():
+    """
+    (latest updated_at, latest archived_at): changes whenever any appointment does
+
+    Both maxima are read from the end of an index.
+    """
+    return (
+        db.session.query(func.max(Appointment.updated_at)).scalar(),
+        db.session.query(func.max(AppointmentArchive.archived_at)).scalar()
+    )
+
+
+def sync_appointments(updated_since: datetime, after_id: int = 0, target_date=None,
+                      status=None, page_size: int = 1000, overlap_seconds: int = 5,
+                      fields=None, archived_since: datetime = None, archived_after_id: int = 0):
+    """
+    Return appointments changed since a cursor, plus tombstones
+
+    The cursor is (updated_since, after_id) and rows are read in
+    (updated_at, id) order from the ix_appointments_updated_at index, so
+    bulk updates sharing one timestamp page correctly. Tombstones are ids of
+    appointments that left the hot table (archived) since their own cursor
+    (archived_since, archived_after_id), read in (archived_at, id) order and
+    paged with the same page_size; archived_since defaults to updated_since.
+    has_more is set while either list has more pages.
+
+    When the last page of a list is returned, its next cursor is moved back
+    by overlap_seconds to catch writes still in flight at query time;
+    clients apply rows as upserts by id, so the repeated rows are harmless.
+
+    fields restricts the loaded columns as in utils.fields.project_query.
+
+    Returns:
+        Dict with appointments, tombstones, has_more and the next cursors
+    """
+    query_started = datetime.utcnow()
+    overlap_start = query_started - timedelta(seconds=overlap_seconds)
+    if archived_since is None:
+        archived_since = updated_since
+
+    query = Appointment.query.filter(or_(
+        Appointment.updated_at > updated_since,
+        and_(Appointment.updated_at == updated_since, Appointment.id > after_id)
+    ))
+    if target_date:
+        query = query.filter_by(date=target_date)
+    if status:
+        query = query.filter_by(status=status)
+
+    query = project_query(query, Appointment, fields, extra_columns=('updated_at',))
+    appointments = query.order_by(
+        Appointment.updated_at, Appointment.id
+    ).limit(page_size + 1).all()
+
+    appointments_more = len(appointments) > page_size
+    appointments = appointments[:page_size]
+
+    tombstones = AppointmentArchive.query.with_entities(
+        AppointmentArchive.id, AppointmentArchive.archived_at
+    ).filter(or_(
+        AppointmentArchive.archived_at > archived_since,
+        and_(AppointmentArchive.archived_at == archived_since, AppointmentArchive.id > archived_after_id)
+    )).order_by(
+        AppointmentArchive.archived_at, AppointmentArchive.id
+    ).limit(page_size + 1).all()
+
+    tombstones_more = len(tombstones) > page_size
+    tombstones = tombstones[:page_size]
+
+    if appointments_more:
+        next_updated_since, next_after_id = appointments[-1].updated_at, appointments[-1].id
+    else:
+        next_updated_since, next_after_id = max(updated_since, overlap_start), 0
+
+    if tombstones_more:
+        next_archived_since, next_archived_after_id = tombstones[-1].archived_at, tombstones[-1].id
+    else:
+        next_archived_since, next_archived_after_id = max(archived_since, overlap_start), 0
+
+    return {
+        'appointments': appointments,
+        'tombstones': [row.id for row in tombstones],
+        'has_more': appointments_more or tombstones_more,
+        'next_updated_since': next_updated_since.isoformat(),
+        'next_after_id': next_after_id,
+        'next_archived_since': next_archived_since.isoformat(),
+        'next_archived_after_id': next_archived_after_id
+    }
@@ -2,18 +2,52 @@
 Validation utilities for the appointment booking system
 """
 import re
+import unicodedata
 from datetime import datetime, time, timedelta
 from typing import Tuple, Optional
 
+from utils.recurrence import RecurrencePattern
+
+PHONE_SEPARATORS = re.compile(r'[\s\-\(\)]+')
+
+# Longest service duration accepted, which also bounds overlap range queries
+MAX_DURATION_MINUTES = 480
+
+# Occurrences a recurrence rule may create (each one is an appointment row)
+MAX_RULE_OCCURRENCES = 366
+
 
 def validate_phone(phone: str) -> bool:
     """Validate phone number format"""
     # Remove common separators
-    phone = re.sub(r'[\s\-\(\)]+', '', phone)
+    phone = PHONE_SEPARATORS.sub('', phone)
     # Check if it's a valid phone number (between 7 and 15 digits)
     return bool(re.match(r'^\+?[0-9]{7,15}$', phone))
 
 
+def normalize_phone(phone: str) -> str:
+    """
+    Normalize a phone number for lookups
+
+    Removes the separators accepted by validate_phone and the leading +,
+    so "+34 612-345-678" and "34612345678" compare equal.
+    """
+    return PHONE_SEPARATORS.sub('', phone or '').lstrip('+')
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a client name for lookups
+
+    Lowercases, strips accents and reduces everything else to single
+    spaces, so "José  Pérez" and "jose perez" compare equal. The result
+    only contains [a-z0-9 ], which sorts the same way in every collation.
+    """
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    ascii_name = decomposed.encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', ascii_name).split())[:100]
+
+
 def validate_email(email: str) -> bool:
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -25,31 +59,54 @@ def validate_time_range(start_time: time, end_time: time) -> bool:
     return end_time > start_time
 
 
-def validate_appointment_slot(date, time_slot, duration_minutes, existing_appointments) -> Tuple[bool, Optional[str]]:
+def booking_window(date, time_slot, duration_minutes) -> Tuple[datetime, datetime]:
+    """Start and end datetimes of a booking (60 minutes without a duration)"""
+    start = datetime.combine(date, time_slot)
+    return start, start + timedelta(minutes=duration_minutes or 60)
+
+
+def overlapping_bookings(date, time_slot, duration_minutes, booked_groups) -> list:
+    """
+    Booked groups that overlap [time_slot, time_slot + duration_minutes)
+
+    Args:
+        date: appointment date
+        time_slot: start time
+        duration_minutes: duration of the appointment
+        booked_groups: BookedGroup rows (see utils.slots)
+    """
+    start, end = booking_window(date, time_slot, duration_minutes)
+    return [group for group in booked_groups if start < group.end and end > group.start]
+
+
+def validate_appointment_slot(date, time_slot, duration_minutes, booked_groups,
+                              service_id=None, capacity: int = 1) -> Tuple[bool, Optional[str]]:
     """
     Validate if an appointment slot is available
     
+    A slot can be shared only by bookings of the same service, up to the
+    service's capacity; bookings of any other service block it.
+    
     Args:
         date: appointment date
         time_slot: appointment time
         duration_minutes: duration of the appointment
-        existing_appointments: list of existing appointments for that date
+        booked_groups: active bookings around that date aggregated by window
+            and service (see utils.slots)
+        service_id: service being booked
+        capacity: concurrent bookings allowed for that service
     
     Returns:
         Tuple of (is_valid, error_message)
     """
-    appointment_datetime = datetime.combine(date, time_slot)
-    appointment_end = appointment_datetime + timedelta(minutes=duration_minutes)
-    
-    for existing in existing_appointments:
-        existing_start = datetime.combine(existing.date, existing.time)
-        # Get duration from service or use default
-        existing_duration = existing.service.duration if existing.service else 60
-        existing_end = existing_start + timedelta(minutes=existing_duration)
-        
-        # Check for overlap
-        if (appointment_datetime < existing_end and appointment_end > existing_start):
-            return False, f"This time slot conflicts with an existing appointment at {existing.time.strftime('%H:%M')}"
+    overlapping = overlapping_bookings(date, time_slot, duration_minutes, booked_groups)
+    
+    for group in overlapping:
+        if group.service_id != service_id or capacity <= 1:
+            return False, f"This time slot conflicts with an existing appointment at {group.start.strftime('%H:%M')}"
+    
+    if sum(group.count for group in overlapping) >= capacity:
+        return False, "This time slot is fully booked"
     
     return True, None
 
@@ -86,6 +143,49 @@ def validate_recurrence(recurrence_type: str, recurrence_end=None, start_date=No
     return True, None
 
 
+def validate_recurrence_rule(frequency, interval, count, until, by_day,
+                             start_date) -> Tuple[bool, Optional[str]]:
+    """
+    Validate an RRULE-style recurrence rule (see utils.recurrence)
+    
+    Args:
+        frequency: daily, weekly, monthly or yearly
+        interval: every X periods (int)
+        count: number of occurrences (int), or None
+        until: last possible date, or None
+        by_day: e.g. "MO,WE,FR" (weekly) or "1MO,-1FR" (monthly), or None
+        start_date: date of the first appointment of the series
+    
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    for name, value in (('interval', interval), ('count', count)):
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+            return False, f"Recurrence {name} must be a positive integer"
+    
+    if by_day is not None and not isinstance(by_day, str):
+        return False, "Recurrence by_day must be a string such as MO,WE,FR"
+    
+    if count is None and until is None:
+        return False, "Recurrence rule needs a count or an until date"
+    
+    if until is not None and until < start_date:
+        return False, "Recurrence until date must be after the start date"
+    
+    try:
+        pattern = RecurrencePattern(start_date, frequency, interval or 1, count, until, by_day)
+    except ValueError as e:
+        return False, str(e)
+    
+    if pattern.nth(0) != start_date:
+        return False, "The appointment date must be the first occurrence of the recurrence rule"
+    
+    if pattern.total() > MAX_RULE_OCCURRENCES:
+        return False, f"Recurrence rule cannot create more than {MAX_RULE_OCCURRENCES} appointments"
+    
+    return True, None
+
+
 def sanitize_string(text: str, max_length: int = 255) -> str:
     """Sanitize and truncate string input"""
     if not text:
@@ -104,4 +204,9 @@ def sanitize_string(text: str, max_length: int = 255) -> str:
 def validate_duration(duration_minutes: int) -> bool:
     """Validate appointment duration"""
     # Duration should be between 15 minutes and 8 hours
-    return 15 <= duration_minutes <= 480
+    return 15 <= duration_minutes <= MAX_DURATION_MINUTES
+
+
+def validate_capacity(capacity: int) -> bool:
+    """Validate the number of concurrent bookings of a service"""
+    return isinstance(capacity, int) and not isinstance(capacity, bool) and 1 <= capacity <= 500
@@ -0,0 +1,234 @@
+"""
+Waitlist matching: offer or book slots freed by cancellations
+
+Cancellations queue their freed slots with queue_freed_slots(); one
+background thread per process matches them, so the cancel request never
+waits for the waitlist. An offer that is not taken within
+WAITLIST_OFFER_TTL_MINUTES expires and the slot, if still free, goes to
+the next waiter (see expire_offers, run by `flask expire-waitlist`).
+"""
+import logging
+import queue
+import threading
+from datetime import datetime, date, timedelta
+
+from flask import current_app
+
+from models import db, Appointment, Service, WaitlistEntry
+from utils.clients import get_or_create_client
+from utils.email_service import send_async, send_appointment_confirmation, send_waitlist_offer
+from utils.events import record_event
+from utils.health import register_gauge
+from utils.slots import overlapping_groups
+from utils.stats import new_stats_delta, record_booking, apply_stats_delta
+from utils.validators import booking_window, validate_appointment_slot
+
+logger = logging.getLogger(__name__)
+
+# Freed slots queued by queue_freed_slots, matched by one background thread per process
+_pending = queue.Queue()
+_matcher = None
+_matcher_lock = threading.Lock()
+register_gauge('waitlist_queue', _pending.qsize)
+
+
+def freed_slot(appointment):
+    """The (date, time, service_id) a cancelled appointment leaves free"""
+    return appointment.date, appointment.time, appointment.service_id
+
+
+def find_waiter(slot_date, slot_time, service):
+    """
+    First waiting entry whose window contains the slot, in arrival order
+
+    Reads the ix_waitlist_match index for (date, service, 'waiting') and
+    window_start <= slot_time, so only waiters of that date and service
+    are looked at and the whole waitlist is never scanned. The row is
+    locked (SKIP LOCKED on MySQL) so concurrent cancellations never hand
+    the same waiter two slots.
+    """
+    _, slot_end = booking_window(slot_date, slot_time, service.duration)
+    if slot_end.date() != slot_date:
+        return None
+
+    return WaitlistEntry.query.filter(
+        WaitlistEntry.date == slot_date,
+        WaitlistEntry.service_id == service.id,
+        WaitlistEntry.status == 'waiting',
+        WaitlistEntry.window_start <= slot_time,
+        WaitlistEntry.window_end >= slot_end.time()
+    ).order_by(WaitlistEntry.id).with_for_update(skip_locked=True).first()
+
+
+def book_for_waiter(entry, slot_time, service):
+    """Create the waiter's appointment in the current transaction"""
+    client = get_or_create_client(entry.client, entry.phone)
+    start_datetime, end_datetime = booking_window(entry.date, slot_time, service.duration)
+    appointment = Appointment(
+        date=entry.date,
+        time=slot_time,
+        client=entry.client,
+        phone=entry.phone,
+        client_id=client.id,
+        service_id=service.id,
+        recurrence='none',
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        price=service.price,
+        notes='Reservada desde la lista de espera',
+        status='active'
+    )
+    db.session.add(appointment)
+
+    stats_delta = new_stats_delta()
+    record_booking(stats_delta, entry.date, service.id, appointment.price)
+    apply_stats_delta(stats_delta)
+
+    db.session.flush()
+    record_event('created', appointment)
+    return appointment
+
+
+def fill_slot(slot_date, slot_time, service_id):
+    """
+    Give a freed slot to the first eligible waiter and commit
+
+    Auto-book entries get the appointment; the others are offered the slot
+    by email. Nothing happens if the slot was taken again in the meantime.
+
+    Returns:
+        The matched WaitlistEntry, or None
+    """
+    service = Service.query.get(service_id)
+    if service is None or not service.active or slot_date < date.today():
+        return None
+
+    entry = find_waiter(slot_date, slot_time, service)
+    if entry is None:
+        db.session.rollback()
+        return None
+
+    booked_groups = overlapping_groups([booking_window(slot_date, slot_time, service.duration)])
+    is_free, _ = validate_appointment_slot(
+        slot_date, slot_time, service.duration, booked_groups, service.id, service.capacity or 1
+    )
+    if not is_free:
+        db.session.rollback()
+        return None
+
+    email_data = {
+        'client': entry.client,
+        'email': entry.email,
+        'date': slot_date.strftime('%Y-%m-%d'),
+        'time': slot_time.strftime('%H:%M'),
+        'service_name': service.name
+    }
+
+    if entry.auto_book:
+        entry.appointment_id = book_for_waiter(entry, slot_time, service).id
+        entry.status = 'booked'
+        send = send_appointment_confirmation
+    else:
+        entry.status = 'offered'
+        send = send_waitlist_offer
+
+    entry.offered_time = slot_time
+    entry.notified_at = datetime.utcnow()
+    db.session.commit()
+
+    send_async(send, email_data)
+    return entry
+
+
+def fill_freed_slots(freed):
+    """
+    Match each freed (date, time, service_id) slot against the waitlist
+
+    Runs after the cancellation has committed; a failure here is logged
+    and never affects the cancellation itself.
+    """
+    for slot_date, slot_time, service_id in freed:
+        try:
+            entry = fill_slot(slot_date, slot_time, service_id)
+            if entry:
+                logger.info(f"Waitlist entry {entry.id} {entry.status} for {slot_date} {slot_time}")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error matching waitlist for {slot_date} {slot_time}: {str(e)}")
+
+
+def queue_freed_slots(freed):
+    """
+    Match freed (date, time, service_id) slots from a background thread
+
+    Call it once the cancellation has committed (see utils.batch.after_commit).
+    """
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = threading.Thread(target=_match_queued, name='waitlist-matcher', daemon=True)
+                _matcher.start()
+    _pending.put((current_app._get_current_object(), list(freed)))
+
+
+def _match_queued():
+    while True:
+        app, freed = _pending.get()
+        try:
+            with app.app_context():
+                fill_freed_slots(freed)
+        except Exception as e:
+            logger.error(f"Error matching queued waitlist slots: {str(e)}")
+        finally:
+            _pending.task_done()
+
+
+def expire_offers(now: datetime = None, ttl_minutes: int = None) -> tuple:
+    """
+    Expire offers not taken within the TTL and offer their slots to the next waiter
+
+    A slot the offered client booked in the meantime is no longer free, so
+    re-offering it does nothing.
+
+    Returns:
+        Tuple of (offers expired, slots offered or booked again)
+    """
+    now = now or datetime.utcnow()
+    if ttl_minutes is None:
+        ttl_minutes = current_app.config['WAITLIST_OFFER_TTL_MINUTES']
+
+    stale = WaitlistEntry.query.filter(
+        WaitlistEntry.status == 'offered',
+        WaitlistEntry.notified_at <= now - timedelta(minutes=ttl_minutes)
+    ).with_for_update(skip_locked=True).all()
+    slots = [(entry.date, entry.offered_time, entry.service_id) for entry in stale]
+    for entry in stale:
+        entry.status = 'expired'
+    db.session.commit()
+
+    refilled = 0
+    for slot_date, slot_time, service_id in slots:
+        try:
+            if fill_slot(slot_date, slot_time, service_id):
+                refilled += 1
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error re-offering {slot_date} {slot_time}: {str(e)}")
+    return len(slots), refilled
+
+
+def expire_waitlist(today: date = None) -> int:
+    """
+    Mark entries for past dates as expired
+
+    Returns:
+        Number of entries expired
+    """
+    today = today or date.today()
+    expired = WaitlistEntry.query.filter(
+        WaitlistEntry.date < today,
+        WaitlistEntry.status.in_(('waiting', 'offered'))
+    ).update({'status': 'expired'}, synchronize_session=False)
+    db.session.commit()
+    return expired
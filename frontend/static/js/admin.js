@@ -8,6 +8,9 @@ let currentServices = [];
 let currentAvailability = [];
 let editingServiceId = null;
 let editingAvailabilityId = null;
+let currentFilters = { date: '', status: 'active' };
+let changeFeed = null;
+let searchTimer = null;
 
 // Day names in Spanish
 const dayNames = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'];
@@ -22,12 +25,36 @@ document.addEventListener('DOMContentLoaded', function() {
  * Initialize Admin Panel
  */
 function initializeAdmin() {
-    loadAppointments();
-    loadServices();
-    loadAvailability();
+    const initial = readBootstrapData();
+    
+    if (initial) {
+        currentAppointments = initial.appointments;
+        displayAppointments(currentAppointments);
+        currentServices = initial.services;
+        displayServices(currentServices);
+        currentAvailability = initial.availability;
+        displayAvailability(currentAvailability);
+    } else {
+        loadAppointments();
+        loadServices();
+        loadAvailability();
+    }
+    connectChangeFeed();
     setupTimeSlider();
 }
 
+/**
+ * Data rendered into the page by the server (null if absent)
+ */
+function readBootstrapData() {
+    const element = document.getElementById('bootstrapData');
+    try {
+        return element ? JSON.parse(element.textContent) : null;
+    } catch (error) {
+        return null;
+    }
+}
+
 /**
  * Setup Event Listeners
  */
@@ -35,6 +62,10 @@ function setupEventListeners() {
     // Appointments
     document.getElementById('refreshAppointments').addEventListener('click', loadAppointments);
     document.getElementById('applyFilters').addEventListener('click', applyFilters);
+    document.getElementById('searchClient').addEventListener('input', function() {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(searchAppointments, 300);
+    });
     
     // Services
     document.getElementById('saveService').addEventListener('click', saveService);
@@ -47,7 +78,8 @@ function setupEventListeners() {
         tab.addEventListener('shown.bs.tab', function(e) {
             const targetTab = e.target.getAttribute('data-bs-target');
             if (targetTab === '#appointments') {
-                loadAppointments();
+                // The change feed keeps the list current; only refetch without it
+                if (!isChangeFeedConnected()) loadAppointments();
             } else if (targetTab === '#services') {
                 loadServices();
             } else if (targetTab === '#availability') {
@@ -76,6 +108,8 @@ async function loadAppointments() {
         </tr>
     `;
     
+    currentFilters = { date: '', status: 'active' };
+    
     try {
         let url = '/api/appointments?status=active';
         
@@ -98,6 +132,7 @@ async function loadAppointments() {
 async function applyFilters() {
     const date = document.getElementById('filterDate').value;
     const status = document.getElementById('filterStatus').value;
+    currentFilters = { date: date, status: status || 'active' };
     
     let url = '/api/appointments?';
     if (date) url += `date=${date}&`;
@@ -116,6 +151,85 @@ async function applyFilters() {
     }
 }
 
+/**
+ * Search appointments by client name or phone (server-side, indexed)
+ */
+async function searchAppointments() {
+    const query = document.getElementById('searchClient').value.trim();
+    if (!query) {
+        applyFilters();
+        return;
+    }
+    
+    const status = document.getElementById('filterStatus').value;
+    currentFilters = { search: query, status: status };
+    
+    let url = `/api/appointments/search?q=${encodeURIComponent(query)}&limit=50`;
+    if (status) url += `&status=${status}`;
+    
+    try {
+        const response = await fetch(url);
+        const data = await response.json();
+        
+        // Ignore responses to queries the user has already typed past
+        if (data.success && currentFilters.search === query) {
+            currentAppointments = data.appointments;
+            displayAppointments(currentAppointments);
+        }
+    } catch (error) {
+        console.error('Error searching appointments:', error);
+    }
+}
+
+/**
+ * Connect to the server-sent change feed so the list is updated with
+ * deltas instead of refetching it after every action
+ */
+function connectChangeFeed() {
+    if (!window.EventSource) return;
+    
+    changeFeed = new EventSource('/api/appointments/events');
+    ['created', 'updated', 'cancelled'].forEach(type => {
+        changeFeed.addEventListener(type, event => {
+            applyAppointmentChange(JSON.parse(event.data));
+        });
+    });
+    // The server no longer has the events we missed: reload the full list
+    changeFeed.addEventListener('reset', loadAppointments);
+}
+
+function isChangeFeedConnected() {
+    return changeFeed !== null && changeFeed.readyState !== EventSource.CLOSED;
+}
+
+/**
+ * Apply one appointment change to the current list
+ */
+function applyAppointmentChange(appointment) {
+    const index = currentAppointments.findIndex(a => a.id === appointment.id);
+    
+    // Search results only refresh the rows already listed
+    if (currentFilters.search) {
+        if (index !== -1) {
+            currentAppointments[index] = appointment;
+            displayAppointments(currentAppointments);
+        }
+        return;
+    }
+    
+    if (index !== -1) {
+        currentAppointments.splice(index, 1);
+    }
+    
+    const matchesDate = !currentFilters.date || appointment.date === currentFilters.date;
+    if (matchesDate && appointment.status === currentFilters.status) {
+        currentAppointments.push(appointment);
+        currentAppointments.sort((a, b) => (a.date + a.time).localeCompare(b.date + b.time));
+    }
+    
+    displayAppointments(currentAppointments);
+}
+
 /**
  * Display Appointments in Table
  */
@@ -184,6 +298,7 @@ async function viewAppointment(appointmentId) {
         <div class="mb-3">
             <strong><i class="bi bi-telephone"></i> Teléfono:</strong> ${appointment.phone}
         </div>
+        <div class="mb-3" id="clientHistorySummary"></div>
         <div class="mb-3">
             <strong><i class="bi bi-briefcase"></i> Servicio:</strong> ${appointment.service_name || 'N/A'}
         </div>
@@ -205,6 +320,30 @@ async function viewAppointment(appointmentId) {
     
     const modal = new bootstrap.Modal(document.getElementById('appointmentDetailsModal'));
     modal.show();
+    
+    if (appointment.client_id) loadClientSummary(appointment.client_id);
+}
+
+/**
+ * Show the client's appointment counts in the details modal
+ */
+async function loadClientSummary(clientId) {
+    try {
+        const response = await fetch(`/api/clients/${clientId}`);
+        const data = await response.json();
+        
+        if (data.success) {
+            const counts = data.appointment_counts;
+            document.getElementById('clientHistorySummary').innerHTML = `
+                <strong><i class="bi bi-clock-history"></i> Historial:</strong>
+                ${data.total_appointments} citas
+                (${counts.completed || 0} completadas, ${counts.cancelled || 0} canceladas)
+                · <a href="${data.calendar_url}" target="_blank"><i class="bi bi-calendar-event"></i> Calendario</a>
+            `;
+        }
+    } catch (error) {
+        console.error('Error loading client summary:', error);
+    }
 }
 
 /**
@@ -224,7 +363,7 @@ async function cancelAppointment(appointmentId) {
         
         if (data.success) {
             showSuccess('Cita cancelada exitosamente');
-            loadAppointments();
+            if (!isChangeFeedConnected()) loadAppointments();
         } else {
             showError(data.error || 'Error al cancelar la cita');
         }
@@ -319,6 +458,7 @@ function editService(serviceId) {
     document.getElementById('serviceDescription').value = service.description || '';
     document.getElementById('serviceDuration').value = service.duration;
     document.getElementById('servicePrice').value = service.price;
+    document.getElementById('serviceCapacity').value = service.capacity || 1;
     document.getElementById('serviceActive').checked = service.active;
     
     document.getElementById('serviceModalTitle').innerHTML = '<i class="bi bi-pencil"></i> Editar Servicio';
@@ -343,6 +483,7 @@ async function saveService() {
         description: document.getElementById('serviceDescription').value.trim(),
         duration: parseInt(document.getElementById('serviceDuration').value),
         price: parseFloat(document.getElementById('servicePrice').value),
+        capacity: parseInt(document.getElementById('serviceCapacity').value),
         active: document.getElementById('serviceActive').checked
     };
     
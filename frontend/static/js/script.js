@@ -6,15 +6,40 @@
 let currentDate = new Date();
 let selectedSlot = null;
 let services = [];
+let waitlistMode = false;
 
-// Initialize on page load
+// Initialize on page load, from the data embedded in the page when present
 document.addEventListener('DOMContentLoaded', function() {
-    loadServices();
+    const initial = readBootstrapData();
+    
+    if (initial) {
+        services = initial.services;
+        populateServiceSelect();
+    } else {
+        loadServices();
+    }
+    
     updateDateDisplay();
-    loadAvailableSlots();
+    if (initial && initial.date === formatDate(currentDate)) {
+        displayTimeSlots(initial.slots);
+    } else {
+        loadAvailableSlots();
+    }
     setupEventListeners();
 });
 
+/**
+ * Data rendered into the page by the server (null if absent)
+ */
+function readBootstrapData() {
+    const element = document.getElementById('bootstrapData');
+    try {
+        return element ? JSON.parse(element.textContent) : null;
+    } catch (error) {
+        return null;
+    }
+}
+
 /**
  * Setup Event Listeners
  */
@@ -151,10 +176,15 @@ function displayTimeSlots(slots) {
         slotElement.innerHTML = `
             <i class="bi bi-clock"></i><br>
             ${slot.time}
+            ${slot.available && slot.service_id ? `<br><small>${slot.remaining} plazas</small>` : ''}
         `;
         
         if (slot.available) {
-            slotElement.addEventListener('click', () => selectTimeSlot(slot.time));
+            slotElement.addEventListener('click', () => selectTimeSlot(slot.time, slot.service_id));
+        } else {
+            // Occupied slots can be joined through the waitlist
+            slotElement.title = 'Unirse a la lista de espera';
+            slotElement.addEventListener('click', () => selectTimeSlot(slot.time, slot.service_id, true));
         }
         
         container.appendChild(slotElement);
@@ -164,8 +194,24 @@ function displayTimeSlots(slots) {
 /**
  * Select Time Slot
  */
-function selectTimeSlot(time) {
+function selectTimeSlot(time, sharedServiceId, waitlist = false) {
     selectedSlot = time;
+    waitlistMode = waitlist;
+    
+    document.getElementById('bookingModalTitle').innerHTML = waitlist
+        ? '<i class="bi bi-hourglass-split"></i> Lista de Espera'
+        : '<i class="bi bi-calendar-check"></i> Confirmar Cita';
+    document.getElementById('waitlistGroup').style.display = waitlist ? 'block' : 'none';
+    document.getElementById('recurrenceGroup').style.display = waitlist ? 'none' : 'block';
+    if (waitlist) {
+        document.getElementById('recurrenceSelect').value = 'none';
+        document.getElementById('recurrenceSelect').dispatchEvent(new Event('change'));
+    }
+    
+    // Places left in a group session can only be booked for that service
+    if (sharedServiceId) {
+        document.getElementById('serviceSelect').value = sharedServiceId;
+    }
     
     // Update UI
     document.querySelectorAll('.time-slot').forEach(slot => {
@@ -214,6 +260,11 @@ async function confirmBooking() {
         notes: document.getElementById('appointmentNotes').value.trim()
     };
     
+    if (waitlistMode) {
+        joinWaitlist(bookingData);
+        return;
+    }
+    
     // Disable button while processing
     const button = document.getElementById('confirmBooking');
     button.disabled = true;
@@ -255,6 +306,56 @@ async function confirmBooking() {
     }
 }
 
+/**
+ * Join the waitlist for the selected (occupied) slot
+ */
+async function joinWaitlist(bookingData) {
+    const service = services.find(s => s.id === bookingData.service_id);
+    const [hours, minutes] = bookingData.time.split(':').map(Number);
+    const end = hours * 60 + minutes + (service ? service.duration : 60);
+    const windowEnd = `${String(Math.min(Math.floor(end / 60), 23)).padStart(2, '0')}:${String(end >= 24 * 60 ? 59 : end % 60).padStart(2, '0')}`;
+    
+    const button = document.getElementById('confirmBooking');
+    button.disabled = true;
+    
+    try {
+        const response = await fetch('/api/waitlist', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                date: bookingData.date,
+                service_id: bookingData.service_id,
+                window_start: bookingData.time,
+                window_end: windowEnd,
+                client: bookingData.client,
+                phone: bookingData.phone,
+                auto_book: document.getElementById('waitlistAutoBook').checked
+            })
+        });
+        
+        const data = await response.json();
+        
+        if (data.success) {
+            bootstrap.Modal.getInstance(document.getElementById('bookingModal')).hide();
+            document.getElementById('bookingForm').reset();
+            
+            document.getElementById('successMessage').textContent = data.entry.auto_book
+                ? 'Estás en la lista de espera. Si el horario se libera, tu cita se reservará automáticamente.'
+                : 'Estás en la lista de espera. Te avisaremos si el horario se libera.';
+            new bootstrap.Modal(document.getElementById('successModal')).show();
+        } else {
+            showError(data.error || 'Error al unirse a la lista de espera');
+        }
+    } catch (error) {
+        console.error('Error joining waitlist:', error);
+        showError('Error al conectar con el servidor');
+    } finally {
+        button.disabled = false;
+    }
+}
+
 /**
  * Show Success Modal
  */